@@ -16,6 +16,15 @@
 #                                                    This function is dynamically imported and executed.
 #    'specific_parameters': - [SP] - Model-specific hyperparameters required for training.
 #                             These parameters vary between models (e.g., ARIMA orders, ETS seasonal periods, etc.).
+#    'warm_start': True, - Optional. Start the optimizer of every retrain from the parameters of the previous retrain
+#                          of the same currency and config instead of from scratch. Retrains are then fitted
+#                          sequentially (FIT_WORKERS is not used for this model).
+#    'drift_threshold': 0.02, - Optional. Retrain on error drift instead of every 'model_update_interval' hours: every
+#                               'drift_check_interval' hours (optional, defaults to 'forecast_frequency') the MAPE of the
+#                               model's forecast steps realized within the last 'drift_window' hours (optional, defaults
+#                               to DRIFT_WINDOW_HOURS) is checked, and the model retrains if it exceeds the threshold.
+#                               'model_update_interval' stays the maximum time between retrains. Retrains are then fitted
+#                               sequentially (FIT_WORKERS is not used for this model).
 # ---------------------------------------------------------
 MODEL_PARAMETERS = {
 #    'arima': {
@@ -54,5 +63,77 @@ MODEL_PARAMETERS = {
         'fit_func_name': 'models.model_fits.fit_theta_model',
         'specific_parameters': {},
         'model_alg_name': 'theta'
-    }
-}
\ No newline at end of file
+    },
+#   NumPy fast-path models (models/fast_models.py), same parameters as their statsmodels counterparts:
+#    'fast_ets': {
+#        'training_dataset_size': 480,
+#        'model_update_interval': 24,
+#        'forecast_dataset_size': 48,
+#        'forecast_frequency': 24,
+#        'forecast_hours': 96,
+#        'fit_func_name': 'models.fast_models.fit_fast_ets_model',
+#        'specific_parameters': {
+#            'trend': 'add',
+#            'seasonal': 'mul',
+#            'seasonal_periods': 24
+#        },
+#        'model_alg_name': 'fast_ets'
+#    },
+#    'fast_theta': {
+#        'training_dataset_size': 480,
+#        'model_update_interval': 24,
+#        'forecast_dataset_size': 48,
+#        'forecast_frequency': 24,
+#        'forecast_hours': 96,
+#        'fit_func_name': 'models.fast_models.fit_fast_theta_model',
+#        'specific_parameters': {'period': 24},
+#        'model_alg_name': 'fast_theta'
+#    },
+#    'snaive': {
+#        'training_dataset_size': 24,
+#        'model_update_interval': 24,
+#        'forecast_dataset_size': 24,
+#        'forecast_frequency': 24,
+#        'forecast_hours': 96,
+#        'fit_func_name': 'models.fast_models.fit_seasonal_naive_model',
+#        'specific_parameters': {'seasonal_periods': 24},
+#        'model_alg_name': 'snaive'
+#    },
+#    'drift': {
+#        'training_dataset_size': 480,
+#        'model_update_interval': 24,
+#        'forecast_dataset_size': 48,
+#        'forecast_frequency': 24,
+#        'forecast_hours': 96,
+#        'fit_func_name': 'models.fast_models.fit_drift_model',
+#        'specific_parameters': {},
+#        'model_alg_name': 'drift'
+#    },
+#   Closed-form AR / ridge on lags (models/model_fits.py); all retrain points of a backtest are fitted in one batch:
+#    'ridge_ar': {
+#        'training_dataset_size': 480,
+#        'model_update_interval': 1,
+#        'forecast_dataset_size': 48,
+#        'forecast_frequency': 1,
+#        'forecast_hours': 96,
+#        'fit_func_name': 'models.model_fits.fit_ridge_ar_model',
+#        'specific_parameters': {
+#            'lags': 24,
+#            'ridge_alpha': 0.0
+#        },
+#        'model_alg_name': 'ridge_ar'
+#    },
+}
+# ---------------------------------------------------------
+#   Hyperparameter sweep grid (see models/sweep.py). Every value list multiplies the configs of its model in
+#    MODEL_PARAMETERS. Keys of the top-level model parameters ('training_dataset_size', 'forecast_hours', ...)
+#    replace those, any other key goes into 'specific_parameters'. Every expanded config gets its own model
+#    name '<model>_<config hash>', so its forecasts are stored under a distinct 'model_name_ext'.
+# ---------------------------------------------------------
+SWEEP_PARAMETER_GRID = {
+#    'ets': {
+#        'seasonal_periods': [12, 24, 168],
+#        'trend': ['add', None],
+#        'training_dataset_size': [240, 480, 720],
+#    },
+}
@@ -5,6 +5,90 @@ FINISH_DATE = "2025-04-03T00:00:00" # last day and hour of historical data in na
 # ---------------------------------------------------------
 # Directory for check, save and load models. Mostly used in models_processing.py
 MODELS_DIRECTORY = r"C:\forecrypt_models"
+# Number of fitted models kept in memory per process (LRU). Forecasts are served from this cache,
+#  models are written to MODELS_DIRECTORY only at checkpoints (end of each backtest) or on eviction.
+MODEL_CACHE_SIZE = 32
+# Format of saved models: "slim" stores only parameters and final states (small, fast to load, memory-mappable),
+#  "full" pickles the whole statsmodels results object. Models without a slim representation are always saved full.
+#  MODEL_ARTIFACT_COMPRESS is the joblib compression level of slim artifacts (0 keeps them memory-mappable).
+MODEL_ARTIFACT_FORMAT = "slim"
+MODEL_ARTIFACT_COMPRESS = 0
+# ---------------------------------------------------------
+# Number of worker processes for backtests. Every (currency, model) pair is an independent task with its own
+#  Postgres connection. 1 keeps the serial in-process execution.
+#  FIT_WORKERS > 1 fits all retrain points of one backtest in parallel before its forecasts are made
+#  (useful with few currencies; the number of processes is up to BACKTEST_WORKERS * FIT_WORKERS).
+BACKTEST_WORKERS = 1
+FIT_WORKERS = 1
+# ---------------------------------------------------------
+# Wall-clock budget (seconds) of a single model fit. With a budget every fit runs in its own process that is
+#  terminated when the budget is spent; the retrain is then recorded as timed out and the previous model stays in use.
+#  Per model overridable with 'fit_time_budget'. None fits inline without a limit.
+FIT_TIME_BUDGET_SECONDS = None
+# ---------------------------------------------------------
+# Error-drift retraining (models/drift.py), used by models with 'drift_threshold' in their parameters:
+#  realized error of the current model is measured over the forecast steps of the last DRIFT_WINDOW_HOURS hours
+#  (per model overridable with 'drift_window').
+DRIFT_WINDOW_HOURS = 24
+# ---------------------------------------------------------
+# Successive halving of sweep configs (models/sweep.py, run_sweep with halving=True). All configs are backtested for
+#  the first SWEEP_HALVING_INITIAL_HOURS hours, then only the best SWEEP_HALVING_KEEP_FRACTION of them (by
+#  SWEEP_HALVING_METRIC of all their forecasts so far: 'mape', 'mae' or 'rmse') continue over a range
+#  1 / SWEEP_HALVING_KEEP_FRACTION times longer, and so on until FINISH_DATE.
+SWEEP_HALVING_INITIAL_HOURS = 336
+SWEEP_HALVING_KEEP_FRACTION = 0.33
+SWEEP_HALVING_METRIC = "mape"
+# ---------------------------------------------------------
+# Rolling-origin forecasting: before every forecast the model of the last retrain is advanced over the
+#  hours observed since then (parameters fixed, no refit), so forecasts start at the forecast time and not
+#  at the end of the training window. All forecasts between two retrains are computed in one batched pass.
+#  Models without a slim representation are forecast from their fit, one forecast at a time.
+PROPAGATE_MODEL_STATE = True
+# ---------------------------------------------------------
+# Forecast rows are buffered across forecast events and written in one bulk statement
+#  once this many rows are collected (and at the end of every backtest).
+FORECAST_BUFFER_ROWS = 50000
+# ---------------------------------------------------------
+# fetch_predict_upload_ts runs its stages concurrently: fetching, loading the history into Postgres, model backtests and
+#  writing the forecast rows. Every stage runs ahead of the next one by at most PIPELINE_QUEUE_SIZE items (currencies,
+#  or full forecast batches for the writer) and then blocks until the next stage catches up.
+PIPELINE_QUEUE_SIZE = 2
+# ---------------------------------------------------------
+# Resumable backtests. Every backtest records its progress (last completed event, last retrain and a copy of its
+#  current model) in the Postgres table backtest_checkpoints at most every BACKTEST_CHECKPOINT_SECONDS seconds and
+#  at its end, and a rerun with the same config and START_DATE continues after the recorded event instead of
+#  starting from hour zero. False neither writes nor reads checkpoints.
+BACKTEST_CHECKPOINTS = True
+BACKTEST_CHECKPOINT_SECONDS = 300
+# ---------------------------------------------------------
+# Live mode (main.py live): every hour only the newly closed hours are fetched, loaded and forecast. The daemon wakes up
+#  LIVE_DELAY_SECONDS after every full hour, so the API has closed the previous hour by then.
+LIVE_DELAY_SECONDS = 120
+# ---------------------------------------------------------
+# Distributed backtests (models/backtest_queue.py): with BACKTEST_QUEUE the full cycle enqueues its (currency, model group,
+#  time range) backtests as jobs in the Postgres table backtest_jobs and waits until `main.py worker` processes, on any
+#  machine with access to Postgres, have claimed and run them. Workers send a heartbeat every JOB_HEARTBEAT_SECONDS;
+#  a running job without heartbeat for JOB_STALE_SECONDS belonged to a dead worker and is claimed again, up to
+#  JOB_MAX_ATTEMPTS attempts. Idle workers and the waiting cycle poll the queue every JOB_POLL_SECONDS.
+BACKTEST_QUEUE = False
+JOB_HEARTBEAT_SECONDS = 30
+JOB_STALE_SECONDS = 180
+JOB_MAX_ATTEMPTS = 3
+JOB_POLL_SECONDS = 5
+# ---------------------------------------------------------
+# Result cache (models/result_cache.py): every fitted retrain window is stored under a hash of its training slice,
+#  the fit-relevant model parameters and the source of the fit function's module. Reruns over unchanged history load
+#  those fits instead of refitting; only windows whose inputs changed are fitted again. Retrain windows whose
+#  forecasts are stored are recorded in backtest_windows, and reruns skip the unchanged ones entirely.
+RESULT_CACHE_ENABLED = True
+RESULT_CACHE_DIRECTORY = r"C:\forecrypt_results"
+# ---------------------------------------------------------
+# Directory for the local append-only price history store (memory-mapped epoch/price column pair per symbol).
+#  Hours already present there are not requested from the API again. Mostly used in db/history_store.py
+HISTORY_STORE_DIRECTORY = r"C:\forecrypt_history"
+#  Hours the API was asked for but did not return are recorded there as confirmed empty and not requested again,
+#  once they are closed for this many hours (an hour the API publishes late is not given up on).
+HISTORY_EMPTY_SETTLE_HOURS = 24
 # ---------------------------------------------------------
 #   Postgres database configuration.
 #    It is empty, as ForecrypT using environmental variables with higher priority:
@@ -54,6 +138,14 @@ CH_DB_CONFIG = {
 # CryptoCompare API key. Not hidden, cause it is not nessesarry for free requests. Implemented for the case of future changes.
 API_KEY = "YOUR_API_KEY" 
 # ---------------------------------------------------------
+# CryptoCompare fetching. All symbols' histohour pages are requested concurrently through one keep-alive session.
+#  API_RATE_LIMIT is shared by all fetch threads (requests per second), keep it under your plan's histohour quota.
+#  429 and 5xx responses are retried FETCH_MAX_RETRIES times with exponential backoff starting at FETCH_BACKOFF_SECONDS.
+FETCH_WORKERS = 8
+API_RATE_LIMIT = 20
+FETCH_MAX_RETRIES = 5
+FETCH_BACKOFF_SECONDS = 1.0
+# ---------------------------------------------------------
 # 
 CORE_COLUMNS = {
     "id": ("UUID", "String"),
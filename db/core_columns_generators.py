@@ -1,7 +1,6 @@
 from collections import namedtuple
 from config.config_system import CORE_COLUMNS
 from config.config_metrics import EPSILON
-from uuid import uuid4
 import logging
 
 logger = logging.getLogger(__name__)
@@ -53,7 +52,9 @@ def gen_sql_pg_create_historical_table():
 def gen_sql_pg_create_historical_idx():
     gen_sql_string = (
         "CREATE INDEX IF NOT EXISTS idx_historical_data_timestamp_currency "
-        "ON historical_data (timestamp, currency);"
+        "ON historical_data (timestamp, currency);\n"
+        "CREATE INDEX IF NOT EXISTS idx_historical_data_uploaded_at "
+        "ON historical_data (uploaded_at);"
     )
     return gen_sql_string
 
@@ -99,7 +100,9 @@ def gen_sql_pg_create_forecast_idx():
         "CREATE INDEX IF NOT EXISTS idx_forecast_data_timestamp "
         "ON forecast_data (timestamp, currency);\n"
         "CREATE INDEX IF NOT EXISTS idx_forecast_data_timestamp_currency_model "
-        "ON forecast_data (timestamp, currency, model);"
+        "ON forecast_data (timestamp, currency, model);\n"
+        "CREATE INDEX IF NOT EXISTS idx_forecast_data_uploaded_at "
+        "ON forecast_data (uploaded_at);"
     )
     return gen_sql_string
 
@@ -153,21 +156,309 @@ def gen_sql_pg_create_mv():
     )
     return gen_sql_string
 
+def gen_sql_pg_create_delta_table():
+    # rows of backtest_data_mv changed since the last transfer (see gen_sql_pg_fill_delta)
+    gen_sql_string = (
+        "CREATE TABLE IF NOT EXISTS backtest_data_delta AS\n"
+        "SELECT * FROM backtest_data_mv\n"
+        "WITH NO DATA;"
+    )
+    return gen_sql_string
+
+def gen_sql_pg_fill_delta():
+    # the rows of backtest_data_mv with forecasts or history uploaded after %(since)s, in three index-friendly parts:
+    # new forecasts, older forecasts of hours with new history and the new history itself
+    forecast_cols = [
+        "f.id",
+        "f.timestamp",
+        "f.currency",
+        "f.forecast_step",
+        "f.forecast_value",
+        "h.historical_value",
+        "f.model",
+        "f.model_name_ext",
+        "f.external_model_params",
+        "f.inner_model_params",
+        "h.uploaded_at",
+        "f.uploaded_at",
+        "f.zero_step_ts",
+        "f.config_start",
+        "f.config_end"
+    ]
+    historical_cols = [
+        "h.id",
+        "h.timestamp",
+        "h.currency",
+        "((EXTRACT(EPOCH FROM (h.timestamp - zero.zero_ts)) / 3600)::INT)",
+        "h.historical_value",
+        "h.historical_value",
+        "'historical'",
+        "'historical'",
+        "'historical'",
+        "'historical'",
+        "h.uploaded_at",
+        "h.uploaded_at",
+        "zero.zero_ts",
+        "NULL::TIMESTAMP",
+        "NULL::TIMESTAMP"
+    ]
+    forecast_clause = ",\n    ".join(forecast_cols)
+    historical_clause = ",\n    ".join(historical_cols)
+
+    gen_sql_string = (
+        "TRUNCATE backtest_data_delta;\n"
+        "INSERT INTO backtest_data_delta\n"
+        f"SELECT\n    {forecast_clause}\n"
+        "FROM forecast_data f\n"
+        "LEFT JOIN historical_data h\n"
+        "  ON f.timestamp = h.timestamp\n"
+        " AND f.currency  = h.currency\n"
+        "WHERE f.uploaded_at > %(since)s\n"
+        "\n"
+        "UNION ALL\n"
+        f"SELECT\n    {forecast_clause}\n"
+        "FROM historical_data h\n"
+        "JOIN forecast_data f\n"
+        "  ON f.timestamp = h.timestamp\n"
+        " AND f.currency  = h.currency\n"
+        "WHERE h.uploaded_at > %(since)s\n"
+        "  AND f.uploaded_at <= %(since)s\n"
+        "\n"
+        "UNION ALL\n"
+        f"SELECT\n    {historical_clause}\n"
+        "FROM historical_data h,\n"
+        "     (SELECT MIN(timestamp) AS zero_ts FROM historical_data) AS zero\n"
+        "WHERE h.uploaded_at > %(since)s;"
+    )
+    return gen_sql_string
+
+
+def gen_sql_pg_create_checkpoint_table():
+    # one row per (currency, model): progress of its backtest and the model to resume with
+    core_columns = name_core_columns_tuple()
+
+    lines = [
+        f"currency {core_columns['currency'].pg_type} NOT NULL",
+        f"model {core_columns['model'].pg_type} NOT NULL",
+        "config_signature VARCHAR(16) NOT NULL",
+        f"config_start {core_columns['config_start'].pg_type} NOT NULL",
+        "last_event_ts TIMESTAMP NOT NULL",
+        "last_retrain_ts TIMESTAMP",
+        "model_artifact TEXT",
+        f"uploaded_at {core_columns['uploaded_at'].pg_type}",
+        "PRIMARY KEY (currency, model)"
+    ]
+
+    gen_sql_string = (
+        "CREATE TABLE IF NOT EXISTS backtest_checkpoints (\n    "
+        + ",\n    ".join(lines)
+        + "\n);"
+    )
+
+    return gen_sql_string
+
+PG_CHECKPOINT_COLS = [
+    "currency",
+    "model",
+    "config_signature",
+    "config_start",
+    "last_event_ts",
+    "last_retrain_ts",
+    "model_artifact",
+    "uploaded_at"
+]
+
+def gen_sql_pg_upsert_checkpoint():
+    gen_sql_string = (
+        f"INSERT INTO backtest_checkpoints ({', '.join(PG_CHECKPOINT_COLS)})\n"
+        f"VALUES ({', '.join(['%s'] * len(PG_CHECKPOINT_COLS))})\n"
+        "ON CONFLICT (currency, model)\n"
+        "DO UPDATE SET\n"
+        + ",\n".join(f"    {col} = EXCLUDED.{col}" for col in PG_CHECKPOINT_COLS[2:])
+        + ";"
+    )
+    return gen_sql_string
+
+def gen_sql_pg_create_window_table():
+    # one row per (currency, model, retrain window): content key of the window whose forecasts are stored
+    core_columns = name_core_columns_tuple()
+
+    lines = [
+        f"currency {core_columns['currency'].pg_type} NOT NULL",
+        f"model {core_columns['model'].pg_type} NOT NULL",
+        "window_start TIMESTAMP NOT NULL",
+        "window_key VARCHAR(40) NOT NULL",
+        f"uploaded_at {core_columns['uploaded_at'].pg_type}",
+        "PRIMARY KEY (currency, model, window_start)"
+    ]
+
+    gen_sql_string = (
+        "CREATE TABLE IF NOT EXISTS backtest_windows (\n    "
+        + ",\n    ".join(lines)
+        + "\n);"
+    )
+
+    return gen_sql_string
+
+PG_WINDOW_COLS = [
+    "currency",
+    "model",
+    "window_start",
+    "window_key",
+    "uploaded_at"
+]
+
+def gen_sql_pg_upsert_window():
+    gen_sql_string = (
+        f"INSERT INTO backtest_windows ({', '.join(PG_WINDOW_COLS)})\n"
+        f"VALUES ({', '.join(['%s'] * len(PG_WINDOW_COLS))})\n"
+        "ON CONFLICT (currency, model, window_start)\n"
+        "DO UPDATE SET\n"
+        + ",\n".join(f"    {col} = EXCLUDED.{col}" for col in PG_WINDOW_COLS[3:])
+        + ";"
+    )
+    return gen_sql_string
+
+def gen_sql_pg_create_job_table():
+    # one row per queued backtest: (currency, model group, time range) and its claim state
+    core_columns = name_core_columns_tuple()
+
+    lines = [
+        "job_id BIGSERIAL PRIMARY KEY",
+        "batch_id VARCHAR(32) NOT NULL",
+        f"currency {core_columns['currency'].pg_type} NOT NULL",
+        f"model {core_columns['model'].pg_type} NOT NULL",
+        "params JSONB NOT NULL",
+        "dependents JSONB NOT NULL",
+        "extended_start_ts TIMESTAMP NOT NULL",
+        "start_ts TIMESTAMP NOT NULL",
+        "finish_ts TIMESTAMP NOT NULL",
+        "resume_after_ts TIMESTAMP",
+        "status VARCHAR(16) NOT NULL DEFAULT 'queued'",
+        "attempts INTEGER NOT NULL DEFAULT 0",
+        "worker VARCHAR(200)",
+        "heartbeat_at TIMESTAMP",
+        "error TEXT",
+        "enqueued_at TIMESTAMP",
+        "finished_at TIMESTAMP"
+    ]
+
+    gen_sql_string = (
+        "CREATE TABLE IF NOT EXISTS backtest_jobs (\n    "
+        + ",\n    ".join(lines)
+        + "\n);"
+    )
+
+    return gen_sql_string
+
+def gen_sql_pg_create_job_idx():
+    gen_sql_string = (
+        "CREATE INDEX IF NOT EXISTS idx_backtest_jobs_status "
+        "ON backtest_jobs (status, job_id);"
+    )
+    return gen_sql_string
 
-def gen_records_pg_train_and_historical(row, crypto_id, uploaded_at):
-    return (
-        str(uuid4()),
-        row["date"],
-        crypto_id,
-        row["price"],
-        row["data_label"],
-        uploaded_at
+PG_JOB_COLS = [
+    "batch_id",
+    "currency",
+    "model",
+    "params",
+    "dependents",
+    "extended_start_ts",
+    "start_ts",
+    "finish_ts",
+    "resume_after_ts"
+]
+
+# database clock, so heartbeats of workers on different machines compare consistently
+PG_JOB_NOW = "(now() AT TIME ZONE 'UTC')"
+
+def gen_sql_pg_insert_job():
+    gen_sql_string = (
+        f"INSERT INTO backtest_jobs ({', '.join(PG_JOB_COLS)}, enqueued_at)\n"
+        f"VALUES ({', '.join(['%s'] * len(PG_JOB_COLS))}, {PG_JOB_NOW})\n"
+        "RETURNING job_id;"
+    )
+    return gen_sql_string
+
+def gen_sql_pg_reap_jobs():
+    # running jobs without heartbeat whose attempts are used up fail for good
+    gen_sql_string = (
+        "UPDATE backtest_jobs\n"
+        f"SET status = 'failed', error = 'worker stopped sending heartbeats', finished_at = {PG_JOB_NOW}\n"
+        "WHERE status = 'running'\n"
+        f"  AND heartbeat_at < {PG_JOB_NOW} - %(stale_seconds)s * INTERVAL '1 second'\n"
+        "  AND attempts >= %(max_attempts)s;"
+    )
+    return gen_sql_string
+
+def gen_sql_pg_claim_job():
+    # the oldest queued job, or a running one whose worker stopped sending heartbeats;
+    # SKIP LOCKED lets concurrent workers pass over rows another worker is claiming
+    gen_sql_string = (
+        "UPDATE backtest_jobs\n"
+        f"SET status = 'running', worker = %(worker)s, attempts = attempts + 1, heartbeat_at = {PG_JOB_NOW}\n"
+        "WHERE job_id = (\n"
+        "    SELECT job_id FROM backtest_jobs\n"
+        "    WHERE status = 'queued'\n"
+        "       OR (status = 'running'\n"
+        f"           AND heartbeat_at < {PG_JOB_NOW} - %(stale_seconds)s * INTERVAL '1 second'\n"
+        "           AND attempts < %(max_attempts)s)\n"
+        "    ORDER BY job_id\n"
+        "    LIMIT 1\n"
+        "    FOR UPDATE SKIP LOCKED\n"
+        ")\n"
+        f"RETURNING job_id, attempts, {', '.join(PG_JOB_COLS)};"
+    )
+    return gen_sql_string
+
+# columns streamed through COPY into the staging tables; ids are generated by Postgres on merge
+PG_HISTORICAL_COPY_COLS = [
+    "timestamp",
+    "currency",
+    "historical_value",
+    "data_label",
+    "uploaded_at"
+]
+
+PG_FORECAST_COPY_COLS = [
+    "timestamp",
+    "currency",
+    "forecast_step",
+    "forecast_value",
+    "model",
+    "model_name_ext",
+    "external_model_params",
+    "inner_model_params",
+    "zero_step_ts",
+    "config_start",
+    "config_end",
+    "uploaded_at"
+]
+
+def gen_sql_pg_create_staging_table(table_name):
+    # temporary tables are session-private and not WAL-logged, so parallel workers never share a staging table
+    gen_sql_string = (
+        f"CREATE TEMP TABLE IF NOT EXISTS {table_name}_staging\n"
+        f"(LIKE {table_name} INCLUDING DEFAULTS);\n"
+        f"TRUNCATE {table_name}_staging;"
+    )
+    return gen_sql_string
+
+def gen_sql_pg_copy_to_staging(table_name, cols):
+    gen_sql_string = (
+        f"COPY {table_name}_staging ({', '.join(cols)})\n"
+        "FROM STDIN WITH (FORMAT csv)"
     )
+    return gen_sql_string
+
+def gen_sql_pg_merge_train_and_historical():
+    select_clause = ", ".join(PG_HISTORICAL_COPY_COLS)
 
-def gen_sql_pg_load_train_and_historical():
     gen_sql_string = (
-        "INSERT INTO historical_data (id, timestamp, currency, historical_value, data_label, uploaded_at)\n"
-        "VALUES %s\n"
+        f"INSERT INTO historical_data (id, {select_clause})\n"
+        f"SELECT gen_random_uuid(), {select_clause}\n"
+        "FROM historical_data_staging\n"
         "ON CONFLICT (timestamp, currency, data_label)\n"
         "DO UPDATE SET\n"
         "    historical_value = EXCLUDED.historical_value,\n"
@@ -176,27 +467,18 @@ def gen_sql_pg_load_train_and_historical():
     )
     return gen_sql_string
 
-def gen_records_pg_forecast(row, crypto_id, model_name, dynamic_model_name, external_model_params, inner_model_params, zero_step_ts, config_start, config_end, uploaded_at):
-    return (
-        str(uuid4()),
-        row["date"],
-        crypto_id,
-        row["step"],
-        row["price"],
-        model_name,
-        dynamic_model_name,
-        external_model_params,
-        inner_model_params,
-        zero_step_ts,
-        config_start,
-        config_end,
-        uploaded_at
-    )
+def gen_sql_pg_merge_forecast():
+    select_clause = ", ".join(PG_FORECAST_COPY_COLS)
 
-def gen_sql_pg_load_forecast():
+    # DISTINCT ON keeps one row per conflict key, a single INSERT cannot update the same row twice
     gen_sql_string = (
-        "INSERT INTO forecast_data (id, timestamp, currency, forecast_step, forecast_value, model, model_name_ext, external_model_params, inner_model_params, zero_step_ts, config_start, config_end, uploaded_at)\n"
-        "VALUES %s\n"
+        f"INSERT INTO forecast_data (id, {select_clause})\n"
+        f"SELECT gen_random_uuid(), {select_clause}\n"
+        "FROM (\n"
+        f"    SELECT DISTINCT ON (timestamp, currency, model, forecast_step) {select_clause}\n"
+        "    FROM forecast_data_staging\n"
+        "    ORDER BY timestamp, currency, model, forecast_step, uploaded_at DESC\n"
+        ") AS staged\n"
         "ON CONFLICT (timestamp, currency, model, forecast_step)\n"
         "DO UPDATE SET\n"
         "    forecast_value = EXCLUDED.forecast_value,\n"
@@ -206,7 +488,8 @@ def gen_sql_pg_load_forecast():
     )
     return gen_sql_string
 
-def gen_sql_ch_create_external_pg_table(pg_container_ip, pg_database, pg_user, pg_password, ch_database_name, ch_table_name):
+def gen_sql_ch_create_external_pg_table(pg_container_ip, pg_database, pg_user, pg_password, ch_database_name, ch_table_name,
+                                        pg_table="backtest_data_mv"):
     core_columns = name_core_columns_tuple()
 
     cols = [
@@ -235,7 +518,7 @@ def gen_sql_ch_create_external_pg_table(pg_container_ip, pg_database, pg_user, p
     gen_sql_string = (
         f"CREATE TABLE {ch_database_name}.{ch_table_name} (\n    "
         + ",\n    ".join(lines)
-        + f"\n) ENGINE = PostgreSQL('{pg_container_ip}:5432', '{pg_database}', 'backtest_data_mv', '{pg_user}', '{pg_password}');"
+        + f"\n) ENGINE = PostgreSQL('{pg_container_ip}:5432', '{pg_database}', '{pg_table}', '{pg_user}', '{pg_password}');"
     )
 
     return gen_sql_string
@@ -275,7 +558,7 @@ def gen_sql_ch_create_forecast_data_table(ch_database_name):
 
     return gen_sql_string
 
-def gen_sql_ch_insert_from_external(ch_database):
+def gen_sql_ch_insert_from_external(ch_database, source_table="external_pg_forecast_data"):
     cols = [
         "id",
         "timestamp",
@@ -298,11 +581,16 @@ def gen_sql_ch_insert_from_external(ch_database):
         f"INSERT INTO {ch_database}.forecast_data\n"
         "SELECT\n"
         f"    {select_clause}\n"
-        f"FROM {ch_database}.external_pg_forecast_data;"
+        f"FROM {ch_database}.{source_table};"
     )
 
     return gen_sql_string
 
+def gen_sql_ch_select_transfer_watermark(ch_database):
+    # every transferred history row carries its upload time as f_uploaded_at too
+    gen_sql_string = f"SELECT maxOrNull(f_uploaded_at) FROM {ch_database}.forecast_data;"
+    return gen_sql_string
+
 def gen_sql_ch_create_pointwise_metrics_table(ch_database_name: str) -> str:
 
     core_columns = name_core_columns_tuple()
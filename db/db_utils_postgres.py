@@ -1,15 +1,17 @@
+import io
+import json
 import psycopg2
 import pandas as pd
 import logging
 import os
+import queue
 import subprocess
+import threading
 import time
-from uuid import uuid4
 from datetime import datetime, timezone, timedelta
-from psycopg2.extras import execute_values
 from dotenv import load_dotenv
 from typing import Any
-from config.config_system import PG_DB_CONFIG
+from config.config_system import PG_DB_CONFIG, FORECAST_BUFFER_ROWS, PIPELINE_QUEUE_SIZE
 
 from .core_columns_generators import (
     gen_sql_pg_create_historical_table,
@@ -17,10 +19,27 @@ from .core_columns_generators import (
     gen_sql_pg_create_forecast_table, 
     gen_sql_pg_create_forecast_idx,
     gen_sql_pg_create_mv, 
-    gen_records_pg_train_and_historical,
-    gen_sql_pg_load_train_and_historical, 
-    gen_records_pg_forecast,
-    gen_sql_pg_load_forecast,
+    gen_sql_pg_create_delta_table,
+    gen_sql_pg_fill_delta,
+    PG_HISTORICAL_COPY_COLS,
+    PG_FORECAST_COPY_COLS,
+    gen_sql_pg_create_staging_table,
+    gen_sql_pg_copy_to_staging,
+    gen_sql_pg_merge_train_and_historical,
+    gen_sql_pg_merge_forecast,
+    gen_sql_pg_create_checkpoint_table,
+    gen_sql_pg_upsert_checkpoint,
+    PG_CHECKPOINT_COLS,
+    gen_sql_pg_create_window_table,
+    gen_sql_pg_upsert_window,
+    PG_WINDOW_COLS,
+    gen_sql_pg_create_job_table,
+    gen_sql_pg_create_job_idx,
+    gen_sql_pg_insert_job,
+    gen_sql_pg_reap_jobs,
+    gen_sql_pg_claim_job,
+    PG_JOB_COLS,
+    PG_JOB_NOW,
 )
 load_dotenv()
 
@@ -324,7 +343,8 @@ def create_database(config: dict):
 
 def create_tables(conn):
     """
-    Create tables historical_data and forecast_data, if there are none in database
+    Create tables historical_data, forecast_data, backtest_checkpoints, backtest_windows and backtest_jobs,
+    if there are none in database
     """
     with conn.cursor() as cursor:
         # historical_data table
@@ -340,6 +360,21 @@ def create_tables(conn):
 
         sql_pg_create_forecast_idx = gen_sql_pg_create_forecast_idx()
         cursor.execute(sql_pg_create_forecast_idx)
+
+        # backtest_checkpoints table
+        sql_pg_create_checkpoint = gen_sql_pg_create_checkpoint_table()
+        cursor.execute(sql_pg_create_checkpoint)
+
+        # backtest_windows table
+        sql_pg_create_window = gen_sql_pg_create_window_table()
+        cursor.execute(sql_pg_create_window)
+
+        # backtest_jobs table
+        sql_pg_create_job = gen_sql_pg_create_job_table()
+        cursor.execute(sql_pg_create_job)
+
+        sql_pg_create_job_idx = gen_sql_pg_create_job_idx()
+        cursor.execute(sql_pg_create_job_idx)
         
         conn.commit()
 
@@ -361,6 +396,46 @@ def create_materialized_view(conn):
         conn.rollback()
         logger.error(f"Failed to create materialized view: {e}")
 
+def create_delta_table(conn):
+    """
+    Create the table backtest_data_delta, holding the rows of backtest_data_mv changed since the last
+    transfer to ClickHouse (see refresh_backtest_delta).
+
+    :param conn: Active connection to PostgreSQL.
+    """
+    sql_pg_create_delta = gen_sql_pg_create_delta_table()
+
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(sql_pg_create_delta)
+            conn.commit()
+            logger.info("Table 'backtest_data_delta' created successfully.")
+    except Exception as e:
+        conn.rollback()
+        logger.error(f"Failed to create delta table: {e}")
+
+def refresh_backtest_delta(conn, since) -> bool:
+    """
+    Replace the contents of backtest_data_delta with the rows of backtest_data_mv whose forecast or
+    history was uploaded after `since`, without refreshing the whole materialized view. Used by live
+    cycles to transfer only what changed since the previous transfer.
+
+    :param conn: Active connection to PostgreSQL.
+    :param since: Upload time of the last transferred row.
+    :return: True if refresh succeeded, False otherwise.
+    """
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(gen_sql_pg_fill_delta(), {"since": since})
+            rows = cursor.rowcount
+            conn.commit()
+            logger.info(f"Table 'backtest_data_delta' refreshed with {rows} rows changed after {since}.")
+            return True
+    except Exception as e:
+        conn.rollback()
+        logger.error(f"Failed to refresh delta table: {e}")
+        return False
+
 def refresh_materialized_view(conn) -> bool:
     """
     Refresh the materialized view backtest_data_mv to include only new data.
@@ -393,9 +468,13 @@ def delete_mv_and_tables(conn) -> bool:
         bool: True if the view and tables were dropped successfully, False otherwise.
     """
     queries = [
+        "DROP TABLE IF EXISTS backtest_data_delta;",
         "DROP MATERIALIZED VIEW IF EXISTS backtest_data_mv;",
         "DROP TABLE IF EXISTS historical_data CASCADE;",
-        "DROP TABLE IF EXISTS forecast_data CASCADE;"
+        "DROP TABLE IF EXISTS forecast_data CASCADE;",
+        "DROP TABLE IF EXISTS backtest_checkpoints CASCADE;",
+        "DROP TABLE IF EXISTS backtest_windows CASCADE;",
+        "DROP TABLE IF EXISTS backtest_jobs CASCADE;"
     ]
 
     try:
@@ -422,6 +501,8 @@ def init_postgres_and_create_tables(pg_config: dict[str, str], postgres_client):
     create_tables(postgres_client)
     # create nodata materialized view
     create_materialized_view(postgres_client)
+    # table of the rows changed since the last transfer, shaped like the view
+    create_delta_table(postgres_client)
     
     return postgres_client
 # ---------------------------------------------------------
@@ -506,7 +587,98 @@ def check_consistency(crypto_id: str, start_date: str) -> bool:
 
             return True
 
-def load_to_db_train_and_historical(extended_df, crypto_id, conn, max_train_dataset_hours):
+def bulk_upsert(conn, table_name, frame, cols, merge_sql):
+    """
+    Upsert a DataFrame into a table through COPY.
+
+    The frame is streamed as CSV into a temporary staging table of the same structure
+    and merged into the target with a single INSERT ... ON CONFLICT statement.
+
+    :param conn: active connection to the PostgreSQL database.
+    :param table_name: target table (e.g., 'forecast_data').
+    :param frame: DataFrame with columns `cols`.
+    :param cols: columns to stream, in staging table order.
+    :param merge_sql: INSERT ... SELECT FROM {table_name}_staging ON CONFLICT statement.
+    :return: number of streamed rows.
+    """
+    buffer = io.StringIO()
+    frame[cols].to_csv(buffer, index=False, header=False, float_format="%.8f", date_format="%Y-%m-%d %H:%M:%S.%f")
+    buffer.seek(0)
+
+    with conn.cursor() as cursor:
+        cursor.execute(gen_sql_pg_create_staging_table(table_name))
+        cursor.copy_expert(gen_sql_pg_copy_to_staging(table_name, cols), buffer)
+        cursor.execute(merge_sql)
+    conn.commit()
+
+    return len(frame)
+
+def get_history_watermark(conn, crypto_id):
+    """
+    Latest hour of a cryptocurrency stored in `historical_data`.
+
+    :return: naive datetime, or None if there is no history yet.
+    """
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT MAX(timestamp) FROM historical_data WHERE currency = %s;", (crypto_id,))
+        watermark = cursor.fetchone()[0]
+    conn.commit()
+    return watermark
+
+def get_forecast_watermarks(conn, crypto_id, model_names) -> dict:
+    """
+    Latest forecast origin (`zero_step_ts`) of some models of one cryptocurrency in `forecast_data`.
+
+    :return: dict model -> naive datetime; models without forecasts are missing.
+    """
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT model, MAX(zero_step_ts) FROM forecast_data "
+            "WHERE currency = %s AND model = ANY(%s) GROUP BY model;",
+            (crypto_id, list(model_names)),
+        )
+        watermarks = dict(cursor.fetchall())
+    conn.commit()
+    return watermarks
+
+def load_forecast_steps(conn, crypto_id, model_names, first_origin, last_origin):
+    """
+    Read stored forecasts of some models of one cryptocurrency back from `forecast_data`,
+    for the forecast origins (`zero_step_ts`) between first_origin and last_origin (inclusive).
+
+    :return: DataFrame with columns ['model', 'zero_step_ts', 'timestamp', 'forecast_step', 'forecast_value'].
+    """
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT model, zero_step_ts, timestamp, forecast_step, forecast_value::float8 FROM forecast_data "
+            "WHERE currency = %s AND model = ANY(%s) AND zero_step_ts BETWEEN %s AND %s "
+            "ORDER BY model, zero_step_ts, forecast_step;",
+            (crypto_id, list(model_names), first_origin, last_origin),
+        )
+        rows = cursor.fetchall()
+    conn.commit()
+    return pd.DataFrame(rows, columns=["model", "zero_step_ts", "timestamp", "forecast_step", "forecast_value"])
+
+# scale of historical_value (DECIMAL(18, 8)): prices are modeled with exactly the precision they are stored with
+HISTORICAL_VALUE_DECIMALS = 8
+
+def load_history_from_db(conn, crypto_id, start_date, end_date):
+    """
+    Read the stored hours of a cryptocurrency back from `historical_data` (training and historical rows).
+
+    :return: DataFrame with columns ['date', 'price'] sorted by date; empty if nothing is stored in the range.
+    """
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT DISTINCT ON (timestamp) timestamp, historical_value::float8 FROM historical_data "
+            "WHERE currency = %s AND timestamp BETWEEN %s AND %s ORDER BY timestamp;",
+            (crypto_id, start_date, end_date),
+        )
+        rows = cursor.fetchall()
+    conn.commit()
+    return pd.DataFrame(rows, columns=["date", "price"])
+
+def load_to_db_train_and_historical(extended_df, crypto_id, conn, max_train_dataset_hours, after=None):
     """
     save both training and historical data into the database table `historical_data`.
 
@@ -517,63 +689,49 @@ def load_to_db_train_and_historical(extended_df, crypto_id, conn, max_train_data
     :param crypto_id: the cryptocurrency identifier (e.g., 'BTC', 'ETH').
     :param conn: active connection to the PostgreSQL database.
     :param max_train_dataset_hours: number of hours to be marked as 'training'.
+    :param after: optional watermark (see get_history_watermark); only later rows are loaded.
     """
     if extended_df.empty:
         logger.critical(f"No data to load for {crypto_id}.")
         return
 
-    extended_df['price'] = extended_df['price'].round(8)
+    extended_df['price'] = extended_df['price'].round(HISTORICAL_VALUE_DECIMALS)
 
     # split the data into training and historical based on max_train_dataset_hours
-    train_df = extended_df.iloc[:max_train_dataset_hours + 1].copy()  # N-hour inclusion by +1
-    train_df['data_label'] = 'training'
-
-
-    historical_df = extended_df.iloc[max_train_dataset_hours + 1:].copy()  # N-hour exclusion
-    historical_df['data_label'] = 'historical'
+    data_label = pd.Series('historical', index=extended_df.index)
+    data_label.iloc[:max_train_dataset_hours + 1] = 'training'  # N-hour inclusion by +1
 
-    logger.info(f"Training data range: {train_df['date'].min()} to {train_df['date'].max()}")
-    logger.info(f"Historical data range: {historical_df['date'].min()} to {historical_df['date'].max()}")
+    is_training = data_label == 'training'
+    logger.info(f"Training data range: {extended_df['date'][is_training].min()} to {extended_df['date'][is_training].max()}")
+    logger.info(f"Historical data range: {extended_df['date'][~is_training].min()} to {extended_df['date'][~is_training].max()}")
 
-    # concatenate training and historical data
-    combined_df = pd.concat([train_df, historical_df])
+    uploaded_at = datetime.now(timezone.utc).replace(tzinfo=None)
 
-    uploaded_at = datetime.now(timezone.utc)
-
-    records_pg_train_and_historical = [gen_records_pg_train_and_historical(row, crypto_id, uploaded_at) for _, row in combined_df.iterrows()]
-
-    sql_pg_load_train_and_historical = gen_sql_pg_load_train_and_historical()
+    frame = pd.DataFrame({
+        "timestamp": extended_df['date'],
+        "currency": crypto_id,
+        "historical_value": extended_df['price'],
+        "data_label": data_label,
+        "uploaded_at": uploaded_at,
+    })
+    if after is not None:
+        frame = frame[frame["timestamp"] > pd.Timestamp(after)]
+        if frame.empty:
+            logger.info(f"Historical data for {crypto_id} is up to date ({after}).")
+            return
 
     try:
-        with conn.cursor() as cursor:
-            execute_values(cursor, sql_pg_load_train_and_historical, records_pg_train_and_historical)
-            conn.commit()
-            logger.info(f"Training and historical data for {crypto_id} successfully loaded.")
+        bulk_upsert(conn, "historical_data", frame, PG_HISTORICAL_COPY_COLS, gen_sql_pg_merge_train_and_historical())
+        logger.info(f"Training and historical data for {crypto_id} successfully loaded.")
     except Exception as e:
         conn.rollback()
         logger.critical(f"Failed to load data for {crypto_id}. Error: {e}")
 
-def load_to_db_forecast(dataframe, crypto_id, model_name, params, conn, zero_step_ts, config_start, config_end):
+def get_dynamic_model_name(model_name, params):
     """
-    Save forecast data into the database table `forecast_data`.
-
-    The model name is dynamically generated from key parameters to avoid conflicts.
-
-    :param dataframe: Forecast data as pandas DataFrame with columns ['date', 'price'].
-    :param crypto_id: The cryptocurrency identifier (e.g., 'BTC', 'ETH').
-    :param model_name: The base name of the model (e.g., 'arima', 'ets').
-    :param params: Dictionary containing model parameters, including 'training_dataset_size',
-                   'model_update_interval', 'forecast_dataset_size', 'forecast_frequency',
-                   and 'forecast_hours'.
-    :param conn: Active connection to the PostgreSQL database.
-    :param created_at: Timestamp representing the starting point of the forecast.
+    Model name extended with key parameters, used as `model_name_ext` to avoid conflicts.
     """
-    if dataframe.empty:
-        logger.critical(f"No forecast data to load for {crypto_id} - {model_name}.")
-        return
-
-    # Generate dynamic model name
-    dynamic_model_name = (
+    return (
         f"{model_name}_"
         f"TD{params['training_dataset_size']}_"
         f"MU{params['model_update_interval']}_"
@@ -582,6 +740,15 @@ def load_to_db_forecast(dataframe, crypto_id, model_name, params, conn, zero_ste
         f"FH{params['forecast_hours']}"
     )
 
+def build_forecast_frame(dataframe, crypto_id, model_name, params, zero_step_ts, config_start, config_end, uploaded_at=None):
+    """
+    Build `forecast_data` rows for one forecast, column-wise.
+
+    :param dataframe: Forecast data as pandas DataFrame with columns ['date', 'price'] (zero step first).
+    :return: DataFrame with PG_FORECAST_COPY_COLS columns.
+    """
+    dynamic_model_name = get_dynamic_model_name(model_name, params)
+
     external_model_params = (
     f"[TD={params['training_dataset_size']}]_"
     f"[MU={params['model_update_interval']}]_"
@@ -594,25 +761,361 @@ def load_to_db_forecast(dataframe, crypto_id, model_name, params, conn, zero_ste
 
     inner_model_params = "_".join(f"[{k}={v}]" for k, v in specific_params.items())
 
+    uploaded_at = uploaded_at or datetime.now(timezone.utc).replace(tzinfo=None)
+
     # Round price to 8 decimal places and create forecast steps
-    dataframe['price'] = dataframe['price'].round(8)
-    dataframe['step'] = range(0, len(dataframe))
+    return pd.DataFrame({
+        "timestamp": dataframe['date'].to_numpy(),
+        "currency": crypto_id,
+        "forecast_step": range(0, len(dataframe)),
+        "forecast_value": dataframe['price'].round(8).to_numpy(),
+        "model": model_name,
+        "model_name_ext": dynamic_model_name,
+        "external_model_params": external_model_params,
+        "inner_model_params": inner_model_params,
+        "zero_step_ts": zero_step_ts,
+        "config_start": config_start,
+        "config_end": config_end,
+        "uploaded_at": uploaded_at,
+    })
+
+def load_forecast_frame(frame, conn):
+    """
+    Upsert prepared forecast rows (see build_forecast_frame) into `forecast_data` in one bulk statement.
 
-    uploaded_at = datetime.now(timezone.utc)
+    :return: number of loaded rows.
+    """
+    return bulk_upsert(conn, "forecast_data", frame, PG_FORECAST_COPY_COLS, gen_sql_pg_merge_forecast())
 
-    records_pg_forecast = [
-    gen_records_pg_forecast(row, crypto_id, model_name, dynamic_model_name, external_model_params, inner_model_params, zero_step_ts, config_start, config_end, uploaded_at)
-    for _, row in dataframe.iterrows()
-    ]
+def load_to_db_forecast(dataframe, crypto_id, model_name, params, conn, zero_step_ts, config_start, config_end):
+    """
+    Save forecast data into the database table `forecast_data`.
 
-    sql_pg_load_forecast = gen_sql_pg_load_forecast()
+    The model name is dynamically generated from key parameters to avoid conflicts.
+
+    :param dataframe: Forecast data as pandas DataFrame with columns ['date', 'price'].
+    :param crypto_id: The cryptocurrency identifier (e.g., 'BTC', 'ETH').
+    :param model_name: The base name of the model (e.g., 'arima', 'ets').
+    :param params: Dictionary containing model parameters, including 'training_dataset_size',
+                   'model_update_interval', 'forecast_dataset_size', 'forecast_frequency',
+                   and 'forecast_hours'.
+    :param conn: Active connection to the PostgreSQL database.
+    :param zero_step_ts: Timestamp representing the starting point of the forecast.
+    """
+    if dataframe.empty:
+        logger.critical(f"No forecast data to load for {crypto_id} - {model_name}.")
+        return
+
+    frame = build_forecast_frame(dataframe, crypto_id, model_name, params, zero_step_ts, config_start, config_end)
+    dynamic_model_name = frame['model_name_ext'].iat[0]
 
     try:
-        with conn.cursor() as cursor:
-            execute_values(cursor, sql_pg_load_forecast, records_pg_forecast)
-            conn.commit()
-            logger.debug(f"Forecast data for {crypto_id} - {dynamic_model_name} successfully loaded.")
+        load_forecast_frame(frame, conn)
+        logger.debug(f"Forecast data for {crypto_id} - {dynamic_model_name} successfully loaded.")
     except Exception as e:
         conn.rollback()
         logger.critical(f"Failed to load forecast data for {crypto_id} - {dynamic_model_name}. Error: {e}")
 
+def save_backtest_checkpoints(conn, rows) -> bool:
+    """
+    Upsert backtest progress rows into `backtest_checkpoints` (one row per currency and model).
+
+    :param rows: dicts with the keys of PG_CHECKPOINT_COLS (uploaded_at is set here).
+    :return: True if the checkpoint was committed, False otherwise.
+    """
+    uploaded_at = datetime.now(timezone.utc).replace(tzinfo=None)
+    values = [tuple({**row, "uploaded_at": uploaded_at}[col] for col in PG_CHECKPOINT_COLS) for row in rows]
+    try:
+        with conn.cursor() as cursor:
+            cursor.executemany(gen_sql_pg_upsert_checkpoint(), values)
+        conn.commit()
+        return True
+    except Exception as e:
+        conn.rollback()
+        logger.error(f"Failed to save {len(values)} backtest checkpoints. Error: {e}")
+        return False
+
+def load_backtest_checkpoints(conn, crypto_id, model_names) -> dict:
+    """
+    Read the backtest checkpoints of some models of one currency.
+
+    :return: dict model -> checkpoint row (dict with the keys of PG_CHECKPOINT_COLS); empty if there are none.
+    """
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                f"SELECT {', '.join(PG_CHECKPOINT_COLS)} FROM backtest_checkpoints "
+                "WHERE currency = %s AND model = ANY(%s);",
+                (crypto_id, list(model_names)),
+            )
+            rows = cursor.fetchall()
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        logger.warning(f"Failed to read backtest checkpoints of {crypto_id}. Error: {e}")
+        return {}
+    return {row[1]: dict(zip(PG_CHECKPOINT_COLS, row)) for row in rows}
+
+def delete_backtest_checkpoints(conn, crypto_id, model_names) -> int:
+    """
+    Delete the backtest checkpoints of some models of one currency, so their next backtest starts from scratch.
+
+    :return: number of deleted checkpoints.
+    """
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "DELETE FROM backtest_checkpoints WHERE currency = %s AND model = ANY(%s);",
+            (crypto_id, list(model_names)),
+        )
+        deleted = cursor.rowcount
+    conn.commit()
+    return deleted
+
+def save_backtest_windows(conn, rows) -> bool:
+    """
+    Upsert the keys of retrain windows whose forecasts are stored into `backtest_windows`.
+
+    :param rows: dicts with the keys of PG_WINDOW_COLS (uploaded_at is set here).
+    :return: True if the windows were committed, False otherwise.
+    """
+    uploaded_at = datetime.now(timezone.utc).replace(tzinfo=None)
+    values = [tuple({**row, "uploaded_at": uploaded_at}[col] for col in PG_WINDOW_COLS) for row in rows]
+    try:
+        with conn.cursor() as cursor:
+            cursor.executemany(gen_sql_pg_upsert_window(), values)
+        conn.commit()
+        return True
+    except Exception as e:
+        conn.rollback()
+        logger.error(f"Failed to save {len(values)} backtest windows. Error: {e}")
+        return False
+
+def load_backtest_windows(conn, crypto_id, model_name) -> dict:
+    """
+    Read the stored retrain windows of one model of one currency.
+
+    :return: dict window start -> window key; empty if there are none.
+    """
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                "SELECT window_start, window_key FROM backtest_windows WHERE currency = %s AND model = %s;",
+                (crypto_id, model_name),
+            )
+            rows = cursor.fetchall()
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        logger.warning(f"Failed to read backtest windows of {crypto_id} - {model_name}. Error: {e}")
+        return {}
+    return dict(rows)
+
+def enqueue_backtest_jobs(conn, jobs) -> list:
+    """
+    Insert backtest jobs into `backtest_jobs` as 'queued'.
+
+    :param jobs: dicts with the keys of PG_JOB_COLS ('params' and 'dependents' are stored as JSON).
+    :return: job ids in the order of jobs.
+    """
+    job_ids = []
+    with conn.cursor() as cursor:
+        for job in jobs:
+            row = {**job, "params": json.dumps(job["params"], default=str), "dependents": json.dumps(job["dependents"], default=str)}
+            cursor.execute(gen_sql_pg_insert_job(), tuple(row[col] for col in PG_JOB_COLS))
+            job_ids.append(cursor.fetchone()[0])
+    conn.commit()
+    return job_ids
+
+def claim_backtest_job(conn, worker, stale_seconds, max_attempts):
+    """
+    Claim the next backtest job for a worker.
+
+    A job is claimable while queued, or while running without a heartbeat for `stale_seconds`
+    (its worker died) and fewer than `max_attempts` attempts; such jobs that used up their attempts are failed first.
+
+    :return: dict with 'job_id', 'attempts' and the keys of PG_JOB_COLS, or None if there is nothing to do.
+    """
+    limits = {"worker": worker, "stale_seconds": stale_seconds, "max_attempts": max_attempts}
+    with conn.cursor() as cursor:
+        cursor.execute(gen_sql_pg_reap_jobs(), limits)
+        if cursor.rowcount:
+            logger.error(f"{cursor.rowcount} backtest jobs failed after {max_attempts} attempts without heartbeat.")
+        cursor.execute(gen_sql_pg_claim_job(), limits)
+        row = cursor.fetchone()
+    conn.commit()
+    if row is None:
+        return None
+    return dict(zip(["job_id", "attempts", *PG_JOB_COLS], row))
+
+def heartbeat_backtest_job(conn, job_id, worker) -> bool:
+    """
+    Refresh the heartbeat of a running job.
+
+    :return: False if the job is no longer held by this worker (it was reclaimed as abandoned).
+    """
+    with conn.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE backtest_jobs SET heartbeat_at = {PG_JOB_NOW} "
+            "WHERE job_id = %s AND worker = %s AND status = 'running';",
+            (job_id, worker),
+        )
+        held = cursor.rowcount == 1
+    conn.commit()
+    return held
+
+def finish_backtest_job(conn, job_id, worker, error=None, max_attempts=1) -> bool:
+    """
+    Record the outcome of a claimed job: 'done', or on error 'queued' again for a retry
+    until `max_attempts` attempts were made, then 'failed'.
+
+    :return: False if the job is no longer held by this worker (nothing recorded).
+    """
+    if error is None:
+        sql = (
+            f"UPDATE backtest_jobs SET status = 'done', error = NULL, finished_at = {PG_JOB_NOW} "
+            "WHERE job_id = %s AND worker = %s;"
+        )
+        values = (job_id, worker)
+    else:
+        sql = (
+            "UPDATE backtest_jobs SET status = CASE WHEN attempts >= %s THEN 'failed' ELSE 'queued' END, "
+            f"error = %s, finished_at = {PG_JOB_NOW} "
+            "WHERE job_id = %s AND worker = %s;"
+        )
+        values = (max_attempts, str(error), job_id, worker)
+    with conn.cursor() as cursor:
+        cursor.execute(sql, values)
+        held = cursor.rowcount == 1
+    conn.commit()
+    return held
+
+def get_backtest_job_counts(conn, batch_id) -> dict:
+    """
+    :return: dict status -> number of jobs of one batch.
+    """
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT status, COUNT(*) FROM backtest_jobs WHERE batch_id = %s GROUP BY status;", (batch_id,))
+        counts = dict(cursor.fetchall())
+    conn.commit()
+    return counts
+
+class ForecastWriteBuffer:
+    """
+    Accumulates forecast rows across forecast events and writes them with one bulk upsert
+    once `max_rows` rows are buffered, and on flush() (use as a context manager to flush on exit).
+    Rows of a failed write are lost; `failed` then stays set, so no checkpoint claims them afterwards.
+    """
+    def __init__(self, conn, max_rows=FORECAST_BUFFER_ROWS):
+        self.conn = conn
+        self.max_rows = max_rows
+        self.failed = False
+        self._frames = []
+        self._rows = 0
+
+    def __len__(self):
+        return self._rows
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.flush()
+        return False
+
+    def add(self, frame):
+        """
+        :param frame: forecast rows prepared by build_forecast_frame.
+        """
+        self._frames.append(frame)
+        self._rows += len(frame)
+        if self._rows >= self.max_rows:
+            self.flush()
+
+    def flush(self) -> int:
+        """
+        Write all buffered rows in one statement.
+
+        :return: number of written rows (0 if the buffer was empty or the write failed).
+        """
+        if not self._frames:
+            return 0
+        return self._write(self._take())
+
+    def _take(self):
+        frame = pd.concat(self._frames, ignore_index=True)
+        self._frames = []
+        self._rows = 0
+        return frame
+
+    def _write(self, frame) -> int:
+        try:
+            loaded = load_forecast_frame(frame, self.conn)
+            logger.debug(f"Flushed {loaded} buffered forecast rows.")
+            return loaded
+        except Exception as e:
+            self.conn.rollback()
+            self.failed = True
+            logger.critical(f"Failed to flush {len(frame)} buffered forecast rows. Error: {e}")
+            return 0
+
+class BackgroundWriteBuffer(ForecastWriteBuffer):
+    """
+    ForecastWriteBuffer whose bulk writes run in a writer thread over its own connection, so forecasting
+    goes on while full batches are written. At most `max_pending` batches wait for the writer; add()
+    blocks beyond that (backpressure). flush() hands over the rest and waits until everything is written,
+    so it still guarantees stored forecasts (e.g. before a checkpoint). close() when done.
+    """
+    def __init__(self, pg_config, max_rows=FORECAST_BUFFER_ROWS, max_pending=PIPELINE_QUEUE_SIZE):
+        super().__init__(postgres_connection(**pg_config), max_rows)
+        self._batches = queue.Queue(maxsize=max_pending)
+        self._handed_over = 0  # rows given to the writer since the last flush
+        self._written = 0
+        self._failed = False
+        self._writer = threading.Thread(target=self._write_loop, name="forecast-writer", daemon=True)
+        self._writer.start()
+
+    def __len__(self):
+        # rows not yet confirmed by a flush, including those the writer is still busy with
+        return self._rows + self._handed_over
+
+    def add(self, frame):
+        self._frames.append(frame)
+        self._rows += len(frame)
+        if self._rows >= self.max_rows:
+            self._hand_over()
+
+    def flush(self) -> int:
+        """
+        Write all buffered rows and wait for the writer.
+
+        :return: number of rows written since the previous flush (0 if there were none or any write failed).
+        """
+        self._hand_over()
+        self._batches.join()
+        written = 0 if self._failed else self._written
+        self._handed_over = self._written = 0
+        self._failed = False
+        return written
+
+    def close(self):
+        self.flush()
+        self._batches.put(None)
+        self._writer.join()
+        self.conn.close()
+
+    def _hand_over(self):
+        if self._frames:
+            self._handed_over += self._rows
+            self._batches.put(self._take())
+
+    def _write_loop(self):
+        while True:
+            frame = self._batches.get()
+            try:
+                if frame is None:
+                    return
+                loaded = self._write(frame)
+                self._written += loaded
+                self._failed |= loaded == 0
+            finally:
+                self._batches.task_done()
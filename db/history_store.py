@@ -0,0 +1,216 @@
+import os
+import logging
+import numpy as np
+import pandas as pd
+from datetime import datetime, timezone
+from config.config_system import HISTORY_STORE_DIRECTORY, HISTORY_EMPTY_SETTLE_HOURS
+
+logger = logging.getLogger(__name__)
+
+HOUR_SECONDS = 3600
+# ---------------------------------------------------------
+# [Local price history store]
+#   One pair of raw column files per symbol:
+#    {crypto_id}__epoch.i8 - int64 unix epoch seconds (naive UTC hours)
+#    {crypto_id}__price.f8 - float64 close price
+#   and one file of the hours the API confirmed it has no data for:
+#    {crypto_id}__empty.i8 - int64 unix epoch seconds
+#   Files are append-only and opened as read-only memory maps, so reading
+#   years of hourly data costs one mmap call instead of a network round trip.
+# ---------------------------------------------------------
+def _store_paths(crypto_id: str) -> tuple[str, str]:
+    epoch_path = os.path.join(HISTORY_STORE_DIRECTORY, f"{crypto_id}__epoch.i8")
+    price_path = os.path.join(HISTORY_STORE_DIRECTORY, f"{crypto_id}__price.f8")
+    return epoch_path, price_path
+
+def _empty_path(crypto_id: str) -> str:
+    return os.path.join(HISTORY_STORE_DIRECTORY, f"{crypto_id}__empty.i8")
+
+def _stored_rows(epoch_path: str, price_path: str) -> int:
+    """
+    Number of complete rows in the column pair. A write interrupted between the two
+    files leaves them with different lengths; only the common prefix is trusted.
+    """
+    if not (os.path.exists(epoch_path) and os.path.exists(price_path)):
+        return 0
+    return min(os.path.getsize(epoch_path) // 8, os.path.getsize(price_path) // 8)
+
+def _to_epoch(dt) -> int:
+    ts = pd.Timestamp(dt)
+    if ts.tz is not None:
+        ts = ts.tz_convert(None)
+    return int(ts.value // 10**9)
+
+def read_store(crypto_id: str) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Memory-map the stored epoch/price columns of a cryptocurrency.
+
+    :param crypto_id: The cryptocurrency identifier (e.g., 'BTC', 'ETH').
+    :return: Tuple (epochs, prices) of read-only arrays in append order (empty if nothing is stored).
+    """
+    epoch_path, price_path = _store_paths(crypto_id)
+    rows = _stored_rows(epoch_path, price_path)
+    if rows == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+
+    epochs = np.memmap(epoch_path, dtype=np.int64, mode="r", shape=(rows,))
+    prices = np.memmap(price_path, dtype=np.float64, mode="r", shape=(rows,))
+    return epochs, prices
+
+def append_to_store(crypto_id: str, df: pd.DataFrame) -> int:
+    """
+    Append new hourly rows to the store of a cryptocurrency.
+
+    Rows whose hour is already stored are skipped, as is the still open current hour,
+    so the append-only files never hold a partial close price.
+
+    :param crypto_id: The cryptocurrency identifier (e.g., 'BTC', 'ETH').
+    :param df: DataFrame with columns ['date', 'price'] (naive UTC timestamps).
+    :return: Number of appended rows.
+    """
+    if df is None or df.empty:
+        return 0
+
+    os.makedirs(HISTORY_STORE_DIRECTORY, exist_ok=True)
+    epoch_path, price_path = _store_paths(crypto_id)
+
+    new_epochs = pd.to_datetime(df["date"]).values.astype("datetime64[s]").astype(np.int64)
+    new_prices = df["price"].to_numpy(dtype=np.float64)
+
+    # keep only closed hours
+    now_epoch = int(datetime.now(timezone.utc).timestamp())
+    closed = new_epochs + HOUR_SECONDS <= now_epoch
+
+    stored_epochs, _ = read_store(crypto_id)
+    fresh = closed & ~np.isin(new_epochs, stored_epochs)
+    new_epochs, new_prices = new_epochs[fresh], new_prices[fresh]
+
+    # drop duplicates inside the batch itself
+    new_epochs, unique_idx = np.unique(new_epochs, return_index=True)
+    new_prices = new_prices[unique_idx]
+
+    if len(new_epochs) == 0:
+        return 0
+
+    # repair a torn previous append before writing
+    rows = _stored_rows(epoch_path, price_path)
+    for path in (epoch_path, price_path):
+        if os.path.exists(path) and os.path.getsize(path) != rows * 8:
+            os.truncate(path, rows * 8)
+
+    with open(epoch_path, "ab") as f:
+        f.write(new_epochs.tobytes())
+    with open(price_path, "ab") as f:
+        f.write(new_prices.tobytes())
+
+    logger.debug(f"{crypto_id}: appended {len(new_epochs)} rows to local history store.")
+    return len(new_epochs)
+
+def read_empty_hours(crypto_id: str) -> np.ndarray:
+    """
+    Memory-map the hours recorded as confirmed empty for a cryptocurrency (see record_empty_hours).
+
+    :param crypto_id: The cryptocurrency identifier (e.g., 'BTC', 'ETH').
+    :return: Read-only int64 array of unix epoch seconds (empty if none are recorded).
+    """
+    empty_path = _empty_path(crypto_id)
+    rows = os.path.getsize(empty_path) // 8 if os.path.exists(empty_path) else 0
+    if rows == 0:
+        return np.empty(0, dtype=np.int64)
+    return np.memmap(empty_path, dtype=np.int64, mode="r", shape=(rows,))
+
+def record_empty_hours(crypto_id: str, start_date, end_date, df: pd.DataFrame) -> int:
+    """
+    Record the hours of a fetched range that the API did not return, so they are not requested again.
+
+    Only call this with the complete answer for the range (get_data: attrs['complete']). Hours closed
+    less than HISTORY_EMPTY_SETTLE_HOURS ago are not recorded, the API may still publish them.
+
+    :param crypto_id: The cryptocurrency identifier (e.g., 'BTC', 'ETH').
+    :param start_date: Start of the fetched range (inclusive).
+    :param end_date: End of the fetched range (inclusive).
+    :param df: The fetched DataFrame with columns ['date', 'price'] (may be empty).
+    :return: Number of recorded hours.
+    """
+    start_epoch = -(-_to_epoch(start_date) // HOUR_SECONDS) * HOUR_SECONDS  # ceil to hour
+    now_epoch = int(datetime.now(timezone.utc).timestamp())
+    settled_epoch = now_epoch - (HISTORY_EMPTY_SETTLE_HOURS + 1) * HOUR_SECONDS
+    end_epoch = min(_to_epoch(end_date), settled_epoch) // HOUR_SECONDS * HOUR_SECONDS  # floor to hour
+    if end_epoch < start_epoch:
+        return 0
+
+    expected = np.arange(start_epoch, end_epoch + HOUR_SECONDS, HOUR_SECONDS, dtype=np.int64)
+    returned = (
+        pd.to_datetime(df["date"]).values.astype("datetime64[s]").astype(np.int64)
+        if df is not None and not df.empty else np.empty(0, dtype=np.int64)
+    )
+    stored_epochs, _ = read_store(crypto_id)
+    empty = expected[~np.isin(expected, returned) & ~np.isin(expected, stored_epochs)
+                     & ~np.isin(expected, read_empty_hours(crypto_id))]
+    if len(empty) == 0:
+        return 0
+
+    os.makedirs(HISTORY_STORE_DIRECTORY, exist_ok=True)
+    empty_path = _empty_path(crypto_id)
+    # repair a torn previous append before writing
+    if os.path.exists(empty_path) and os.path.getsize(empty_path) % 8:
+        os.truncate(empty_path, os.path.getsize(empty_path) // 8 * 8)
+    with open(empty_path, "ab") as f:
+        f.write(empty.tobytes())
+
+    logger.debug(f"{crypto_id}: recorded {len(empty)} hours the API has no data for.")
+    return len(empty)
+
+def find_missing_ranges(crypto_id: str, start_date, end_date) -> list[tuple[pd.Timestamp, pd.Timestamp]]:
+    """
+    Compute the hourly ranges within [start_date, end_date] that are absent from the store
+    (hours recorded as confirmed empty, see record_empty_hours, do not count as absent).
+
+    :param crypto_id: The cryptocurrency identifier (e.g., 'BTC', 'ETH').
+    :param start_date: Range start (inclusive), anything accepted by pd.Timestamp.
+    :param end_date: Range end (inclusive), anything accepted by pd.Timestamp.
+    :return: List of (gap_start, gap_end) naive timestamps, both inclusive, in chronological order.
+    """
+    start_epoch = -(-_to_epoch(start_date) // HOUR_SECONDS) * HOUR_SECONDS  # ceil to hour
+    end_epoch = _to_epoch(end_date) // HOUR_SECONDS * HOUR_SECONDS          # floor to hour
+    if end_epoch < start_epoch:
+        return []
+
+    expected = np.arange(start_epoch, end_epoch + HOUR_SECONDS, HOUR_SECONDS, dtype=np.int64)
+    stored_epochs, _ = read_store(crypto_id)
+    missing = expected[~np.isin(expected, stored_epochs) & ~np.isin(expected, read_empty_hours(crypto_id))]
+    if len(missing) == 0:
+        return []
+
+    # split missing hours into contiguous runs
+    breaks = np.flatnonzero(np.diff(missing) != HOUR_SECONDS) + 1
+    runs = np.split(missing, breaks)
+
+    return [
+        (pd.Timestamp(run[0], unit="s"), pd.Timestamp(run[-1], unit="s"))
+        for run in runs
+    ]
+
+def load_from_store(crypto_id: str, start_date, end_date) -> pd.DataFrame:
+    """
+    Read stored history of a cryptocurrency for a time range.
+
+    :param crypto_id: The cryptocurrency identifier (e.g., 'BTC', 'ETH').
+    :param start_date: Range start (inclusive).
+    :param end_date: Range end (inclusive).
+    :return: DataFrame with columns ['date', 'price'] sorted by date (empty if nothing is stored).
+    """
+    epochs, prices = read_store(crypto_id)
+
+    # gap fills may land after later hours, so the append order is not always chronological
+    if len(epochs) > 1 and not np.all(np.diff(epochs) > 0):
+        order = np.argsort(epochs, kind="stable")
+        epochs, prices = epochs[order], prices[order]
+
+    lo = np.searchsorted(epochs, _to_epoch(start_date), side="left")
+    hi = np.searchsorted(epochs, _to_epoch(end_date), side="right")
+
+    return pd.DataFrame({
+        "date": pd.to_datetime(np.asarray(epochs[lo:hi]), unit="s"),
+        "price": np.asarray(prices[lo:hi]),
+    })
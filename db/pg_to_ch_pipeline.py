@@ -8,7 +8,8 @@ from clickhouse_driver import Client
 from .core_columns_generators import (
     gen_sql_ch_create_external_pg_table,
     gen_sql_ch_create_forecast_data_table,
-    gen_sql_ch_insert_from_external
+    gen_sql_ch_insert_from_external,
+    gen_sql_ch_select_transfer_watermark
 )
 # logger
 logger = logging.getLogger(__name__)
@@ -32,7 +33,11 @@ def get_container_ip(container_name: str) -> str:
     except Exception as e:
         raise RuntimeError(f"Failed to get IP of container '{container_name}': {e}")
 
-def create_external_pg_table(clickhouse_client: Client, clickhouse_config: dict[str, Any], postgres_config: dict[str, Any]) -> bool:
+# ClickHouse table reading backtest_data_delta, the rows changed since the last transfer
+DELTA_EXTERNAL_TABLE = "external_pg_forecast_delta"
+
+def create_external_pg_table(clickhouse_client: Client, clickhouse_config: dict[str, Any], postgres_config: dict[str, Any],
+                             pg_table: str = "backtest_data_mv", ch_table_name: str = None) -> bool:
     """
     Creates a table in ClickHouse connected to a PostgreSQL database using the provided config.
     
@@ -41,6 +46,8 @@ def create_external_pg_table(clickhouse_client: Client, clickhouse_config: dict[
     
     :param config: Dictionary containing PostgreSQL connection details.
     :param clickhouse_client: An instance of the ClickHouse Client for executing the query.
+    :param pg_table: PostgreSQL table or view to read (backtest_data_mv by default).
+    :param ch_table_name: Name of the ClickHouse table, defaults to clickhouse_config['table'].
     :return: True if the table was created successfully, False otherwise.
     """
     
@@ -54,7 +61,7 @@ def create_external_pg_table(clickhouse_client: Client, clickhouse_config: dict[
     
     #win_ip = get_windows_host_ip(clickhouse_config)
     ch_database_name = clickhouse_config['database']
-    ch_table_name = clickhouse_config['table']
+    ch_table_name = ch_table_name or clickhouse_config['table']
     
     # Prepare the query to create external Postgres Table in ClickHouse
     sql_ch_create_external_pg_table = gen_sql_ch_create_external_pg_table(
@@ -63,7 +70,8 @@ def create_external_pg_table(clickhouse_client: Client, clickhouse_config: dict[
         pg_user, 
         pg_password, 
         ch_database_name, 
-        ch_table_name
+        ch_table_name,
+        pg_table
         )
 
     logger.debug(sql_ch_create_external_pg_table)
@@ -105,14 +113,41 @@ def create_ch_forecast_data_table(clickhouse_client: Client, clickhouse_config:
         logger.error(f"Failed to create local forecast_data table: {e}")
         return False
 
-def insert_from_external(clickhouse_client: Client, clickhouse_config: dict[str, Any]) -> bool:
+def create_external_pg_delta_table(clickhouse_client: Client, clickhouse_config: dict[str, Any], postgres_config: dict[str, Any]) -> bool:
+    """
+    Creates the ClickHouse table DELTA_EXTERNAL_TABLE reading the PostgreSQL table backtest_data_delta
+    (see db_utils_postgres.refresh_backtest_delta), for incremental transfers.
+    """
+    return create_external_pg_table(
+        clickhouse_client, clickhouse_config, postgres_config, pg_table="backtest_data_delta", ch_table_name=DELTA_EXTERNAL_TABLE
+    )
+
+def get_transfer_watermark(clickhouse_client: Client, clickhouse_config: dict[str, Any]):
+    """
+    Upload time of the latest row transferred into the local forecast_data table.
+
+    Returns:
+        datetime: The watermark, or None if nothing was transferred yet or it cannot be read.
+    """
+    ch_database = clickhouse_config['database']
+
+    try:
+        watermark = clickhouse_client.execute(gen_sql_ch_select_transfer_watermark(ch_database))[0][0]
+        logger.debug(f"Transfer watermark: {watermark}.")
+        return watermark
+    except Exception as e:
+        logger.error(f"Failed to read transfer watermark: {e}")
+        return None
+
+def insert_from_external(clickhouse_client: Client, clickhouse_config: dict[str, Any],
+                         source_table: str = "external_pg_forecast_data") -> bool:
     ch_database = clickhouse_config['database']
 
-    sql_ch_insert_from_external = gen_sql_ch_insert_from_external(ch_database)
+    sql_ch_insert_from_external = gen_sql_ch_insert_from_external(ch_database, source_table)
 
     try:
         clickhouse_client.execute(sql_ch_insert_from_external)
-        logger.info("Bulk inserted data from external_pg_forecast_data into forecast_data.")
+        logger.info(f"Bulk inserted data from {source_table} into forecast_data.")
         return True
     except Exception as e:
         logger.error(f"Failed to insert data: {e}")
@@ -1,70 +1,202 @@
 import requests
 import pandas as pd
 import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from config.config_system import FETCH_WORKERS, API_RATE_LIMIT, FETCH_MAX_RETRIES, FETCH_BACKOFF_SECONDS
 
 # initialize logger
 logger = logging.getLogger(__name__)
 
-def fetch_historical_data(crypto_id, start_date, end_date, api_key=None):
+HISTOHOUR_URL = "https://min-api.cryptocompare.com/data/v2/histohour"
+PAGE_LIMIT = 2000  # CryptoCompare API limit per request
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+# ---------------------------------------------------------
+# [Shared HTTP session and rate limiter]
+# ---------------------------------------------------------
+class TokenBucket:
     """
-    Fetch historical hourly cryptocurrency data from an external API for a specific time range with support for pagination.
+    Thread-safe token bucket. Every request takes one token; tokens refill at `rate` per second
+    up to `capacity`, so bursts are allowed but the long-run request rate never exceeds `rate`.
+    """
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
 
-    :param crypto_id: The cryptocurrency identifier (e.g., 'BTC', 'ETH').
-    :param start_date: The start date (inclusive) as a string in 'yyyy-mm-dd HH:MM:SS' format.
-    :param end_date: The end date (inclusive) as a string in 'yyyy-mm-dd HH:MM:SS' format.
-    :param api_key: API key for authentication (optional).
-    :return: A pandas DataFrame with columns ['date', 'price'] and a DatetimeIndex (naive, hourly frequency).
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+_rate_limiter = TokenBucket(API_RATE_LIMIT)
+_session = None
+_session_lock = threading.Lock()
+
+def get_session() -> requests.Session:
     """
-    url = "https://min-api.cryptocompare.com/data/v2/histohour"
-    headers = {"Authorization": f"Apikey {api_key}"} if api_key else {}
-    all_data = []
-    limit = 2000  # CryptoCompare API limit per request
+    Return the process-wide keep-alive session, sized to serve FETCH_WORKERS threads concurrently.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(FETCH_WORKERS, 1))
+            _session.mount("https://", adapter)
+        return _session
 
-    start_timestamp = int(pd.Timestamp(start_date).timestamp())
-    end_timestamp = int(pd.Timestamp(end_date).timestamp())
+def _request_page(crypto_id, to_ts, limit, api_key=None):
+    """
+    Request one histohour page ending at `to_ts` through the shared session and rate limiter.
+    429 and 5xx responses are retried with exponential backoff (Retry-After is honored if sent).
 
+    :return: List of raw hourly records (may be empty), or None if the request failed.
+    """
+    headers = {"Authorization": f"Apikey {api_key}"} if api_key else {}
     params = {
         'fsym': crypto_id,
         'tsym': 'USD',
-        'limit': limit - 1,  # Adjust limit for the request
-        'toTs': end_timestamp  # Start fetching from the end date backwards
+        # the API returns limit + 1 points; never ask for limit=0 (a 1-hour gap), the surplus is trimmed in assemble_pages
+        'limit': max(limit - 1, 1),
+        'toTs': to_ts
     }
 
-    while True:
-        response = requests.get(url, headers=headers, params=params)
-        if response.status_code == 200:
-            data = response.json().get('Data', {}).get('Data', [])
-            if not data:
-                break  # Stop if no data is returned
+    for attempt in range(FETCH_MAX_RETRIES + 1):
+        _rate_limiter.acquire()
+        try:
+            response = get_session().get(HISTOHOUR_URL, headers=headers, params=params, timeout=30)
+        except requests.RequestException as e:
+            status, retry_after = f"{type(e).__name__}", None
+        else:
+            if response.status_code == 200:
+                return response.json().get('Data', {}).get('Data', [])
+            if response.status_code not in RETRY_STATUS_CODES:
+                logger.error(f"Failed to fetch data for {crypto_id}. Status code: {response.status_code}")
+                return None
+            status, retry_after = response.status_code, response.headers.get("Retry-After")
 
-            df = pd.DataFrame(data)
-            df['date'] = pd.to_datetime(df['time'], unit='s')  # naive datetime
-            all_data.append(df)
+        if attempt == FETCH_MAX_RETRIES:
+            break
+        delay = float(retry_after) if retry_after and retry_after.isdigit() else FETCH_BACKOFF_SECONDS * 2 ** attempt
+        logger.warning(f"{crypto_id}: page toTs={to_ts} got {status}, retry {attempt + 1}/{FETCH_MAX_RETRIES} in {delay:.1f}s.")
+        time.sleep(delay)
 
-            last_timestamp = df['time'].iloc[0]
-            if last_timestamp <= start_timestamp:
-                break  # Stop if we've reached the start date
+    logger.error(f"Failed to fetch data for {crypto_id} (toTs={to_ts}) after {FETCH_MAX_RETRIES} retries.")
+    return None
 
-            params['toTs'] = last_timestamp  # Set the new 'toTs' for the next request
-        else:
-            logger.error(f"Failed to fetch data for {crypto_id}. Status code: {response.status_code}")
-            break
+def plan_pages(start_date, end_date):
+    """
+    Split a time range into histohour pages. Pages are walked backwards from the end date,
+    but their boundaries are known up front, so they can be requested in any order.
 
+    :return: List of (to_ts, limit) tuples.
+    """
+    start_timestamp = int(pd.Timestamp(start_date).timestamp())
+    end_timestamp = int(pd.Timestamp(end_date).timestamp())
+
+    pages = []
+    to_ts = end_timestamp
+    while to_ts >= start_timestamp:
+        hours_left = (to_ts - start_timestamp) // 3600 + 1
+        limit = min(PAGE_LIMIT, hours_left)
+        pages.append((to_ts, limit))
+        to_ts -= limit * 3600
+    return pages
+
+def assemble_pages(pages_data, start_date, end_date):
+    """
+    Concatenate raw histohour pages into the ['date', 'price'] frame for the requested range
+    (points outside it, e.g. the surplus of a minimum-size page, are dropped).
+
+    attrs['complete'] of the frame is False if a page request failed (a None page), so the hours it
+    lacks are not known to be missing from the API.
+    """
+    complete = all(data is not None for data in pages_data)
+    all_data = [pd.DataFrame(data) for data in pages_data if data]
     if not all_data:
-        return pd.DataFrame()  # Return empty DataFrame if no data was fetched
+        empty_df = pd.DataFrame()  # Return empty DataFrame if no data was fetched
+        empty_df.attrs["complete"] = complete
+        return empty_df
 
     # Concatenate all partial DataFrames and remove duplicate timestamps if any
-    full_df = pd.concat(all_data).drop_duplicates(subset='date', keep='first').sort_values(by='date')
+    full_df = pd.concat(all_data)
+    full_df['date'] = pd.to_datetime(full_df['time'], unit='s')  # naive datetime
+    full_df = full_df.drop_duplicates(subset='date', keep='first').sort_values(by='date')
     logger.debug(f"1 debug df call: {full_df.head()}")
 
     # Filter data to ensure it's within the requested date range
     full_df = full_df[(full_df['date'] >= pd.to_datetime(start_date)) & (full_df['date'] <= pd.to_datetime(end_date))]
     logger.debug(f"2 debug df call: {full_df.head()}")
 
-    # Set index and keep 'date' as a column
-    full_df.set_index('date', inplace=True)
-    logger.debug(f"3 debug df call: {full_df.head()}")
-    
-    full_df.reset_index(drop=False, inplace=True)
-    logger.debug(f"4 debug df call: {full_df.head()}")
-    return pd.DataFrame({"date": full_df['date'], "price": full_df['close']})
\ No newline at end of file
+    full_df = full_df.reset_index(drop=True)
+    result_df = pd.DataFrame({"date": full_df['date'], "price": full_df['close']})
+    result_df.attrs["complete"] = complete
+    return result_df
+# ---------------------------------------------------------
+# [Fetch functions]
+# ---------------------------------------------------------
+def fetch_historical_data(crypto_id, start_date, end_date, api_key=None):
+    """
+    Fetch historical hourly cryptocurrency data from an external API for a specific time range with support for pagination.
+
+    :param crypto_id: The cryptocurrency identifier (e.g., 'BTC', 'ETH').
+    :param start_date: The start date (inclusive) as a string in 'yyyy-mm-dd HH:MM:SS' format.
+    :param end_date: The end date (inclusive) as a string in 'yyyy-mm-dd HH:MM:SS' format.
+    :param api_key: API key for authentication (optional).
+    :return: A pandas DataFrame with columns ['date', 'price'] and a DatetimeIndex (naive, hourly frequency);
+             attrs['complete'] is False if a request failed (see assemble_pages).
+    """
+    pages_data = []
+    for to_ts, limit in plan_pages(start_date, end_date):
+        data = _request_page(crypto_id, to_ts, limit, api_key)
+        pages_data.append(data)
+        if not data:
+            break  # Stop if no data is returned (nothing older is listed) or the request failed
+
+    return assemble_pages(pages_data, start_date, end_date)
+
+def fetch_historical_data_many(ranges, api_key=None, max_workers=None):
+    """
+    Fetch several (crypto_id, start_date, end_date) ranges concurrently.
+
+    Pages of all ranges go into one thread pool over the shared keep-alive session,
+    and every request passes the same token bucket, so the total request rate stays
+    within API_RATE_LIMIT regardless of the number of symbols.
+
+    :param ranges: Iterable of (crypto_id, start_date, end_date) tuples (a symbol may appear several times).
+    :param api_key: API key for authentication (optional).
+    :param max_workers: Thread pool size. Defaults to FETCH_WORKERS.
+    :return: List of DataFrames with columns ['date', 'price'], aligned with `ranges` (see assemble_pages).
+    """
+    ranges = list(ranges)
+    page_jobs = [
+        (range_idx, crypto_id, to_ts, limit)
+        for range_idx, (crypto_id, start_date, end_date) in enumerate(ranges)
+        for to_ts, limit in plan_pages(start_date, end_date)
+    ]
+    logger.info(f"Fetching {len(page_jobs)} pages for {len(ranges)} ranges with {max_workers or FETCH_WORKERS} workers.")
+
+    with ThreadPoolExecutor(max_workers=max_workers or FETCH_WORKERS) as executor:
+        futures = [
+            (range_idx, executor.submit(_request_page, crypto_id, to_ts, limit, api_key))
+            for range_idx, crypto_id, to_ts, limit in page_jobs
+        ]
+        pages_by_range = {idx: [] for idx in range(len(ranges))}
+        for range_idx, future in futures:
+            pages_by_range[range_idx].append(future.result())
+
+    return [
+        assemble_pages(pages_by_range[idx], start_date, end_date)
+        for idx, (_, start_date, end_date) in enumerate(ranges)
+    ]
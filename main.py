@@ -1,13 +1,16 @@
 # libs
+import argparse
 import pandas as pd
 import logging
 from dotenv import load_dotenv
 # modules
 from db.db_utils_postgres import prepare_postgres, update_pg_config, postgres_connection, refresh_materialized_view
 from db.db_utils_clickhouse import prepare_clickhouse, update_ch_config, clickhouse_connection 
-from db.pg_to_ch_pipeline import create_external_pg_table, create_ch_forecast_data_table, insert_from_external
+from db.pg_to_ch_pipeline import create_external_pg_table, create_external_pg_delta_table, create_ch_forecast_data_table, insert_from_external
 from models.df_and_models_engine import fetch_predict_upload_ts
-from config.config_system import PG_DB_CONFIG, CH_DB_CONFIG
+from pipeline import run_live, run_backtest_worker, run_sweep_cycle
+from config.config_system import PG_DB_CONFIG, CH_DB_CONFIG, START_DATE, FINISH_DATE, CRYPTO_LIST
+from config.config_models import MODEL_PARAMETERS, SWEEP_PARAMETER_GRID
 # ---------------------------------------------------------
 logging.basicConfig(
     level=logging.INFO,
@@ -36,6 +39,7 @@ def prepare_ch_and_pg_containers_users_db_tables():
     clickhouse_client = clickhouse_connection(clickhouse_config)
     
     create_external_pg_table(clickhouse_client, clickhouse_config, postgres_config)
+    create_external_pg_delta_table(clickhouse_client, clickhouse_config, postgres_config)
     create_ch_forecast_data_table(clickhouse_client, clickhouse_config)
 
 
@@ -54,15 +58,44 @@ def execute_data_fetch_and_transfer():
     insert_from_external(clickhouse_client, clickhouse_config)
     
 
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="forecrypt")
+    subparsers = parser.add_subparsers(dest="command")
+
+    subparsers.add_parser("full", help="prepare containers and tables, then fetch, backtest and transfer (default)")
+
+    live_parser = subparsers.add_parser("live", help="fetch, forecast and transfer only the newly closed hours")
+    live_parser.add_argument("--once", action="store_true", help="run a single cycle instead of the hourly daemon")
+
+    sweep_parser = subparsers.add_parser("sweep", help="backtest every config of SWEEP_PARAMETER_GRID and transfer")
+    sweep_parser.add_argument("--halving", action="store_true", help="prune configs by successive halving")
+    sweep_parser.add_argument("--workers", type=int, default=None, help="worker processes (default: BACKTEST_WORKERS)")
+
+    worker_parser = subparsers.add_parser("worker", help="claim and run backtest jobs queued in Postgres")
+    worker_parser.add_argument("--fit-workers", type=int, default=1, help="processes for fitting inside each backtest")
+    worker_parser.add_argument("--drain", action="store_true", help="exit once the queue is empty")
+
+    return parser.parse_args(argv)
+
 #
 if __name__ == "__main__":
 
+    args = parse_args()
+
 #    # guarantee update by .env
     load_dotenv(override=True)
 
-    prepare_ch_and_pg_containers_users_db_tables()
-
-    execute_data_fetch_and_transfer()
+    if args.command == "live":
+        run_live(PG_DB_CONFIG, CH_DB_CONFIG, MODEL_PARAMETERS, START_DATE, CRYPTO_LIST, once=args.once)
+    elif args.command == "sweep":
+        run_sweep_cycle(PG_DB_CONFIG, CH_DB_CONFIG, MODEL_PARAMETERS, SWEEP_PARAMETER_GRID, START_DATE, FINISH_DATE,
+                        CRYPTO_LIST, workers=args.workers, halving=args.halving)
+    elif args.command == "worker":
+        run_backtest_worker(PG_DB_CONFIG, fit_workers=args.fit_workers, drain=args.drain)
+    else:
+        prepare_ch_and_pg_containers_users_db_tables()
+
+        execute_data_fetch_and_transfer()
 
 
 
@@ -0,0 +1,156 @@
+import os
+import time
+import socket
+import logging
+import threading
+import pandas as pd
+#
+import db.db_utils_postgres as db_utils_postgres
+from .df_and_models_engine import normalize_hourly_grid, initialize_model_tracking, run_model_backtest
+from config.config_system import JOB_HEARTBEAT_SECONDS, JOB_STALE_SECONDS, JOB_MAX_ATTEMPTS, JOB_POLL_SECONDS
+
+# initialize logger
+logger = logging.getLogger(__name__)
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+class JobHeartbeat:
+    """
+    Background thread refreshing the heartbeat of a running job over its own connection,
+    so the job is not reclaimed while a long backtest holds the worker's main connection.
+    """
+    def __init__(self, pg_config, job_id, worker, interval=JOB_HEARTBEAT_SECONDS):
+        self.pg_config = pg_config
+        self.job_id = job_id
+        self.worker = worker
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        conn = db_utils_postgres.postgres_connection(**self.pg_config)
+        try:
+            while not self._stop.wait(self.interval):
+                try:
+                    if not db_utils_postgres.heartbeat_backtest_job(conn, self.job_id, self.worker):
+                        logger.warning(f"Job {self.job_id} was reclaimed by another worker.")
+                        return
+                except Exception as e:
+                    logger.warning(f"Heartbeat of job {self.job_id} failed: {e}")
+        finally:
+            conn.close()
+
+# history of the last currency range read by this worker; consecutive jobs usually share it
+_grid_cache = {}
+
+def get_job_grid(conn, job):
+    """
+    Hourly grid of a job's currency and extended range, read from `historical_data`
+    (loaded by the enqueuing cycle, so workers need no API access).
+    """
+    key = (job["currency"], job["extended_start_ts"], job["finish_ts"])
+    if key not in _grid_cache:
+        _grid_cache.clear()
+        history_df = db_utils_postgres.load_history_from_db(conn, *key)
+        if history_df.empty:
+            raise ValueError(f"no history of {job['currency']} stored between {key[1]} and {key[2]}")
+        _grid_cache[key] = normalize_hourly_grid(history_df)
+    return _grid_cache[key]
+
+def run_backtest_job(conn, job, fit_workers=1):
+    """
+    Run the model group backtest of one claimed job (see run_model_backtest). A retried job
+    continues from the checkpoint its previous attempt left behind.
+    """
+    model_name = job["model"]
+    dependents = job["dependents"]
+    model_last_retrain, model_last_forecast = initialize_model_tracking([model_name, *dependents])
+    resume_after = job["resume_after_ts"]
+    run_model_backtest(
+        crypto_id=job["currency"],
+        model_name=model_name,
+        params=job["params"],
+        grid_df=get_job_grid(conn, job),
+        start_naive=pd.Timestamp(job["start_ts"]),
+        finish_naive=pd.Timestamp(job["finish_ts"]),
+        conn=conn,
+        model_last_retrain=model_last_retrain,
+        model_last_forecast=model_last_forecast,
+        fit_workers=fit_workers,
+        dependents=dependents,
+        resume_after=pd.Timestamp(resume_after) if resume_after is not None else None,
+    )
+
+def run_worker(pg_config, worker=None, fit_workers=1, drain=False) -> int:
+    """
+    Claim and run backtest jobs until stopped.
+
+    :param pg_config: Postgres configuration (already updated from environment).
+    :param worker: worker id stored with claimed jobs; defaults to host:pid.
+    :param fit_workers: worker processes for parallel fitting inside each backtest.
+    :param drain: return once the queue is empty instead of polling for new jobs.
+    :return: number of jobs completed.
+    """
+    worker = worker or default_worker_id()
+    conn = db_utils_postgres.postgres_connection(**pg_config)
+    completed = 0
+    logger.info(f"Backtest worker {worker} started.")
+    try:
+        while True:
+            job = db_utils_postgres.claim_backtest_job(conn, worker, JOB_STALE_SECONDS, JOB_MAX_ATTEMPTS)
+            if job is None:
+                if drain:
+                    break
+                time.sleep(JOB_POLL_SECONDS)
+                continue
+
+            label = f"job {job['job_id']} ({job['currency']} - {job['model']}, attempt {job['attempts']})"
+            logger.info(f"Running {label}.")
+            try:
+                with JobHeartbeat(pg_config, job["job_id"], worker):
+                    run_backtest_job(conn, job, fit_workers)
+            except Exception as e:
+                logger.error(f"{label} failed: {e}", exc_info=True)
+                conn.rollback()
+                db_utils_postgres.finish_backtest_job(conn, job["job_id"], worker, error=e, max_attempts=JOB_MAX_ATTEMPTS)
+                continue
+            if not db_utils_postgres.finish_backtest_job(conn, job["job_id"], worker):
+                logger.warning(f"Completed {label}, but it was reclaimed meanwhile; the other claim records its outcome.")
+                continue
+            completed += 1
+            logger.info(f"Completed {label}.")
+    finally:
+        conn.close()
+
+    logger.info(f"Backtest worker {worker} stopped after {completed} jobs.")
+    return completed
+
+def wait_for_backtest_jobs(conn, batch_id, poll_seconds=JOB_POLL_SECONDS) -> bool:
+    """
+    Block until no job of a batch is queued or running.
+
+    :return: True if all jobs of the batch are done, False if any failed.
+    """
+    last_counts = None
+    while True:
+        counts = db_utils_postgres.get_backtest_job_counts(conn, batch_id)
+        if counts != last_counts:
+            logger.info(f"Backtest batch {batch_id}: {counts}")
+            last_counts = counts
+        if not counts.get("queued") and not counts.get("running"):
+            break
+        time.sleep(poll_seconds)
+
+    if counts.get("failed"):
+        logger.error(f"{counts['failed']} backtest jobs of batch {batch_id} failed.")
+        return False
+    return True
@@ -0,0 +1,59 @@
+import pandas as pd
+from collections import namedtuple
+#
+from .drift import retrain_check_interval
+
+# one point of a backtest where at least one action is due
+BacktestEvent = namedtuple("BacktestEvent", ["dt", "retrain", "forecast"])
+# the same for models sharing one fit: forecast_models names the models whose forecast is due
+SharedBacktestEvent = namedtuple("SharedBacktestEvent", ["dt", "retrain", "forecast_models"])
+
+def build_event_schedule(start_naive, finish_naive, params) -> list:
+    """
+    Compute all retrain and forecast timestamps of one model backtest up front.
+
+    Retrains are due every 'model_update_interval' hours and forecasts every 'forecast_frequency'
+    hours, both counted from start_naive, which is exactly when the hourly cycle would have fired them.
+    Under the drift policy the retrain points are retrain checks (see drift.retrain_check_interval).
+
+    :param start_naive: First hour of the backtest (naive datetime).
+    :param finish_naive: Last hour of the backtest (naive datetime, inclusive).
+    :param params: Model parameters dict with 'model_update_interval' and 'forecast_frequency'.
+    :return: List of BacktestEvent(dt, retrain, forecast) sorted by dt.
+    """
+    start = pd.Timestamp(start_naive)
+    finish = pd.Timestamp(finish_naive)
+
+    retrain_dts = pd.date_range(start, finish, freq=pd.Timedelta(hours=retrain_check_interval(params)))
+    forecast_dts = pd.date_range(start, finish, freq=pd.Timedelta(hours=params["forecast_frequency"]))
+
+    retrain_set = set(retrain_dts)
+    forecast_set = set(forecast_dts)
+
+    return [
+        BacktestEvent(dt.to_pydatetime(), dt in retrain_set, dt in forecast_set)
+        for dt in retrain_dts.union(forecast_dts)
+    ]
+
+def build_shared_event_schedule(start_naive, finish_naive, members) -> list:
+    """
+    Merge the schedules of models that share one fit (same retrain settings, so the same retrains).
+
+    :param start_naive: First hour of the backtest (naive datetime).
+    :param finish_naive: Last hour of the backtest (naive datetime, inclusive).
+    :param members: Dict of model name -> model parameters; the first entry defines the retrains.
+    :return: List of SharedBacktestEvent(dt, retrain, forecast_models) sorted by dt.
+    """
+    lead_params = next(iter(members.values()))
+    retrain_dts = {event.dt for event in build_event_schedule(start_naive, finish_naive, lead_params) if event.retrain}
+
+    forecast_models = {}
+    for model_name, params in members.items():
+        for event in build_event_schedule(start_naive, finish_naive, params):
+            if event.forecast:
+                forecast_models.setdefault(event.dt, []).append(model_name)
+
+    return [
+        SharedBacktestEvent(dt, dt in retrain_dts, tuple(forecast_models.get(dt, ())))
+        for dt in sorted(retrain_dts | forecast_models.keys())
+    ]
@@ -1,19 +1,35 @@
 
 # libs
+import numpy as np
 import pandas as pd
 import importlib
 import logging
+import time
+import threading
+from collections import Counter
 from datetime import datetime, timezone, timedelta
+from concurrent.futures import ProcessPoolExecutor, as_completed
 # modules
 import db.db_utils_postgres as db_utils_postgres
+import db.history_store as history_store
 from . import models_processing
-from .forecasting import create_forecast_dataframe
+from . import result_cache
+from .forecasting import create_forecast_dataframe, forecast_values_to_dataframe
+from .backtest_schedule import build_shared_event_schedule
+from .model_cache import model_cache, model_fit_signature, model_config_signature
+from .model_artifacts import to_slim
+from .drift import DriftMonitor, MonitoredWriteBuffer, uses_drift_policy
+from .pipeline_stages import start_stage, stage_results
 import get_data
-from config.config_system import PG_DB_CONFIG, CH_DB_CONFIG, CRYPTO_LIST, START_DATE, FINISH_DATE
+from config.config_system import PG_DB_CONFIG, CH_DB_CONFIG, CRYPTO_LIST, START_DATE, FINISH_DATE, BACKTEST_WORKERS, FIT_WORKERS, PROPAGATE_MODEL_STATE
+from config.config_system import BACKTEST_CHECKPOINTS, BACKTEST_CHECKPOINT_SECONDS, FETCH_WORKERS, RESULT_CACHE_ENABLED, DRIFT_WINDOW_HOURS
 from config.config_models import MODEL_PARAMETERS
 
 # logger
 logger = logging.getLogger(__name__)
+
+# process-wide count of fits that exceeded their time budget, per (crypto_id, model_name)
+fit_timeouts = Counter()
 # ---------------------------------------------------------
 # [DF and models processing]
 # ---------------------------------------------------------
@@ -89,16 +105,74 @@ def calculate_total_fetch_interval(start_date: str, finish_date: str = None, **m
 
     return start_naive, finish_naive, total_hours, extended_start_dt, max_train_dataset_hours
 
-def fetch_extended_df(crypto_id: str, start_date, end_date, api_key=None):
+def prefetch_missing_history(crypto_list, start_date, end_date, api_key=None):
+    """
+    Fill the local history store for all cryptocurrencies at once.
+
+    Missing ranges of every symbol are fetched concurrently through get_data.fetch_historical_data_many,
+    which shares one rate limiter between all requests, and appended to the store. Hours of a completely
+    fetched range that the API did not return are recorded as empty (history_store.record_empty_hours).
+
+    :param crypto_list: List of cryptocurrency identifiers.
+    :param start_date: Start of the extended range (inclusive).
+    :param end_date: End of the extended range (inclusive).
+    :param api_key: API key for authentication (optional).
+    """
+    ranges = [
+        (crypto_id, gap_start, gap_end)
+        for crypto_id in crypto_list
+        for gap_start, gap_end in history_store.find_missing_ranges(crypto_id, start_date, end_date)
+    ]
+    if not ranges:
+        logger.info("Local history store already covers the requested range, nothing to fetch.")
+        return
+
+    for (crypto_id, gap_start, gap_end), gap_df in zip(ranges, get_data.fetch_historical_data_many(ranges, api_key)):
+        store_fetched_gap(crypto_id, gap_start, gap_end, gap_df)
+
+def store_fetched_gap(crypto_id, gap_start, gap_end, gap_df):
+    """
+    Append a fetched gap to the local history store and, if every request of it succeeded, record
+    the hours the API did not return, so they are not requested again.
     """
-    Fetch extended historical data for a cryptocurrency through get_data.fetch_historical_data function.
+    appended = history_store.append_to_store(crypto_id, gap_df)
+    empty = history_store.record_empty_hours(crypto_id, gap_start, gap_end, gap_df) if gap_df.attrs.get("complete") else 0
+    logger.debug(f"{crypto_id}: gap {gap_start} - {gap_end} fetched, {appended} rows stored, {empty} hours empty.")
+
+def iter_prefetched_currencies(crypto_list, start_date, end_date, chunk_size=FETCH_WORKERS):
+    """
+    Yield the cryptocurrencies in order, filling the local history store of `chunk_size` of them at a time
+    (see prefetch_missing_history) right before they are yielded, so fetching keeps pace with processing
+    instead of finishing all symbols first.
+    """
+    crypto_list = list(crypto_list)
+    for i in range(0, len(crypto_list), chunk_size):
+        chunk = crypto_list[i:i + chunk_size]
+        prefetch_missing_history(chunk, start_date, end_date)
+        yield from chunk
+
+def fetch_extended_df(crypto_id: str, start_date, end_date, api_key=None, fetch_missing=True):
+    """
+    Get extended historical data for a cryptocurrency from the local history store.
+
+    Hours missing in the store are fetched through get_data.fetch_historical_data
+    (one request run per contiguous gap) and appended to the store first (see store_fetched_gap).
 
     :param crypto_id: Cryptocurrency identifier (e.g., 'BTC').
-    :param total_hours: Total number of hours to fetch.
+    :param start_date: Start of the extended range (inclusive).
+    :param end_date: End of the extended range (inclusive).
+    :param api_key: API key for authentication (optional).
+    :param fetch_missing: Set False when the store was already filled by prefetch_missing_history.
     :return: DataFrame with historical data or None if data is empty.
     """
-    
-    extended_df = get_data.fetch_historical_data(crypto_id, start_date, end_date, api_key)
+    missing_ranges = history_store.find_missing_ranges(crypto_id, start_date, end_date) if fetch_missing else []
+    logger.debug(f"{crypto_id}: {len(missing_ranges)} missing ranges in local history store.")
+
+    for gap_start, gap_end in missing_ranges:
+        gap_df = get_data.fetch_historical_data(crypto_id, gap_start, gap_end, api_key)
+        store_fetched_gap(crypto_id, gap_start, gap_end, gap_df)
+
+    extended_df = history_store.load_from_store(crypto_id, start_date, end_date)
     logger.debug(f"5 debug df call: {extended_df.head()}")
 
     if extended_df.empty:
@@ -111,12 +185,66 @@ def fetch_extended_df(crypto_id: str, start_date, end_date, api_key=None):
     )
     return extended_df
 
+def normalize_hourly_grid(extended_df):
+    """
+    Put historical data onto a contiguous hourly grid, so that row positions map directly to hours.
+
+    Interior gaps (hours missing in the source data) are forward-filled. After this, the row of any
+    datetime is found by arithmetic (see hour_position) and windows are taken as positional slices.
+    Prices are rounded to the precision of `historical_data`, so a grid read back from Postgres (backtest
+    queue workers) is identical to the in-process one and both hit the same fit result cache entries.
+
+    Args:
+        extended_df (DataFrame): Historical dataset with columns ['date', 'price'].
+
+    Returns:
+        DataFrame: Dataset with columns ['date', 'price'] and one row per hour.
+    """
+    df = extended_df[["date", "price"]].drop_duplicates(subset="date").set_index("date").sort_index()
+    grid_index = pd.date_range(df.index[0], df.index[-1], freq="h", name="date")
+    grid_df = df.reindex(grid_index)
+
+    filled_hours = int(grid_df["price"].isna().sum())
+    if filled_hours:
+        logger.warning(f"{filled_hours} missing hours forward-filled on the hourly grid.")
+        grid_df["price"] = grid_df["price"].ffill()
+
+    grid_df["price"] = grid_df["price"].round(db_utils_postgres.HISTORICAL_VALUE_DECIMALS)
+    return grid_df.reset_index()
+
+def hour_position(grid_df, dt):
+    """
+    Row position of a datetime on the hourly grid built by normalize_hourly_grid (may lie outside the grid).
+    """
+    return int((pd.Timestamp(dt) - grid_df["date"].iat[0]) // pd.Timedelta(hours=1))
+
+def window_bounds(grid_df, current_dt, window_size):
+    """
+    Row positions (lo, hi) of the window [current_dt - window_size hours, current_dt] on the hourly grid,
+    clipped to the grid (so the window may hold fewer than window_size + 1 rows).
+    """
+    pos = hour_position(grid_df, current_dt)
+    lo = max(pos - window_size, 0)
+    hi = min(pos, len(grid_df) - 1) + 1
+    return lo, max(hi, lo)
+
+def get_window_df(grid_df, current_dt, window_size):
+    """
+    Positional slice of the hourly grid covering [current_dt - window_size hours, current_dt].
+
+    Returns:
+        DataFrame: Slice of grid_df (no boolean masking, no copy), possibly shorter than
+                   window_size + 1 rows at the edges of the grid.
+    """
+    lo, hi = window_bounds(grid_df, current_dt, window_size)
+    return grid_df.iloc[lo:hi]
+
 def get_train_df(extended_df, current_dt, training_dataset_size, crypto_id, model_name):
     """
     Extracts the training dataset for a specific time window.
 
     Args:
-        extended_df (DataFrame): Full historical dataset.
+        extended_df (DataFrame): Full historical dataset on the hourly grid (see normalize_hourly_grid).
         current_dt (datetime): Current datetime being processed.
         training_dataset_size (int): Number of hours required for training.
         crypto_id (str): Cryptocurrency ID.
@@ -125,14 +253,7 @@ def get_train_df(extended_df, current_dt, training_dataset_size, crypto_id, mode
     Returns:
         DataFrame: Training dataset for the model, or None if data is insufficient.
     """
-    logger.debug(f"6 debug df call: {extended_df.head()}")
-
-    train_df = extended_df[
-        (extended_df["date"] >= current_dt - timedelta(hours=training_dataset_size)) &
-        (extended_df["date"] <= current_dt)
-    ]
-    
-    logger.debug(f"7 debug df call: {train_df.head()}")
+    train_df = get_window_df(extended_df, current_dt, training_dataset_size)
     
     if len(train_df) < training_dataset_size:
         logger.debug(f"Not enough training data for {crypto_id} - {model_name} at {current_dt}, skipping.")
@@ -145,7 +266,7 @@ def get_forecast_input_df(extended_df, current_dt, forecast_dataset_size, crypto
     Extracts the forecast input dataset for a specific time window.
 
     Args:
-        extended_df (DataFrame): Full historical dataset.
+        extended_df (DataFrame): Full historical dataset on the hourly grid (see normalize_hourly_grid).
         current_dt (datetime): Current datetime being processed.
         forecast_dataset_size (int): Number of hours required for forecasting.
         crypto_id (str): Cryptocurrency ID.
@@ -154,10 +275,7 @@ def get_forecast_input_df(extended_df, current_dt, forecast_dataset_size, crypto
     Returns:
         DataFrame: Forecast input dataset for the model, or None if data is insufficient.
     """
-    forecast_input_df = extended_df[
-        (extended_df["date"] >= current_dt - timedelta(hours=forecast_dataset_size)) &
-        (extended_df["date"] <= current_dt)
-    ]
+    forecast_input_df = get_window_df(extended_df, current_dt, forecast_dataset_size)
 
     if len(forecast_input_df) < forecast_dataset_size:
         logger.debug(f"Not enough forecast input data for {crypto_id} - {model_name} at {current_dt}, skipping.")
@@ -165,25 +283,32 @@ def get_forecast_input_df(extended_df, current_dt, forecast_dataset_size, crypto
 
     return forecast_input_df
 
-def initialize_model_tracking():
+def initialize_model_tracking(model_names=None):
     """
     Initialize tracking dictionaries for retraining and forecasting.
+
+    Args:
+        model_names (Iterable[str], optional): Model names to track. Defaults to MODEL_PARAMETERS keys.
     
     Returns:
         Tuple[dict, dict]: Dictionaries for model_last_retrain and model_last_forecast.
     """
-    model_last_retrain = {model: None for model in MODEL_PARAMETERS.keys()}
-    model_last_forecast = {model: None for model in MODEL_PARAMETERS.keys()}
+    model_names = list(model_names or MODEL_PARAMETERS.keys())
+    model_last_retrain = {model: None for model in model_names}
+    model_last_forecast = {model: None for model in model_names}
     
     return model_last_retrain, model_last_forecast
 
-def retrain_in_hour_cycle(*, model_name, params, sub_df, current_dt, crypto_id, model_last_retrain):
+def retrain_in_hour_cycle(*, model_name, params, sub_df, current_dt, crypto_id, model_last_retrain, prefitted=None,
+                          start_params=None, drift_monitor=None):
     """
     Handle model retraining for a specific hour.
 
     This function determines whether the model requires retraining based on the elapsed time
-    since the last retraining. If retraining is necessary, the model is trained using the provided
-    historical data and saved. If retraining is not required, no action is taken.
+    since the last retraining, or, with a drift monitor, also on the realized error of the model's
+    recent forecasts. If retraining is necessary, the model is trained using the provided
+    historical data and put into the in-memory model cache (persisted at checkpoints).
+    If retraining is not required, no action is taken.
 
     Args:
         model_name (str): The name of the model being processed. This is used for logging and 
@@ -196,6 +321,14 @@ def retrain_in_hour_cycle(*, model_name, params, sub_df, current_dt, crypto_id,
         crypto_id (str): The cryptocurrency identifier (e.g., 'BTC', 'ETH') for which the model is being processed.
         model_last_retrain (dict): A dictionary tracking the last retrain times for each model. 
                                    The key is the model name, and the value is the datetime of the last retraining.
+        prefitted (optional): Model already fitted for this retrain point (see prefit_retrain_events),
+                              or the exception its fit raised. Skips fitting here.
+                              Otherwise the fit is loaded from the result cache or runs within its time budget
+                              (models_processing.fit_model_cached);
+                              a fit over budget is counted in fit_timeouts and the previous model stays in use.
+        start_params (optional): Optimizer start values for a warm-started fit (see models_processing.get_start_params).
+        drift_monitor (DriftMonitor, optional): Realized error of the current model. The model retrains before
+                                                'model_update_interval' passed if its error crossed the threshold.
 
     Returns:
         None
@@ -215,23 +348,39 @@ def retrain_in_hour_cycle(*, model_name, params, sub_df, current_dt, crypto_id,
         if hours_since_retrain >= update_interval:
             logger.debug(f"[{crypto_id} - {model_name}] Update interval exceeded. Marking for retraining.")
             do_retrain = True
+        elif drift_monitor is not None and drift_monitor.drifted(current_dt):
+            logger.debug(f"[{crypto_id} - {model_name}] Forecast error drifted. Marking for retraining.")
+            do_retrain = True
 
     if do_retrain:
         try:
-            model_fit = models_processing.fit_model_any(sub_df, model_name)
-            models_processing.save_model(crypto_id, model_name, model_fit)
+            if isinstance(prefitted, Exception):
+                raise prefitted
+            model_fit = prefitted if prefitted is not None else models_processing.fit_model_cached(
+                sub_df, model_name, params, start_params=start_params
+            )
+            model_cache.put(crypto_id, model_name, params, current_dt, model_fit)
             model_last_retrain[model_name] = current_dt
-            logger.debug(f"[{crypto_id} - {model_name}] Model retrained and saved.")
+            if drift_monitor is not None:
+                drift_monitor.reset()
+            logger.debug(f"[{crypto_id} - {model_name}] Model retrained and cached.")
+        except TimeoutError as e:
+            fit_timeouts[(crypto_id, model_name)] += 1
+            logger.warning(
+                f"[{crypto_id} - {model_name}] Retrain at {current_dt} abandoned: {e}. "
+                f"Keeping the model of {model_last_retrain[model_name]}."
+            )
         except Exception as e:
             logger.error(f"[{crypto_id} - {model_name}] Error during retraining: {e}")
 
-def forecast_in_hour_cycle(*, model_name, params, sub_df, current_dt, crypto_id, conn, model_last_forecast):
+def forecast_in_hour_cycle(*, model_name, params, sub_df, current_dt, crypto_id, conn, model_last_forecast, retrain_dt=None,
+                           write_buffer=None):
     """
     Handle forecasting for a specific hour.
 
     This function checks whether a new forecast is needed based on the elapsed time since the
-    last forecast. If a forecast is required, the function attempts to load the existing model,
-    generates predictions for the specified number of hours, and saves the forecast results to the database.
+    last forecast. If a forecast is required, the function takes the model of the last retrain from
+    the in-memory model cache (falling back to the saved model on disk), generates predictions for the specified number of hours, and saves the forecast results to the database.
 
     Args:
         model_name (str): The name of the model being used for forecasting.
@@ -244,6 +393,9 @@ def forecast_in_hour_cycle(*, model_name, params, sub_df, current_dt, crypto_id,
         conn (Connection): A database connection object used to save the forecast results.
         model_last_forecast (dict): A dictionary tracking the last forecast times for each model. 
                                     The key is the model name, and the value is the datetime of the last forecast.
+        retrain_dt (datetime, optional): Datetime of the retrain that produced the model to use.
+        write_buffer (ForecastWriteBuffer, optional): Buffer collecting forecast rows for bulk writes.
+                                                      Without it the forecast is written immediately.
 
     Returns:
         None
@@ -267,18 +419,794 @@ def forecast_in_hour_cycle(*, model_name, params, sub_df, current_dt, crypto_id,
 
     if do_forecast:
         try:
-            logger.debug(f"[{crypto_id} - {model_name}] Loading existing model for forecasting.")
-            model_fit = models_processing.load_model(crypto_id, model_name)
-            logger.debug(f"[{crypto_id} - {model_name}] Model loaded successfully.")
+            model_fit = model_cache.get(crypto_id, model_name, params, retrain_dt)
+            if model_fit is None:
+                logger.debug(f"[{crypto_id} - {model_name}] Model not cached, loading existing model for forecasting.")
+                model_fit = models_processing.load_model(crypto_id, model_name)
+                logger.debug(f"[{crypto_id} - {model_name}] Model loaded successfully.")
 
             df_forecast = create_forecast_dataframe(sub_df, model_fit, steps=forecast_hours)
-            models_processing.load_to_db_forecast(df_forecast, crypto_id, model_name, params, conn, zero_step_ts, config_start, config_end) #created_at=current_dt)
-            logger.debug(f"[{crypto_id} - {model_name}] Forecast saved for {current_dt}.")
+            if write_buffer is not None:
+                write_buffer.add(db_utils_postgres.build_forecast_frame(
+                    df_forecast, crypto_id, model_name, params, zero_step_ts, config_start, config_end
+                ))
+                logger.debug(f"[{crypto_id} - {model_name}] Forecast buffered for {current_dt}.")
+            else:
+                models_processing.load_to_db_forecast(df_forecast, crypto_id, model_name, params, conn, zero_step_ts, config_start, config_end) #created_at=current_dt)
+                logger.debug(f"[{crypto_id} - {model_name}] Forecast saved for {current_dt}.")
             model_last_forecast[model_name] = current_dt
         except Exception as e:
             logger.error(f"[{crypto_id} - {model_name}] Error during forecasting: {e}")
 
-def fetch_predict_upload_ts(conn, model_params_dict, start_date, finish_date, crypto_list) -> bool:
+def forecast_segment_batched(*, crypto_id, members, grid_df, retrain_dt, conn, model_last_forecast, write_buffer):
+    """
+    Produce all forecasts between two retrains with one batched pass of the retrained model.
+
+    The parameters are fixed between retrains, so the model of retrain_dt is advanced over the hours
+    observed after its training window once, and the forecasts of every origin are taken along the way
+    (SlimForecaster.forecast_batch) as one (n_origins x forecast_hours) matrix. Models sharing the fit
+    (see group_models_by_fit) get their rows from the same matrix, computed once for the longest
+    horizon and sliced to each model's forecast_hours.
+    Models without a slim representation are forecast event by event with forecast_in_hour_cycle.
+
+    Args:
+        crypto_id (str): Cryptocurrency ID.
+        members (dict): Model name -> (params, ascending forecast datetimes) of the models using this fit.
+        grid_df (DataFrame): Historical dataset on the hourly grid.
+        retrain_dt (datetime): Datetime of the retrain that produced the model (None if there is none yet).
+        conn (psycopg2.connection): Active database connection.
+        model_last_forecast (dict): Last forecast times per model name.
+        write_buffer (ForecastWriteBuffer): Buffer collecting the forecast rows.
+
+    Returns:
+        None
+    """
+    members = {model_name: (params, dts) for model_name, (params, dts) in members.items() if dts}
+    if not members:
+        return
+
+    slim_model = None
+    lead_name, (lead_params, _) = next(iter(members.items()))
+    model_fit = model_cache.get(crypto_id, lead_name, lead_params, retrain_dt) if retrain_dt is not None else None
+    if model_fit is not None:
+        try:
+            slim_model = to_slim(model_fit)
+        except TypeError as e:
+            logger.debug(f"[{crypto_id} - {lead_name}] No batched forecasting: {e}")
+
+    if slim_model is None:
+        for model_name, (params, forecast_dts) in members.items():
+            for dt in forecast_dts:
+                forecast_in_hour_cycle(
+                    model_name=model_name,
+                    params=params,
+                    sub_df=get_forecast_input_df(grid_df, dt, params["forecast_dataset_size"], crypto_id, model_name),
+                    current_dt=dt,
+                    crypto_id=crypto_id,
+                    conn=conn,
+                    model_last_forecast=model_last_forecast,
+                    retrain_dt=retrain_dt,
+                    write_buffer=write_buffer,
+                )
+        return
+
+    all_dts = sorted(set().union(*(dts for _, dts in members.values())))
+    forecast_hours = max(params["forecast_hours"] for params, _ in members.values())
+    try:
+        # the training window ends at the retrain hour; every origin is the last row of its input window
+        last_pos = len(grid_df) - 1
+        retrain_pos = min(hour_position(grid_df, retrain_dt), last_pos)
+        origin_pos = np.array([min(hour_position(grid_df, dt), last_pos) for dt in all_dts])
+        new_values = grid_df["price"].to_numpy()[retrain_pos + 1:max(origin_pos.max(), retrain_pos) + 1]
+        forecasts = slim_model.forecast_batch(new_values, np.maximum(origin_pos - retrain_pos, 0), forecast_hours)
+    except Exception as e:
+        logger.error(f"[{crypto_id} - {lead_name}] Error during batched forecasting: {e}")
+        return
+    row_of = {dt: row for row, dt in enumerate(all_dts)}
+
+    for model_name, (params, forecast_dts) in members.items():
+        for dt in forecast_dts:
+            forecast_input_df = get_forecast_input_df(
+                grid_df, dt, params["forecast_dataset_size"], crypto_id, model_name
+            )
+            if forecast_input_df is None:
+                continue
+            try:
+                df_forecast = forecast_values_to_dataframe(
+                    forecast_input_df["date"].iat[-1],
+                    forecast_input_df["price"].iat[-1],
+                    forecasts[row_of[dt], :params["forecast_hours"]],
+                )
+                write_buffer.add(db_utils_postgres.build_forecast_frame(
+                    df_forecast, crypto_id, model_name, params, dt, START_DATE, FINISH_DATE
+                ))
+                model_last_forecast[model_name] = dt
+            except Exception as e:
+                logger.error(f"[{crypto_id} - {model_name}] Error during forecasting: {e}")
+
+    logger.debug(f"[{crypto_id} - {', '.join(members)}] {len(all_dts)} forecast origins of retrain {retrain_dt} buffered.")
+
+def prefit_retrain_events(*, crypto_id, model_name, params, grid_df, events, fit_workers):
+    """
+    Fit the models of all retrain events of one backtest in parallel.
+
+    Every retrain uses only its own training window, so the fits are independent and can run
+    in a process pool before any forecasting is done. Windows found in the result cache are not refitted.
+
+    Args:
+        crypto_id (str): Cryptocurrency ID.
+        model_name (str): Name of the model.
+        params (dict): Model configuration.
+        grid_df (DataFrame): Historical dataset on the hourly grid.
+        events (list): Backtest events (see build_event_schedule).
+        fit_workers (int): Number of worker processes.
+
+    Returns:
+        dict: Retrain datetime -> fitted model, or the exception raised while fitting.
+    """
+    prefitted = {}
+    futures = {}
+    with ProcessPoolExecutor(max_workers=fit_workers, mp_context=models_processing.process_context()) as executor:
+        for event in events:
+            if not event.retrain:
+                continue
+            train_df = get_train_df(
+                grid_df, event.dt, params["training_dataset_size"], crypto_id, model_name
+            )
+            if train_df is None:
+                prefitted[event.dt] = ValueError(f"not enough training data at {event.dt}")
+                continue
+            cached = result_cache.get_fit(models_processing.fit_cache_key(train_df, params))
+            if cached is not None:
+                prefitted[event.dt] = cached
+                continue
+            futures[executor.submit(models_processing.fit_model_cached, train_df, model_name, params)] = event.dt
+
+        logger.debug(f"[{crypto_id} - {model_name}] Fitting {len(futures)} retrain points with {fit_workers} workers.")
+        for future in as_completed(futures):
+            try:
+                prefitted[futures[future]] = future.result()
+            except Exception as e:
+                prefitted[futures[future]] = e
+
+    return prefitted
+
+def prefit_retrain_events_batched(*, crypto_id, model_name, params, grid_df, events, batch_fit):
+    """
+    Fit the models of all retrain events of one backtest with a single call of a batch fit function.
+    Windows found in the result cache are left out of the batch.
+
+    Args:
+        crypto_id (str): Cryptocurrency ID.
+        model_name (str): Name of the model.
+        params (dict): Model configuration.
+        grid_df (DataFrame): Historical dataset on the hourly grid.
+        events (list): Backtest events (see build_event_schedule).
+        batch_fit (callable): Batch fit function (see models_processing.get_batch_fit_function).
+
+    Returns:
+        dict: Retrain datetime -> fitted model, or the exception raised while fitting.
+    """
+    prefitted = {}
+    retrain_dts = []
+    windows = []
+    keys = []
+    for event in events:
+        if not event.retrain:
+            continue
+        lo, hi = window_bounds(grid_df, event.dt, params["training_dataset_size"])
+        if hi - lo < params["training_dataset_size"]:
+            prefitted[event.dt] = ValueError(f"not enough training data at {event.dt}")
+            continue
+        key = models_processing.fit_cache_key(grid_df.iloc[lo:hi], params)
+        cached = result_cache.get_fit(key)
+        if cached is not None:
+            prefitted[event.dt] = cached
+            continue
+        retrain_dts.append(event.dt)
+        windows.append((lo, hi))
+        keys.append(key)
+
+    if not windows:
+        return prefitted
+    logger.debug(f"[{crypto_id} - {model_name}] Fitting {len(windows)} retrain points in one batch.")
+    try:
+        model_fits = batch_fit(grid_df["price"].to_numpy(), windows, **params)
+    except Exception as e:
+        model_fits = [e] * len(windows)
+    for key, model_fit in zip(keys, model_fits):
+        if not isinstance(model_fit, Exception):
+            result_cache.put_fit(key, model_fit, keep_full=params.get("warm_start", False))
+    prefitted.update(zip(retrain_dts, model_fits))
+    return prefitted
+
+def window_history_hours(members):
+    """
+    Hours of history before an event that its retrain or forecasts read: the training slice of the
+    fitting model or the longest forecast input of the models sharing its fit.
+    """
+    return max(
+        next(iter(members.values()))["training_dataset_size"],
+        *(params["forecast_dataset_size"] for params in members.values()),
+    )
+
+def retrain_window_keys(grid_df, events, members):
+    """
+    Content keys (result_cache.window_key) of the retrain windows of a schedule.
+
+    A retrain window is a retrain event and the forecast events up to the next retrain. Its key covers
+    the prices from the start of the training slice (or of a longer forecast input) up to its last event.
+
+    Returns:
+        dict: Retrain datetime -> window key.
+    """
+    history_size = window_history_hours(members)
+    prices = grid_df["price"].to_numpy()
+    starts = [i for i, event in enumerate(events) if event.retrain]
+
+    keys = {}
+    for i, j in zip(starts, starts[1:] + [len(events)]):
+        window_events = events[i:j]
+        lo, _ = window_bounds(grid_df, window_events[0].dt, history_size)
+        _, hi = window_bounds(grid_df, window_events[-1].dt, 0)
+        keys[events[i].dt] = result_cache.window_key(
+            grid_df["date"].iat[lo], prices[lo:hi], members, window_events, PROPAGATE_MODEL_STATE
+        )
+    return keys
+
+def reuse_window_fit(*, crypto_id, members, grid_df, retrain_dt, model_last_retrain):
+    """
+    Take the fit of an unchanged retrain window from the result cache, for all models sharing it,
+    as if the window had just retrained.
+
+    Returns:
+        bool: True if the fit was found and the window can be skipped.
+    """
+    lead_name, lead_params = next(iter(members.items()))
+    train_df = get_train_df(grid_df, retrain_dt, lead_params["training_dataset_size"], crypto_id, lead_name)
+    model_fit = result_cache.get_fit(models_processing.fit_cache_key(train_df, lead_params)) if train_df is not None else None
+    if model_fit is None:
+        logger.debug(f"[{crypto_id} - {lead_name}] Fit of the unchanged window at {retrain_dt} not cached, rerunning it.")
+        return False
+    for name, params in members.items():
+        model_cache.put(crypto_id, name, params, retrain_dt, model_fit)
+        model_last_retrain[name] = retrain_dt
+    return True
+
+def find_backtest_checkpoint(conn, crypto_id, members, start_naive):
+    """
+    Checkpoint (see save_backtest_checkpoint) to resume a backtest of models sharing one fit from.
+
+    A checkpoint is only used if every member has one, written for its current config and start_naive,
+    and all of them stopped at the same event.
+
+    Args:
+        conn (psycopg2.connection): Active database connection.
+        crypto_id (str): Cryptocurrency ID.
+        members (dict): Model name -> params of the models sharing one fit; the first one fits.
+        start_naive (datetime): First hour of the backtest.
+
+    Returns:
+        dict: Checkpoint row of the first member, or None if the backtest has to start from scratch.
+    """
+    rows = db_utils_postgres.load_backtest_checkpoints(conn, crypto_id, members)
+    lead_row = rows.get(next(iter(members)))
+    if lead_row is None:
+        return None
+
+    for name, params in members.items():
+        row = rows.get(name)
+        if (row is None
+                or row["config_signature"] != model_config_signature(params)
+                or pd.Timestamp(row["config_start"]) != pd.Timestamp(start_naive)
+                or row["last_event_ts"] != lead_row["last_event_ts"]):
+            logger.info(f"[{crypto_id} - {name}] Checkpoint does not match the current config, starting from scratch.")
+            return None
+    return lead_row
+
+def save_backtest_checkpoint(*, crypto_id, members, conn, write_buffer, model_last_retrain, start_naive, last_event_dt):
+    """
+    Record that a backtest of models sharing one fit completed all its events up to last_event_dt.
+
+    The buffered forecasts are written first, and the model of the last retrain is saved as the
+    checkpoint model (models_processing.save_checkpoint_model), so a checkpoint never claims work
+    that is not stored. Once any write of the buffer failed, no further checkpoint is saved from it.
+
+    Returns:
+        bool: True if the checkpoint was saved.
+    """
+    pending = len(write_buffer)
+    if (write_buffer.flush() == 0 and pending) or write_buffer.failed:
+        logger.warning(f"[{crypto_id} - {', '.join(members)}] Forecasts not written, checkpoint skipped.")
+        return False
+
+    lead_name, lead_params = next(iter(members.items()))
+    last_retrain = model_last_retrain[lead_name]
+    model_artifact = None
+    try:
+        model_fit = model_cache.get(crypto_id, lead_name, lead_params, last_retrain) if last_retrain else None
+        if model_fit is not None:
+            model_artifact = models_processing.save_checkpoint_model(crypto_id, lead_name, model_fit)
+    except Exception as e:
+        logger.warning(f"[{crypto_id} - {lead_name}] Checkpoint model not saved, checkpoint skipped: {e}")
+        return False
+
+    rows = [
+        {
+            "currency": crypto_id,
+            "model": name,
+            "config_signature": model_config_signature(params),
+            "config_start": start_naive,
+            "last_event_ts": last_event_dt,
+            "last_retrain_ts": last_retrain,
+            "model_artifact": model_artifact,
+        }
+        for name, params in members.items()
+    ]
+    saved = db_utils_postgres.save_backtest_checkpoints(conn, rows)
+    if saved:
+        logger.debug(f"[{crypto_id} - {', '.join(members)}] Checkpoint saved at {last_event_dt}.")
+    return saved
+
+def restore_backtest_state(*, crypto_id, members, events, resume_after, model_last_retrain, model_last_forecast,
+                           checkpoint=None):
+    """
+    Restore the state of a backtest that already went through all its events up to resume_after.
+
+    The last retrain and forecast times are taken from the schedule, and the model of the last retrain
+    is taken from the model cache or, if another process ran the earlier part, from its persisted
+    checkpoint (the newest model of the pair, see ModelCache.checkpoint). With a checkpoint row (see
+    find_backtest_checkpoint) the last retrain and its model are taken from there instead. Without one,
+    every retrain point of the schedule is taken as a retrain, which does not hold for the retrain checks
+    of the drift policy (run_model_backtest does not resume those without a checkpoint).
+
+    Args:
+        crypto_id (str): Cryptocurrency ID.
+        members (dict): Model name -> params of the models sharing one fit; the first one fits.
+        events (list): Schedule of the backtest (see build_shared_event_schedule).
+        resume_after (datetime): Last hour already processed.
+        model_last_retrain (dict): Last retrain times per model name (updated in place).
+        model_last_forecast (dict): Last forecast times per model name (updated in place).
+        checkpoint (dict, optional): Checkpoint row of the first member.
+
+    Returns:
+        list: The events still to be processed (dt > resume_after).
+    """
+    done = [event for event in events if event.dt <= resume_after]
+    for event in done:
+        for forecast_model in event.forecast_models:
+            model_last_forecast[forecast_model] = event.dt
+
+    if checkpoint is not None:
+        last_retrain = checkpoint["last_retrain_ts"]
+    else:
+        last_retrain = max((event.dt for event in done if event.retrain), default=None)
+    if last_retrain is not None:
+        lead_name, lead_params = next(iter(members.items()))
+        model_fit = model_cache.get(crypto_id, lead_name, lead_params, last_retrain)
+        if model_fit is None:
+            try:
+                if checkpoint is not None and checkpoint["model_artifact"]:
+                    model_fit = models_processing.load_model_file(checkpoint["model_artifact"])
+                else:
+                    model_fit = models_processing.load_model(crypto_id, lead_name)
+            except Exception as e:
+                logger.warning(f"[{crypto_id} - {lead_name}] Cannot restore the model of {last_retrain}: {e}")
+        if model_fit is not None:
+            for name, params in members.items():
+                model_cache.put(crypto_id, name, params, last_retrain, model_fit)
+                model_last_retrain[name] = last_retrain
+
+    logger.debug(f"[{crypto_id} - {', '.join(members)}] Resuming after {resume_after}, last retrain {last_retrain}.")
+    return [event for event in events if event.dt > resume_after]
+
+def run_model_backtest(*, crypto_id, model_name, params, grid_df, start_naive, finish_naive, conn,
+                       model_last_retrain, model_last_forecast, fit_workers=1, write_buffer=None, dependents=None,
+                       resume_after=None, checkpoint=None, skip_unchanged=None):
+    """
+    Run the backtest of one model for one cryptocurrency.
+
+    Instead of stepping through every hour, the retrain and forecast timestamps are precomputed
+    with build_shared_event_schedule and only those events are visited. Windows are sliced only for the
+    action that is actually due. A retrain that fails is not retried before its next scheduled time.
+
+    With fit_workers > 1 all retrain points are fitted in parallel first (prefit_retrain_events),
+    and the events are then replayed against the resulting models. Models whose fit function has a
+    batch companion (e.g. model_fits.fit_ridge_ar_model) fit all retrain points in one call instead.
+
+    With params['warm_start'] every retrain starts from the parameters of the previous one. Such fits depend
+    on each other, so they are not prefitted in parallel.
+
+    With params['drift_threshold'] the retrain points of the schedule are retrain checks: the forecasts made
+    so far are scored against the observed prices (DriftMonitor) and the model retrains only if their error
+    drifted or 'model_update_interval' hours passed. Such retrains are not known up front, so they are not prefitted.
+    A resumed backtest reads the forecasts of its current model back from forecast_data into the monitor.
+
+    With PROPAGATE_MODEL_STATE every forecast starts at its own hour: the forecasts between two retrains
+    are collected and produced in one batched pass of the retrained model (see forecast_segment_batched).
+
+    Models in `dependents` share this model's fit signature (see group_models_by_fit): every retrain is
+    fitted once and cached for all of them, and their forecasts are sliced from the same batched pass.
+
+    With resume_after the schedule still starts at start_naive, but only the events after resume_after
+    are processed, continuing an earlier run of the same backtest (see restore_backtest_state).
+
+    With checkpoint (BACKTEST_CHECKPOINTS by default) the progress is saved to backtest_checkpoints at
+    retrain points, at most every BACKTEST_CHECKPOINT_SECONDS, and at the end; a backtest with a matching
+    checkpoint continues after it (see find_backtest_checkpoint), also if resume_after is later. A drift-policy
+    backtest without a checkpoint starts from scratch, since its retrains cannot be read from the schedule.
+
+    With skip_unchanged (RESULT_CACHE_ENABLED by default) the key of every retrain window whose forecasts are
+    stored is saved to backtest_windows (see retrain_window_keys). A rerun skips the windows whose key is
+    unchanged and whose fit is in the result cache: their forecasts are neither recomputed nor rewritten.
+    Windows of warm-started and drift-policy models depend on the windows before them and are always run.
+
+    Args:
+        crypto_id (str): Cryptocurrency ID.
+        model_name (str): Name of the model.
+        params (dict): Model configuration (see config_models.MODEL_PARAMETERS).
+        grid_df (DataFrame): Historical dataset on the hourly grid (see normalize_hourly_grid).
+        start_naive (datetime): First hour of the backtest.
+        finish_naive (datetime): Last hour of the backtest (inclusive).
+        conn (psycopg2.connection): Active database connection.
+        model_last_retrain (dict): Last retrain times per model name.
+        model_last_forecast (dict): Last forecast times per model name.
+        fit_workers (int): Worker processes for parallel fitting of retrain points. 1 fits inline.
+        write_buffer (ForecastWriteBuffer, optional): Shared buffer for forecast rows. If not given, the
+                                                      backtest uses its own buffer and flushes it at the end.
+        dependents (dict, optional): Model name -> params of further models sharing this model's fit.
+        resume_after (datetime, optional): Last hour processed by an earlier run of this backtest.
+        checkpoint (bool, optional): Save and resume from checkpoints. Defaults to BACKTEST_CHECKPOINTS.
+        skip_unchanged (bool, optional): Skip unchanged retrain windows. Defaults to RESULT_CACHE_ENABLED.
+
+    Returns:
+        None
+    """
+    members = {model_name: params, **(dependents or {})}
+    events = build_shared_event_schedule(start_naive, finish_naive, members)
+
+    checkpoint = BACKTEST_CHECKPOINTS if checkpoint is None else checkpoint
+    saved_checkpoint = find_backtest_checkpoint(conn, crypto_id, members, start_naive) if checkpoint else None
+    if saved_checkpoint is not None:
+        # the checkpoint records the real last retrain; events it does not cover are redone (forecasts are upserted)
+        resume_after = saved_checkpoint["last_event_ts"]
+        logger.info(f"[{crypto_id} - {', '.join(members)}] Resuming from checkpoint at {resume_after}.")
+    elif resume_after is not None and uses_drift_policy(params):
+        # drift retrains are not in the schedule, so without a checkpoint the model in use at resume_after is unknown
+        logger.info(f"[{crypto_id} - {', '.join(members)}] No checkpoint of the drift retrains, rerunning from {start_naive}.")
+        resume_after = None
+
+    if resume_after is not None:
+        events = restore_backtest_state(
+            crypto_id=crypto_id,
+            members=members,
+            events=events,
+            resume_after=resume_after,
+            model_last_retrain=model_last_retrain,
+            model_last_forecast=model_last_forecast,
+            checkpoint=saved_checkpoint,
+        )
+    logger.debug(f"[{crypto_id} - {', '.join(members)}] {len(events)} scheduled events.")
+
+    own_buffer = write_buffer is None
+    if own_buffer:
+        write_buffer = db_utils_postgres.ForecastWriteBuffer(conn)
+
+    segments = {name: [] for name in members}  # forecasts waiting for a batched pass of the current model
+
+    warm_start = params.get("warm_start", False)
+
+    drift_monitor = None
+    if uses_drift_policy(params):
+        drift_monitor = DriftMonitor.from_params(grid_df, params)
+        if resume_after is not None and model_last_retrain[model_name] is not None:
+            # the forecasts of the current model made before resuming still count towards its drift
+            drift_monitor.observe(db_utils_postgres.load_forecast_steps(
+                conn, crypto_id, members, model_last_retrain[model_name], resume_after
+            ))
+        write_buffer = MonitoredWriteBuffer(write_buffer, drift_monitor)
+
+    skip_unchanged = RESULT_CACHE_ENABLED if skip_unchanged is None else skip_unchanged
+    window_keys = {}
+    if skip_unchanged and not warm_start and drift_monitor is None:
+        window_keys = retrain_window_keys(grid_df, events, members)
+    stored_windows = db_utils_postgres.load_backtest_windows(conn, crypto_id, model_name) if window_keys else {}
+    unchanged = {dt for dt, key in window_keys.items() if stored_windows.get(dt) == key}
+    if unchanged:
+        logger.debug(f"[{crypto_id} - {model_name}] {len(unchanged)} of {len(window_keys)} retrain windows unchanged.")
+        events_to_fit = [event for event in events if event.dt not in unchanged]
+    else:
+        events_to_fit = events
+    completed_windows = []  # windows run here, saved to backtest_windows once their forecasts are stored
+
+    batch_fit = models_processing.get_batch_fit_function(params)
+
+    prefitted = {}
+    if drift_monitor is not None:
+        logger.debug(f"[{crypto_id} - {model_name}] Retraining on drift, retrain points are not prefitted.")
+    elif batch_fit is not None:
+        prefitted = prefit_retrain_events_batched(
+            crypto_id=crypto_id,
+            model_name=model_name,
+            params=params,
+            grid_df=grid_df,
+            events=events_to_fit,
+            batch_fit=batch_fit,
+        )
+    elif fit_workers > 1 and warm_start:
+        logger.debug(f"[{crypto_id} - {model_name}] Warm start enabled, fitting retrain points sequentially.")
+    elif fit_workers > 1:
+        prefitted = prefit_retrain_events(
+            crypto_id=crypto_id,
+            model_name=model_name,
+            params=params,
+            grid_df=grid_df,
+            events=events_to_fit,
+            fit_workers=fit_workers,
+        )
+
+    def flush_segment():
+        forecast_segment_batched(
+            crypto_id=crypto_id,
+            members={name: (members[name], list(dts)) for name, dts in segments.items()},
+            grid_df=grid_df,
+            retrain_dt=model_last_retrain[model_name],
+            conn=conn,
+            model_last_forecast=model_last_forecast,
+            write_buffer=write_buffer,
+        )
+        for dts in segments.values():
+            dts.clear()
+
+    def save_completed_windows():
+        rows = [
+            {"currency": crypto_id, "model": model_name, "window_start": dt, "window_key": window_keys[dt]}
+            for dt in completed_windows
+        ]
+        if rows and db_utils_postgres.save_backtest_windows(conn, rows):
+            completed_windows.clear()
+
+    def write_checkpoint(last_event_dt):
+        saved = save_backtest_checkpoint(
+            crypto_id=crypto_id,
+            members=members,
+            conn=conn,
+            write_buffer=write_buffer,
+            model_last_retrain=model_last_retrain,
+            start_naive=start_naive,
+            last_event_dt=last_event_dt,
+        )
+        if saved:
+            # the forecasts of the windows completed so far are stored now
+            save_completed_windows()
+
+    last_checkpoint = time.monotonic()
+    last_event_dt = None
+    skipping = False  # inside an unchanged retrain window
+    for event in events:
+        if event.retrain:
+            # forecasts collected so far belong to the model being replaced
+            flush_segment()
+            if checkpoint and last_event_dt is not None and time.monotonic() - last_checkpoint >= BACKTEST_CHECKPOINT_SECONDS:
+                write_checkpoint(last_event_dt)
+                last_checkpoint = time.monotonic()
+            skipping = event.dt in unchanged and reuse_window_fit(
+                crypto_id=crypto_id,
+                members=members,
+                grid_df=grid_df,
+                retrain_dt=event.dt,
+                model_last_retrain=model_last_retrain,
+            )
+        if skipping:
+            for forecast_model in event.forecast_models:
+                model_last_forecast[forecast_model] = event.dt
+            last_event_dt = event.dt
+            continue
+        if event.retrain:
+            train_df = None if event.dt in prefitted else get_train_df(
+                grid_df, event.dt, params["training_dataset_size"], crypto_id, model_name
+            )
+            start_params = None
+            if warm_start and model_last_retrain[model_name] is not None:
+                start_params = models_processing.get_start_params(
+                    model_cache.get(crypto_id, model_name, params, model_last_retrain[model_name])
+                )
+            retrain_in_hour_cycle(
+                model_name=model_name,
+                params=params,
+                sub_df=train_df,
+                current_dt=event.dt,
+                crypto_id=crypto_id,
+                model_last_retrain=model_last_retrain,
+                prefitted=prefitted.pop(event.dt, None),
+                start_params=start_params,
+                drift_monitor=drift_monitor,
+            )
+            if dependents and model_last_retrain[model_name] == event.dt:
+                # fan the new fit out to the models sharing it
+                model_fit = model_cache.get(crypto_id, model_name, params, event.dt)
+                for dependent_name, dependent_params in dependents.items():
+                    model_cache.put(crypto_id, dependent_name, dependent_params, event.dt, model_fit)
+                    model_last_retrain[dependent_name] = event.dt
+            if event.dt in window_keys and model_last_retrain[model_name] == event.dt:
+                completed_windows.append(event.dt)
+
+        for forecast_model in event.forecast_models:
+            if PROPAGATE_MODEL_STATE:
+                segments[forecast_model].append(event.dt)
+                continue
+            forecast_params = members[forecast_model]
+            forecast_input_df = get_forecast_input_df(
+                grid_df, event.dt, forecast_params["forecast_dataset_size"], crypto_id, forecast_model
+            )
+            forecast_in_hour_cycle(
+                model_name=forecast_model,
+                params=forecast_params,
+                sub_df=forecast_input_df,
+                current_dt=event.dt,
+                crypto_id=crypto_id,
+                conn=conn,
+                model_last_forecast=model_last_forecast,
+                retrain_dt=model_last_retrain[forecast_model],
+                write_buffer=write_buffer,
+            )
+        last_event_dt = event.dt
+
+    flush_segment()
+
+    if checkpoint and last_event_dt is not None:
+        write_checkpoint(last_event_dt)
+    elif completed_windows:
+        write_buffer.flush()
+        if not write_buffer.failed:
+            save_completed_windows()
+
+    if own_buffer:
+        write_buffer.flush()
+
+    if fit_timeouts[(crypto_id, model_name)]:
+        logger.warning(f"[{crypto_id} - {model_name}] {fit_timeouts[(crypto_id, model_name)]} fits exceeded their time budget.")
+
+    # checkpoint: persist the newest model of this backtest
+    for name in members:
+        model_cache.checkpoint(crypto_id, name)
+
+def group_models_by_fit(model_params_dict):
+    """
+    Group model configurations whose fitted models are identical.
+
+    Configs that differ only in forecasting settings (forecast_frequency, forecast_hours,
+    forecast_dataset_size, ...) have the same fit signature (model_cache.model_fit_signature),
+    so one of them fits and the others reuse its models.
+
+    Args:
+        model_params_dict (dict): Model configurations keyed by model name.
+
+    Returns:
+        list: (model_name, params, dependents) per group in config order, where dependents maps
+              the names of the other models of the group to their params.
+    """
+    groups = {}
+    for model_name, params in model_params_dict.items():
+        groups.setdefault(model_fit_signature(params), []).append((model_name, params))
+
+    model_groups = []
+    for members in groups.values():
+        (model_name, params), others = members[0], members[1:]
+        if others:
+            logger.info(f"Models {', '.join(name for name, _ in others)} share the fits of {model_name}.")
+        model_groups.append((model_name, params, dict(others)))
+    return model_groups
+
+def run_backtest_task(crypto_id, model_name, params, grid_df, start_naive, finish_naive, pg_config, fit_workers=1,
+                      dependents=None, resume_after=None):
+    """
+    Run one (currency, model) backtest as an independent task, e.g. inside a worker process.
+
+    The task opens and closes its own Postgres connection; forecasts are committed by the task itself.
+
+    Args:
+        crypto_id (str): Cryptocurrency ID.
+        model_name (str): Name of the model.
+        params (dict): Model configuration.
+        grid_df (DataFrame): Historical dataset on the hourly grid.
+        start_naive (datetime): First hour of the backtest.
+        finish_naive (datetime): Last hour of the backtest (inclusive).
+        pg_config (dict): Postgres configuration (already updated from environment).
+        fit_workers (int): Worker processes for parallel fitting of retrain points.
+        dependents (dict, optional): Models sharing this model's fit (see run_model_backtest).
+        resume_after (datetime, optional): Last hour processed by an earlier run (see run_model_backtest).
+
+    Returns:
+        Tuple[str, str]: (crypto_id, model_name) of the completed task.
+    """
+    conn = db_utils_postgres.postgres_connection(**pg_config)
+    try:
+        model_last_retrain, model_last_forecast = initialize_model_tracking([model_name, *(dependents or {})])
+        run_model_backtest(
+            crypto_id=crypto_id,
+            model_name=model_name,
+            params=params,
+            grid_df=grid_df,
+            start_naive=start_naive,
+            finish_naive=finish_naive,
+            conn=conn,
+            model_last_retrain=model_last_retrain,
+            model_last_forecast=model_last_forecast,
+            fit_workers=fit_workers,
+            dependents=dependents,
+            resume_after=resume_after,
+        )
+    finally:
+        conn.close()
+
+    return crypto_id, model_name
+
+def get_resume_points(conn, crypto_id, model_groups):
+    """
+    Forecast watermarks of the model groups of one cryptocurrency, for incremental runs.
+
+    A group continues after the oldest latest forecast of its members (forecasts are upserted, so
+    redoing a few of them is harmless); groups with a member without forecasts start from scratch.
+
+    Returns:
+        dict: Model name of the group's first member -> datetime to resume after (or None).
+    """
+    model_names = [name for model_name, _, dependents in model_groups for name in (model_name, *dependents)]
+    watermarks = db_utils_postgres.get_forecast_watermarks(conn, crypto_id, model_names)
+
+    resume_points = {}
+    for model_name, _, dependents in model_groups:
+        member_marks = [watermarks.get(name) for name in (model_name, *dependents)]
+        resume_points[model_name] = None if None in member_marks else min(member_marks)
+    return resume_points
+
+def get_resume_history_start(conn, crypto_id, model_groups, resume_points, start_naive):
+    """
+    First hour of history the model groups of one cryptocurrency read when they continue after their
+    resume points (or checkpoints, see run_model_backtest), for incremental runs.
+
+    A continuing group reads the hours from its last retrain on (the model advanced by the batched
+    forecasts), the training and forecast inputs of the events after its resume point and, under the
+    drift policy, the drift window before it. Without a checkpoint the last retrain is taken to be
+    within 'model_update_interval' hours before the resume point (see restore_backtest_state).
+
+    Returns:
+        datetime: First hour needed, or None if a group starts from scratch and needs the full history.
+    """
+    first_hours = []
+    for model_name, params, dependents in model_groups:
+        members = {model_name: params, **dependents}
+        checkpoint = find_backtest_checkpoint(conn, crypto_id, members, start_naive) if BACKTEST_CHECKPOINTS else None
+        if checkpoint is not None:
+            resume_after, last_retrain = checkpoint["last_event_ts"], checkpoint["last_retrain_ts"]
+        elif resume_points.get(model_name) is None or uses_drift_policy(params):
+            return None
+        else:
+            resume_after = resume_points[model_name]
+            last_retrain = resume_after - timedelta(hours=params["model_update_interval"])
+
+        lookback = window_history_hours(members)
+        if uses_drift_policy(params):
+            lookback += params.get("drift_window", DRIFT_WINDOW_HOURS)
+        first_hours.append(resume_after - timedelta(hours=lookback))
+        if last_retrain is not None:
+            first_hours.append(last_retrain)
+    return min(first_hours, default=None)
+
+def trim_history(extended_df, first_dt):
+    """
+    Rows of the historical dataset from first_dt on, keeping the last row before it (if first_dt itself
+    is missing, the hourly grid forward-fills from there as it would on the full dataset).
+    """
+    if first_dt is None:
+        return extended_df
+    earlier = extended_df["date"][extended_df["date"] <= first_dt]
+    keep_from = earlier.max() if not earlier.empty else first_dt
+    return extended_df[extended_df["date"] >= keep_from]
+
+def fetch_predict_upload_ts(conn, model_params_dict, start_date, finish_date, crypto_list,
+                            workers=None, pg_config=None, fit_workers=None, incremental=False, queue_batch=None) -> bool:
     """
     Execute the full data pipeline: fetch historical data, retrain models, generate forecasts, and upload results.
 
@@ -287,13 +1215,42 @@ def fetch_predict_upload_ts(conn, model_params_dict, start_date, finish_date, cr
       2. Iterates over each cryptocurrency.
       3. Loads extended historical data.
       4. Uploads training and historical data.
-      5. For each model:
-         - Retrieves training and forecast input windows.
-         - Handles retraining when due.
-         - Generates and saves forecasts as needed.
+      5. For each group of models sharing a fit signature, runs the precomputed schedule of retrain
+         and forecast events (see group_models_by_fit and run_model_backtest).
+
+    The steps run as concurrent stages connected by bounded queues (see pipeline_stages): fetching
+    (iter_prefetched_currencies) and the historical load work ahead on the next currencies while this
+    thread runs the backtests, and the forecast rows are written by a writer thread
+    (BackgroundWriteBuffer). A stage that gets PIPELINE_QUEUE_SIZE items ahead waits for the next one.
+
+    With more than one worker, every (currency, model) pair is submitted to a process pool
+    as run_backtest_task as soon as the currency's history is loaded.
+
+    Backtests interrupted in an earlier run continue from their checkpoints (see run_model_backtest).
+
+    With incremental, only the hours after the watermarks of earlier runs are processed: history rows
+    after the latest stored hour are loaded, and every model group continues after its latest forecast
+    (see get_resume_points), or its checkpoint if that is later. The backtests get the hourly grid only
+    from the first hour the continuing groups read (see get_resume_history_start), not the full range.
+    This is the hourly step of live mode.
+
+    With queue_batch, the backtests are not run here: every (currency, model group) is enqueued as a
+    job of that batch in `backtest_jobs` once the currency's history is loaded, for workers to claim
+    (see models.backtest_queue).
 
     Args:
         conn (psycopg2.connection): Active database connection.
+        model_params_dict (dict): Model configurations keyed by model name.
+        start_date (str): Backtest start date.
+        finish_date (str): Backtest finish date or 'now'.
+        crypto_list (list): Cryptocurrency IDs.
+        workers (int, optional): Worker processes. Defaults to BACKTEST_WORKERS.
+        pg_config (dict, optional): Postgres configuration for the connections of the stages and worker processes.
+                                    Defaults to PG_DB_CONFIG updated from environment.
+        fit_workers (int, optional): Worker processes for parallel fitting of the retrain points inside
+                                     each backtest. Defaults to FIT_WORKERS.
+        incremental (bool): Process only what is new since the previous run.
+        queue_batch (str, optional): Batch id to enqueue the backtests under instead of running them.
 
     Returns:
         bool: True if the pipeline completes without errors, False otherwise.
@@ -305,48 +1262,118 @@ def fetch_predict_upload_ts(conn, model_params_dict, start_date, finish_date, cr
             calculate_total_fetch_interval(start_date, finish_date, **model_params_dict)
         )
 
-        for crypto_id in crypto_list:
-            logger.info(f"Processing cryptocurrency: {crypto_id}")
-            model_last_retrain, model_last_forecast = initialize_model_tracking()
+        workers = workers or BACKTEST_WORKERS
+        fit_workers = fit_workers or FIT_WORKERS
+        pg_config = pg_config or db_utils_postgres.update_pg_config(PG_DB_CONFIG)
+        executor = None
+        futures = []
+        if workers > 1 and queue_batch is None:
+            # the stage threads below are running when the pool starts its workers, so they must not be forked
+            executor = ProcessPoolExecutor(max_workers=workers, mp_context=models_processing.process_context())
+            logger.info(f"Running backtests in {workers} worker processes.")
+
+        # forecast rows are written by the writer thread of the buffer, the history by the load stage
+        write_buffer = db_utils_postgres.BackgroundWriteBuffer(pg_config)
+        load_conn = db_utils_postgres.postgres_connection(**pg_config)
+        model_groups = group_models_by_fit(model_params_dict)
 
-            extended_df = fetch_extended_df(crypto_id, extended_start_dt, finish_date)
+        def fetch_stage(crypto_id):
+            return crypto_id, fetch_extended_df(crypto_id, extended_start_dt, finish_naive, fetch_missing=False)
+
+        def load_stage(fetched):
+            crypto_id, extended_df = fetched
+            if extended_df is None or extended_df.empty:
+                logger.warning(f"No history for {crypto_id}, skipping it.")
+                return None
+            history_watermark = db_utils_postgres.get_history_watermark(load_conn, crypto_id) if incremental else None
             db_utils_postgres.load_to_db_train_and_historical(
-                extended_df, crypto_id, conn, max_train_dataset_hours
+                extended_df, crypto_id, load_conn, max_train_dataset_hours, after=history_watermark
             )
+            if not incremental:
+                return crypto_id, normalize_hourly_grid(extended_df), {}
+            resume_points = get_resume_points(load_conn, crypto_id, model_groups)
+            history_start = get_resume_history_start(load_conn, crypto_id, model_groups, resume_points, start_naive)
+            return crypto_id, normalize_hourly_grid(trim_history(extended_df, history_start)), resume_points
 
-            for model_name, params in model_params_dict.items():
-                logger.debug(f"Processing model: {model_name} at {datetime.now()}")
-                current_dt = start_naive
-                while current_dt <= finish_naive:
-                    train_df = get_train_df(
-                        extended_df, current_dt, params["training_dataset_size"], crypto_id, model_name
-                    )
-                    forecast_input_df = get_forecast_input_df(
-                        extended_df, current_dt, params["forecast_dataset_size"], crypto_id, model_name
-                    )
+        # fetch -> historical load -> model backtests (this thread) -> forecast writes, all running concurrently
+        stop = threading.Event()
+        try:
+            fetched = start_stage(
+                "fetch", fetch_stage, iter_prefetched_currencies(crypto_list, extended_start_dt, finish_naive), stop
+            )
+            loaded = start_stage("load", load_stage, stage_results(fetched, stop), stop)
 
-                    retrain_in_hour_cycle(
-                        model_name=model_name,
-                        params=params,
-                        sub_df=train_df,
-                        current_dt=current_dt,
-                        crypto_id=crypto_id,
-                        model_last_retrain=model_last_retrain,
-                    )
+            for loaded_currency in stage_results(loaded, stop):
+                if loaded_currency is None:
+                    continue
+                crypto_id, grid_df, resume_points = loaded_currency
+                logger.info(f"Processing cryptocurrency: {crypto_id}")
+                model_last_retrain, model_last_forecast = initialize_model_tracking(model_params_dict.keys())
+
+                if queue_batch is not None:
+                    job_ids = db_utils_postgres.enqueue_backtest_jobs(conn, [
+                        {
+                            "batch_id": queue_batch,
+                            "currency": crypto_id,
+                            "model": model_name,
+                            "params": params,
+                            "dependents": dependents,
+                            "extended_start_ts": grid_df["date"].iat[0],
+                            "start_ts": start_naive,
+                            "finish_ts": finish_naive,
+                            "resume_after_ts": resume_points.get(model_name),
+                        }
+                        for model_name, params, dependents in model_groups
+                    ])
+                    logger.info(f"Enqueued {len(job_ids)} backtest jobs of {crypto_id} in batch {queue_batch}.")
+                    continue
+
+                for model_name, params, dependents in model_groups:
+                    if executor is not None:
+                        futures.append(executor.submit(
+                            run_backtest_task, crypto_id, model_name, params, grid_df, start_naive, finish_naive, pg_config,
+                            fit_workers, dependents, resume_points.get(model_name)
+                        ))
+                        continue
 
-                    forecast_in_hour_cycle(
+                    logger.debug(f"Processing model: {model_name} at {datetime.now()}")
+                    run_model_backtest(
+                        crypto_id=crypto_id,
                         model_name=model_name,
                         params=params,
-                        sub_df=forecast_input_df,
-                        current_dt=current_dt,
-                        crypto_id=crypto_id,
+                        grid_df=grid_df,
+                        start_naive=start_naive,
+                        finish_naive=finish_naive,
                         conn=conn,
+                        model_last_retrain=model_last_retrain,
                         model_last_forecast=model_last_forecast,
+                        fit_workers=fit_workers,
+                        write_buffer=write_buffer,
+                        dependents=dependents,
+                        resume_after=resume_points.get(model_name),
                     )
+                    logger.info(f"Completed model: {', '.join([model_name, *dependents])}")
+
+            write_buffer.flush()
 
-                    current_dt += timedelta(hours=1)
+            failed = 0
+            for future in as_completed(futures):
+                try:
+                    crypto_id, model_name = future.result()
+                    logger.info(f"Completed backtest task: {crypto_id} - {model_name}")
+                except Exception as e:
+                    failed += 1
+                    logger.error(f"Backtest task failed: {e}", exc_info=True)
+        finally:
+            stop.set()
+            write_buffer.close()
+            load_conn.close()
+            if executor is not None:
+                executor.shutdown(wait=True)
 
-                logger.info(f"Completed model: {model_name}")
+        if futures and failed:
+            logger.error(f"{failed} of {len(futures)} backtest tasks failed.")
+            return False
 
         logger.info("Data fetch-predict-upload cycle completed successfully.")
         return True
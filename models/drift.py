@@ -0,0 +1,110 @@
+import logging
+import numpy as np
+#
+from config.config_system import DRIFT_WINDOW_HOURS
+from config.config_metrics import EPSILON
+
+# initialize logger
+logger = logging.getLogger(__name__)
+
+def uses_drift_policy(params: dict) -> bool:
+    """
+    True if the model retrains on error drift (params['drift_threshold']) instead of on a fixed interval.
+    """
+    return params.get("drift_threshold") is not None
+
+def retrain_check_interval(params: dict) -> int:
+    """
+    Hours between the retrain points of a model's schedule: every 'model_update_interval' hours, or, under the
+    drift policy, every 'drift_check_interval' hours (defaults to 'forecast_frequency'), where a retrain
+    happens only if the model drifted or 'model_update_interval' hours passed since the last retrain.
+    """
+    if uses_drift_policy(params):
+        return params.get("drift_check_interval", params["forecast_frequency"])
+    return params["model_update_interval"]
+
+class DriftMonitor:
+    """
+    Realized error of the forecasts made by the current model of one backtest.
+
+    Forecast rows (see db_utils_postgres.build_forecast_frame) are observed as they are written; at a
+    retrain check the MAPE of all forecast steps that became realized within the last `window_hours`
+    hours is compared with `threshold`. Observations are dropped on every retrain (reset), so the error
+    always belongs to the model in use. A resumed backtest observes the stored forecasts of its current
+    model again (see engine.run_model_backtest), so it checks for drift as if it had never stopped.
+    """
+    def __init__(self, grid_df, threshold, window_hours=DRIFT_WINDOW_HOURS):
+        self.threshold = threshold
+        self.window_hours = window_hours
+        self._prices = grid_df["price"].to_numpy()
+        self._start = grid_df["date"].iat[0].to_datetime64()
+        self._positions = []
+        self._values = []
+
+    @classmethod
+    def from_params(cls, grid_df, params):
+        return cls(grid_df, params["drift_threshold"], params.get("drift_window", DRIFT_WINDOW_HOURS))
+
+    def _position(self, dt):
+        return int((np.datetime64(dt, "ns") - self._start) // np.timedelta64(1, "h"))
+
+    def observe(self, frame):
+        """
+        :param frame: forecast rows of one or more forecasts (step 0, the last observed price, is ignored).
+        """
+        if frame.empty:
+            return
+        steps = frame["forecast_step"].to_numpy() > 0
+        self._positions.append((frame["timestamp"].to_numpy()[steps] - self._start) // np.timedelta64(1, "h"))
+        self._values.append(frame["forecast_value"].to_numpy()[steps])
+
+    def reset(self):
+        self._positions.clear()
+        self._values.clear()
+
+    def error(self, current_dt) -> float:
+        """
+        :return: MAPE of the forecast steps realized in (current_dt - window_hours, current_dt], or NaN if there are none.
+        """
+        if not self._positions:
+            return np.nan
+        now = self._position(current_dt)
+        positions = np.concatenate(self._positions)
+        values = np.concatenate(self._values)
+        recent = positions > now - self.window_hours
+        # steps that fell out of the window are not needed for later checks
+        self._positions, self._values = [positions[recent]], [values[recent]]
+
+        in_window = recent & (positions <= now) & (positions < len(self._prices))
+        if not in_window.any():
+            return np.nan
+        actual = self._prices[positions[in_window]]
+        forecast = values[in_window]
+        return float(np.mean(np.abs(forecast - actual) / (np.abs(actual) + EPSILON)))
+
+    def drifted(self, current_dt) -> bool:
+        error = self.error(current_dt)
+        logger.debug(f"Realized error at {current_dt}: {error:.6g} (threshold {self.threshold}).")
+        return bool(error > self.threshold)
+
+class MonitoredWriteBuffer:
+    """
+    Write buffer wrapper that shows every forecast to a DriftMonitor before buffering it.
+    """
+    def __init__(self, write_buffer, monitor):
+        self.write_buffer = write_buffer
+        self.monitor = monitor
+
+    def __len__(self):
+        return len(self.write_buffer)
+
+    @property
+    def failed(self) -> bool:
+        return self.write_buffer.failed
+
+    def add(self, frame):
+        self.monitor.observe(frame)
+        self.write_buffer.add(frame)
+
+    def flush(self) -> int:
+        return self.write_buffer.flush()
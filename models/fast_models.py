@@ -0,0 +1,354 @@
+import numpy as np
+from statsmodels.tsa.holtwinters import ExponentialSmoothing
+from .model_artifacts import (
+    to_slim,
+    HoltWintersForecaster,
+    ThetaForecaster,
+    SeasonalNaiveForecaster,
+    DriftForecaster,
+)
+
+# ---------------------------------------------------------
+# [Fast model family]
+#   Pure NumPy fits for small hourly windows. They use the same `fit_func_name` / `specific_parameters`
+#   convention as model_fits.py and return slim forecasters directly, so saving, loading, caching
+#   and state propagation work exactly as for converted statsmodels results.
+#   Smoothing parameters are either fixed in `specific_parameters` or grid-searched by SSE, with the
+#   whole grid filtered in one vectorized pass over the window (plus a few refinement passes).
+#   Seasonal ETS is about 5x faster than statsmodels here, but keeps the heuristic initial states
+#   instead of optimizing them, so its forecasts differ from fit_ets_model by about 1% on average
+#   (a few % on some windows). Non-seasonal ETS fits fewer parameters and is no faster in NumPy,
+#   so fit_fast_ets_model hands it to statsmodels.
+# ---------------------------------------------------------
+COARSE_GRID = np.array([0.001, 0.01, 0.05, 0.1, 0.2, 0.3, 0.5, 0.7, 0.9, 0.99])
+REFINE_ROUNDS = 2
+REFINE_POINTS = 5
+
+def _prices(df) -> np.ndarray:
+    return df['price'].to_numpy(dtype=np.float64)
+
+def _grid_search(evaluate, axes):
+    """
+    minimize the SSE over a product grid, then refine around the best point.
+
+    :param evaluate: function of a (n_candidates, n_params) array returning a tuple (sse, *states),
+                     with the candidates along the last axis of every array.
+    :param axes: candidate values per parameter (a single value keeps the parameter fixed).
+    :return: tuple (best parameter vector, states of the best candidate).
+    """
+    def run(grid_axes):
+        candidates = np.stack(np.meshgrid(*grid_axes, indexing='ij'), axis=-1).reshape(-1, len(grid_axes))
+        sse, *states = evaluate(candidates)
+        best_idx = np.argmin(np.nan_to_num(sse, nan=np.inf))
+        return candidates[best_idx], [state[..., best_idx] for state in states]
+
+    axes = [np.atleast_1d(np.asarray(a, dtype=np.float64)) for a in axes]
+    best, states = run(axes)
+
+    steps = np.array([np.diff(a).max() / 2 if len(a) > 1 else 0.0 for a in axes])
+    for _ in range(REFINE_ROUNDS if steps.any() else 0):
+        local_axes = [
+            np.unique(np.clip(np.linspace(v - h, v + h, REFINE_POINTS), 1e-4, 1 - 1e-4)) if h > 0 else np.array([v])
+            for v, h in zip(best, steps)
+        ]
+        best, states = run(local_axes)
+        steps = steps / 2
+    return best, states
+
+def _smoothing_axis(specific_parameters, name):
+    value = specific_parameters.get(name)
+    return COARSE_GRID if value is None else [value]
+
+# ---------------------------------------------------------
+# [Exponential smoothing]
+# ---------------------------------------------------------
+def _initial_states(y, trend, seasonal, m):
+    """
+    heuristic initialization (as statsmodels initialization_method='heuristic', Hyndman et al. 2.6):
+    seasonal indices of a centered moving average over the first cycles, then level and slope from
+    a line through the first 10 points of the moving average.
+    windows shorter than 10 + 2 * (m // 2) points use the simple initialization (first two cycles).
+    """
+    min_obs = 10 + 2 * (m // 2)
+    if len(y) < min_obs:
+        level = y[:m].mean()
+        if trend == 'mul':
+            slope = np.mean((y[m:2 * m] / y[:m]) ** (1 / m))
+        else:
+            slope = np.mean(y[m:2 * m] - y[:m]) / m
+        seasons = y[:m] / level if seasonal == 'mul' else y[:m] - level
+        return level, slope if trend else 0.0, seasons
+
+    k_cycles = max(min(5, len(y) // m), int(np.ceil(min_obs / m)))
+    head = y[:m * k_cycles]
+    if m % 2 == 0:
+        filt = np.array([0.5] + [1.0] * (m - 1) + [0.5]) / m
+    else:
+        filt = np.repeat(1.0 / m, m)
+    moving_average = np.convolve(head, filt, mode='valid')
+    offset = (len(filt) - 1) // 2
+    centered = np.full(len(head), np.nan)
+    centered[offset:offset + len(moving_average)] = moving_average
+
+    detrended = head / centered if seasonal == 'mul' else head - centered
+    seasons = np.nanmean(detrended.reshape(k_cycles, m), axis=0)
+    seasons = seasons / seasons.mean() if seasonal == 'mul' else seasons - seasons.mean()
+
+    x = np.arange(1, 11, dtype=np.float64)
+    slope, level = np.polyfit(x, moving_average[:10], 1)
+    if trend == 'mul':
+        slope = 1 + slope / level
+    return level, slope if trend else 0.0, seasons
+
+def _holt_winters_filter(y, candidates, phi, trend, seasonal, m, level0, slope0, seasons0):
+    """
+    run the smoothing recursions for all candidates (columns alpha, beta, gamma) at once.
+
+    the loop over time is the only python-level loop; every step is a handful of in-place
+    array operations over the candidates.
+
+    :return: (sse, level, slope, last m + 1 seasonal states) per candidate.
+    """
+    n_cand = len(candidates)
+    alpha, beta, gamma = (np.ascontiguousarray(candidates[:, j]) for j in range(3))
+    alpha_c, beta_c, gamma_c = 1 - alpha, 1 - beta, 1 - gamma
+    level = np.full(n_cand, float(level0))
+    slope = np.full(n_cand, float(slope0))
+    # ring of the last m seasonal states (plus the one dropped last, kept for the forecaster)
+    seasons = [np.full(n_cand, float(v)) for v in seasons0] if seasonal else []
+    dropped = seasons[-1] if seasonal else None
+    sse = np.zeros(n_cand)
+    base = np.empty(n_cand)
+    err = np.empty(n_cand)
+    tmp = np.empty(n_cand)
+
+    with np.errstate(all='ignore'):
+        for i, value in enumerate(y):
+            if trend:
+                damped = slope ** phi if trend == 'mul' else (slope * phi if phi != 1.0 else slope)
+                np.multiply(level, damped, out=base) if trend == 'mul' else np.add(level, damped, out=base)
+            else:
+                base[:] = level
+
+            if seasonal:
+                s = seasons[i % m]
+                np.multiply(base, s, out=tmp) if seasonal == 'mul' else np.add(base, s, out=tmp)
+                np.subtract(value, tmp, out=err)
+                if seasonal == 'mul':
+                    new_level = alpha * (value / s)
+                    new_season = gamma * (value / base)
+                else:
+                    new_level = alpha * (value - s)
+                    new_season = gamma * (value - base)
+                new_level += alpha_c * base
+                new_season += gamma_c * s
+                dropped = s
+                seasons[i % m] = new_season
+            else:
+                np.subtract(value, base, out=err)
+                new_level = alpha * value
+                new_level += alpha_c * base
+            err *= err
+            sse += err
+
+            if trend:
+                growth = new_level / level if trend == 'mul' else new_level - level
+                growth *= beta
+                growth += beta_c * damped
+                slope = growth
+            level = new_level
+
+    n = len(y)
+    if seasonal:
+        # statsmodels layout: the state used at step n - 1, then the states for steps n .. n + m - 1
+        ordered = [seasons[(n + j) % m] for j in range(m)]
+        last_seasons = np.stack([dropped] + ordered, axis=0)
+    else:
+        last_seasons = np.empty((0, n_cand))
+    return sse, level, slope, last_seasons
+
+def _fit_statsmodels_holt(df, trend, damped_trend, phi, specific_parameters):
+    # non-seasonal ets: statsmodels optimizes the initial states too, at no extra cost over the numpy grid
+    model = ExponentialSmoothing(df['price'], trend=trend, damped_trend=damped_trend)
+    fixed = {
+        name: specific_parameters[name]
+        for name in ('smoothing_level', 'smoothing_trend')
+        if specific_parameters.get(name) is not None and (trend or name == 'smoothing_level')
+    }
+    if damped_trend:
+        fixed['damping_trend'] = phi
+    return to_slim(model.fit(**fixed))
+
+def fit_fast_ets_model(df, **kwargs):
+    """
+    numpy holt-winters training function (simple, holt or holt-winters depending on trend/seasonal).
+    parameters come from kwargs['specific_parameters'] like fit_ets_model (trend, seasonal, seasonal_periods),
+    plus optional damped_trend, damping_trend and fixed smoothing_level / smoothing_trend / smoothing_seasonal.
+    only seasonal configs use the numpy filter; simple and holt fits are statsmodels fits converted to slim form.
+    returns a HoltWintersForecaster.
+    """
+    specific_parameters = kwargs['specific_parameters']
+    trend = specific_parameters.get('trend')
+    seasonal = specific_parameters.get('seasonal')
+    m = int(specific_parameters.get('seasonal_periods') or 0) if seasonal else 0
+    damped_trend = bool(specific_parameters.get('damped_trend', False)) and bool(trend)
+    phi = float(specific_parameters.get('damping_trend', 0.98)) if damped_trend else 1.0
+
+    if not seasonal:
+        return _fit_statsmodels_holt(df, trend, damped_trend, phi, specific_parameters)
+
+    y = _prices(df)
+    if len(y) < 2 * m:
+        raise ValueError(f"at least {2 * m} observations are required for seasonal_periods={m}.")
+
+    level0, slope0, seasons0 = _initial_states(y, trend, seasonal, m)
+    axes = [
+        _smoothing_axis(specific_parameters, 'smoothing_level'),
+        _smoothing_axis(specific_parameters, 'smoothing_trend') if trend else [0.0],
+        _smoothing_axis(specific_parameters, 'smoothing_seasonal'),
+    ]
+
+    def evaluate(candidates):
+        return _holt_winters_filter(y, candidates, phi, trend, seasonal, m, level0, slope0, seasons0)
+
+    best, (level, slope, seasons) = _grid_search(evaluate, axes)
+
+    return HoltWintersForecaster(
+        trend=trend,
+        seasonal=seasonal,
+        seasonal_periods=m,
+        damped_trend=damped_trend,
+        smoothing_level=best[0],
+        smoothing_trend=best[1] if trend else None,
+        smoothing_seasonal=best[2],
+        damping_trend=phi,
+        level=level,
+        trend_state=slope,
+        seasons=seasons,
+    )
+
+# ---------------------------------------------------------
+# [Theta]
+# ---------------------------------------------------------
+def _has_seasonality(y, period):
+    """
+    acf test of statsmodels ThetaModel (90% level of a chi2(1)).
+    """
+    x = y - y.mean()
+    nobs = len(x)
+    acov = np.array([x[:nobs - k] @ x[k:] for k in range(period + 1)]) / nobs
+    rho = acov / acov[0]
+    stat = nobs * rho[-1] ** 2 / np.sum(rho[:-1] ** 2)
+    return stat > 2.705543454095404
+
+def _seasonal_indices(y, period, method):
+    """
+    classical decomposition (as statsmodels seasonal_decompose): centered moving average trend,
+    then normalized per-position means of the detrended series.
+    """
+    if period % 2 == 0:
+        filt = np.array([0.5] + [1.0] * (period - 1) + [0.5]) / period
+    else:
+        filt = np.repeat(1.0 / period, period)
+    offset = (len(filt) - 1) // 2
+
+    trend = np.full(len(y), np.nan)
+    trend[offset:offset + len(y) - len(filt) + 1] = np.convolve(y, filt, mode='valid')
+    detrended = y / trend if method == 'mul' else y - trend
+
+    averages = np.array([np.nanmean(detrended[i::period]) for i in range(period)])
+    if method == 'mul':
+        return averages / averages.mean()
+    return averages - averages.mean()
+
+def _ses_filter(y, alphas):
+    """
+    simple exponential smoothing with the initial level at the first observation, for all alphas at once.
+
+    the recursion is linear, so the levels are a convolution of y with the kernel (1 - alpha)^k,
+    computed with one fft for every alpha instead of a loop over time.
+
+    :return: (sse, one-step forecast) per alpha.
+    """
+    n = len(y)
+    alphas = np.asarray(alphas, dtype=np.float64)
+    decay = (1 - alphas)[:, None] ** np.arange(n + 1)
+    size = 2 * n
+    smoothed = np.fft.irfft(np.fft.rfft(y, size) * np.fft.rfft(decay[:, :n], size), size)[:, :n]
+
+    # level_t = (1 - alpha)^t * y_0 + alpha * sum_{j < t} (1 - alpha)^(t - 1 - j) * y_j
+    levels = decay * y[0]
+    levels[:, 1:] += alphas[:, None] * smoothed
+    sse = ((y - levels[:, :n]) ** 2).sum(axis=1)
+    return sse, levels[:, n]
+
+def fit_fast_theta_model(df, **kwargs):
+    """
+    numpy classic theta training function (ols drift + ses on the deseasonalized series, theta=2).
+    optional kwargs['specific_parameters']: period (default 24), deseasonalize (default True),
+    method ('auto', 'mul' or 'add'), use_test (default True), smoothing_level (fixed ses alpha).
+    returns a ThetaForecaster.
+    """
+    specific_parameters = kwargs.get('specific_parameters') or {}
+    period = int(specific_parameters.get('period', 24))
+    deseasonalize = bool(specific_parameters.get('deseasonalize', True))
+    use_test = bool(specific_parameters.get('use_test', True))
+    method = specific_parameters.get('method', 'auto')
+
+    y = _prices(df)
+    if method == 'auto':
+        method = 'mul' if y.min() > 0 else 'add'
+    method = 'mul' if method.startswith('mul') else 'add'
+
+    seasonal = np.empty(0)
+    deseasonalized = y
+    if deseasonalize and period > 1 and (not use_test or _has_seasonality(y, period)):
+        seasonal = _seasonal_indices(y, period, method)
+        if method == 'mul' and seasonal.min() <= 0:
+            method = 'add'
+            seasonal = _seasonal_indices(y, period, method)
+        tiled = seasonal[np.arange(len(y)) % period]
+        deseasonalized = y / tiled if method == 'mul' else y - tiled
+
+    # drift: slope of the ols line through the deseasonalized series
+    t = np.arange(len(deseasonalized), dtype=np.float64)
+    b0 = np.polyfit(t, deseasonalized, 1)[0]
+
+    best, (ses_level,) = _grid_search(lambda c: _ses_filter(deseasonalized, c[:, 0]),
+                                      [_smoothing_axis(specific_parameters, 'smoothing_level')])
+    alpha = best[0]
+
+    return ThetaForecaster(
+        b0=b0,
+        alpha=alpha,
+        nobs=len(y),
+        ses_level=ses_level,
+        seasonal=seasonal,
+        period=period,
+        method=method,
+        deseasonalize=bool(seasonal.shape[0]),
+    )
+
+# ---------------------------------------------------------
+# [Benchmarks]
+# ---------------------------------------------------------
+def fit_seasonal_naive_model(df, **kwargs):
+    """
+    seasonal naive training function: the forecast repeats the last season.
+    optional kwargs['specific_parameters']['seasonal_periods'] (default 24; 1 gives the naive forecast).
+    """
+    specific_parameters = kwargs.get('specific_parameters') or {}
+    m = int(specific_parameters.get('seasonal_periods', 24))
+    y = _prices(df)
+    if len(y) < m:
+        raise ValueError(f"at least {m} observations are required for seasonal_periods={m}.")
+    return SeasonalNaiveForecaster(last_season=y[-m:])
+
+def fit_drift_model(df, **kwargs):
+    """
+    drift training function: the last value plus the average hourly change over the training window.
+    """
+    y = _prices(df)
+    if len(y) < 2:
+        raise ValueError("at least 2 observations are required for the drift model.")
+    return DriftForecaster(last_value=y[-1], slope=(y[-1] - y[0]) / (len(y) - 1))
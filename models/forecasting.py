@@ -30,18 +30,29 @@ def create_forecast_dataframe(df, model_fit, steps):
     else:  # for ETS, Theta models
         forecast = model_fit.forecast(steps=steps)
 
+    return forecast_values_to_dataframe(price_series.index[-1], price_series.iloc[-1], forecast.values)
+
+def forecast_values_to_dataframe(last_date, last_price, forecast_values):
+    """
+    build the forecast DataFrame from already computed forecast values (e.g. one row of a batched forecast).
+
+    :param last_date: timestamp of the last historical point (the forecast origin).
+    :param last_price: price at last_date, written as the zero step.
+    :param forecast_values: forecast for the following hours.
+    :return: A pandas DataFrame with columns ['date', 'price']: the zero step followed by the forecast.
+    """
     # generate timestamps for forecast (steps timestamps starting from the next hour)
     forecast_dates = pd.date_range(
-        start=price_series.index[-1] + pd.Timedelta(hours=1),  # start after the last historical point
-        periods=steps,  # generate exactly 'steps' timestamps
+        start=last_date + pd.Timedelta(hours=1),  # start after the last historical point
+        periods=len(forecast_values),  # generate exactly 'steps' timestamps
         freq='h'
     )
     
     # create forecast series with timestamps
-    forecast_series = pd.Series(forecast.values, index=forecast_dates)
+    forecast_series = pd.Series(forecast_values, index=forecast_dates)
     
     # add zero step (last historical value) manually
-    zero_step = pd.Series([price_series.iloc[-1]], index=[price_series.index[-1]])
+    zero_step = pd.Series([last_price], index=[last_date])
     
     # concatenate zero step with forecast
     forecast_series = pd.concat([zero_step, forecast_series])
@@ -0,0 +1,499 @@
+import os
+import copy
+import joblib
+import logging
+import numpy as np
+import pandas as pd
+
+# initialize logger
+logger = logging.getLogger(__name__)
+
+ARTIFACT_FORMAT = "forecrypt-slim"
+ARTIFACT_VERSION = 1
+# ---------------------------------------------------------
+# [Slim forecasters]
+#   A slim forecaster holds only what forecasting needs: estimated parameters, the final state
+#   of the model and its spec. No training data, residuals or covariance matrices of estimates.
+#   It exposes forecast(steps) like statsmodels results, so create_forecast_dataframe accepts it as is,
+#   and append(values) which filters new observations into the state with the parameters held fixed.
+# ---------------------------------------------------------
+class SlimForecaster:
+    kind = None
+
+    def forecast(self, steps: int) -> pd.Series:
+        return pd.Series(self._forecast_values(int(steps)), name="forecast")
+
+    def _forecast_values(self, steps: int) -> np.ndarray:
+        raise NotImplementedError
+
+    def append(self, values) -> "SlimForecaster":
+        """
+        Move the forecast origin forward over new observations without refitting.
+
+        :param values: Observations following the last one the model has seen, in time order.
+        :return: New forecaster whose forecasts start after the last appended value (self is unchanged).
+        """
+        advanced = copy.copy(self)
+        for value in np.asarray(values, dtype=np.float64).ravel():
+            advanced._update(value)
+        return advanced
+
+    def _update(self, value: float):
+        raise NotImplementedError
+
+    def forecast_batch(self, values, origins, steps: int) -> np.ndarray:
+        """
+        Forecasts from many origins in one pass over the new observations, with the parameters fixed.
+
+        :param values: Observations following the last one the model has seen, in time order.
+        :param origins: Ascending numbers of values observed before each origin (0 = the current state).
+        :param steps: Forecast horizon.
+        :return: Array of shape (len(origins), steps); row i equals append(values[:origins[i]]).forecast(steps).
+        """
+        return np.stack([model._forecast_values(int(steps)) for model in self._walk(values, origins)])
+
+    def _walk(self, values, origins):
+        """
+        Yield a copy of the forecaster advanced to every origin in turn (read its state before the next step).
+        """
+        values = np.asarray(values, dtype=np.float64).ravel()
+        origins = np.asarray(origins, dtype=np.int64)
+        if len(origins) and (np.any(np.diff(origins) < 0) or origins[0] < 0 or origins[-1] > len(values)):
+            raise ValueError("origins must be ascending positions within values.")
+
+        model = copy.copy(self)
+        position = 0
+        for origin in origins:
+            for value in values[position:origin]:
+                model._update(value)
+            position = origin
+            yield model
+
+    def to_artifact(self) -> dict:
+        """
+        Plain dict of numpy arrays and scalars describing the forecaster.
+        """
+        return {"format": ARTIFACT_FORMAT, "version": ARTIFACT_VERSION, "kind": self.kind, **self._state()}
+
+    def _state(self) -> dict:
+        raise NotImplementedError
+
+class HoltWintersForecaster(SlimForecaster):
+    """
+    Holt-Winters (ExponentialSmoothing) forecaster from final level, trend and seasonal states.
+
+    `seasons` holds the last m + 1 seasonal states; the forecast cycle follows statsmodels
+    (the oldest of them is used for the m-th step ahead).
+    """
+    kind = "holt_winters"
+
+    def __init__(self, *, trend, seasonal, seasonal_periods, damped_trend, smoothing_level,
+                 smoothing_trend, smoothing_seasonal, damping_trend, level, trend_state, seasons):
+        self.trend = trend
+        self.seasonal = seasonal
+        self.seasonal_periods = int(seasonal_periods or 0)
+        self.damped_trend = bool(damped_trend)
+        self.smoothing_level = float(smoothing_level)
+        self.smoothing_trend = float(smoothing_trend) if smoothing_trend is not None else None
+        self.smoothing_seasonal = float(smoothing_seasonal) if smoothing_seasonal is not None else None
+        self.damping_trend = float(damping_trend) if self.damped_trend else 1.0
+        self.level = float(level)
+        self.trend_state = float(trend_state)
+        self.seasons = np.asarray(seasons, dtype=np.float64)
+
+    def _trended(self, level, trend):
+        if self.trend == "add":
+            return level + trend
+        if self.trend == "mul":
+            return level * trend
+        return level
+
+    def _dampen(self, trend, phi):
+        if self.trend == "add":
+            return trend * phi
+        if self.trend == "mul":
+            return trend ** phi
+        return 0.0
+
+    def _forecast_values(self, steps):
+        k = np.arange(1, steps + 1, dtype=np.float64)
+        phi_h = np.cumsum(self.damping_trend ** k) if self.damped_trend else k
+        fcast = self._trended(self.level, self._dampen(self.trend_state, phi_h)) * np.ones(steps)
+
+        if self.seasonal:
+            m = self.seasonal_periods
+            cycle = np.concatenate([self.seasons[1:m], self.seasons[:1]])
+            season = cycle[np.arange(steps) % m]
+            fcast = fcast * season if self.seasonal == "mul" else fcast + season
+        return fcast
+
+    def forecast_batch(self, values, origins, steps):
+        states = [(model.level, model.trend_state, model.seasons) for model in self._walk(values, origins)]
+        if not states:
+            return np.empty((0, int(steps)))
+        levels = np.array([state[0] for state in states])[:, None]
+        trends = np.array([state[1] for state in states])[:, None]
+
+        k = np.arange(1, steps + 1, dtype=np.float64)
+        phi_h = np.cumsum(self.damping_trend ** k) if self.damped_trend else k
+        fcast = self._trended(levels, self._dampen(trends, phi_h)) * np.ones((1, steps))
+
+        if self.seasonal:
+            m = self.seasonal_periods
+            seasons = np.stack([state[2] for state in states])
+            cycle = np.concatenate([seasons[:, 1:m], seasons[:, :1]], axis=1)
+            season = cycle[:, np.arange(steps) % m]
+            fcast = fcast * season if self.seasonal == "mul" else fcast + season
+        return fcast
+
+    def _update(self, value):
+        # one step of the statsmodels smoothing recursions; seasons[1] is the seasonal state of this step
+        alpha, beta, gamma = self.smoothing_level, self.smoothing_trend, self.smoothing_seasonal
+        prev_level, prev_trend = self.level, self.trend_state
+        base = self._trended(prev_level, self._dampen(prev_trend, self.damping_trend))
+
+        season = self.seasons[1] if self.seasonal else None
+        if self.seasonal == "mul":
+            level = alpha * value / season + (1 - alpha) * base
+        elif self.seasonal == "add":
+            level = alpha * (value - season) + (1 - alpha) * base
+        else:
+            level = alpha * value + (1 - alpha) * base
+
+        if self.trend:
+            growth = level / prev_level if self.trend == "mul" else level - prev_level
+            self.trend_state = beta * growth + (1 - beta) * self._dampen(prev_trend, self.damping_trend)
+        self.level = level
+
+        if self.seasonal:
+            if self.seasonal == "mul":
+                new_season = gamma * value / base + (1 - gamma) * season
+            else:
+                new_season = gamma * (value - base) + (1 - gamma) * season
+            self.seasons = np.append(self.seasons[1:], new_season)
+
+    def _state(self):
+        return {
+            "trend": self.trend,
+            "seasonal": self.seasonal,
+            "seasonal_periods": self.seasonal_periods,
+            "damped_trend": self.damped_trend,
+            "smoothing_level": self.smoothing_level,
+            "smoothing_trend": self.smoothing_trend,
+            "smoothing_seasonal": self.smoothing_seasonal,
+            "damping_trend": self.damping_trend,
+            "level": self.level,
+            "trend_state": self.trend_state,
+            "seasons": self.seasons,
+        }
+
+    @classmethod
+    def from_results(cls, model_fit):
+        model = model_fit.model
+        params = model_fit.params
+        if params.get("use_boxcox") or params.get("remove_bias"):
+            raise TypeError("Box-Cox transformed or bias-corrected ExponentialSmoothing is not supported.")
+
+        m = int(model.seasonal_periods or 0)
+        seasons = np.empty(0)
+        if model.seasonal:
+            season = np.asarray(model_fit.season, dtype=np.float64)
+            if len(season) < m + 1:
+                raise TypeError("Not enough observations to take the seasonal state.")
+            seasons = season[-(m + 1):]
+
+        return cls(
+            trend=model.trend,
+            seasonal=model.seasonal,
+            seasonal_periods=m,
+            damped_trend=model.damped_trend,
+            smoothing_level=params["smoothing_level"],
+            smoothing_trend=params.get("smoothing_trend"),
+            smoothing_seasonal=params.get("smoothing_seasonal"),
+            damping_trend=params.get("damping_trend"),
+            level=np.asarray(model_fit.level)[-1],
+            trend_state=np.asarray(model_fit.trend)[-1] if model.trend else 0.0,
+            seasons=seasons,
+        )
+
+class ThetaForecaster(SlimForecaster):
+    """
+    Classic Theta forecaster (statsmodels ThetaModel with OLS/SES estimation).
+    """
+    kind = "theta"
+
+    def __init__(self, *, b0, alpha, nobs, ses_level, theta=2.0, seasonal=None, period=1,
+                 method="multiplicative", deseasonalize=False):
+        self.b0 = float(b0)
+        self.alpha = float(alpha)
+        self.nobs = int(nobs)
+        self.ses_level = float(ses_level)
+        self.theta = float(theta)
+        self.seasonal = np.asarray(seasonal if seasonal is not None else [], dtype=np.float64)
+        self.period = int(period)
+        self.method = method
+        self.deseasonalize = bool(deseasonalize)
+
+    def _season(self, positions):
+        if self.method.startswith("add"):
+            season = np.zeros(len(positions))
+        else:
+            season = np.ones(len(positions))
+        if self.deseasonalize and self.seasonal.shape[0]:
+            season[:] = self.seasonal[positions % self.period]
+        return season
+
+    def _forecast_values(self, steps):
+        h = np.arange(1, steps + 1, dtype=np.float64) - 1
+        if self.alpha > 0:
+            h += 1 / self.alpha - ((1 - self.alpha) ** self.nobs / self.alpha)
+        trend_weight = (self.theta - 1) / self.theta
+        fcast = trend_weight * self.b0 * h + self.ses_level
+
+        if self.deseasonalize:
+            season = self._season(self.nobs + np.arange(steps))
+            fcast = fcast * season if self.method.startswith("mul") else fcast + season
+        return fcast
+
+    def forecast_batch(self, values, origins, steps):
+        states = [(model.ses_level, model.nobs) for model in self._walk(values, origins)]
+        if not states:
+            return np.empty((0, int(steps)))
+        ses_levels = np.array([state[0] for state in states])[:, None]
+        nobs = np.array([state[1] for state in states])[:, None]
+
+        h = np.arange(1, steps + 1, dtype=np.float64)[None, :] - 1
+        if self.alpha > 0:
+            h = h + 1 / self.alpha - ((1 - self.alpha) ** nobs / self.alpha)
+        trend_weight = (self.theta - 1) / self.theta
+        fcast = trend_weight * self.b0 * h + ses_levels
+
+        if self.deseasonalize:
+            positions = nobs + np.arange(steps)[None, :]
+            season = self._season(positions.ravel()).reshape(positions.shape)
+            fcast = fcast * season if self.method.startswith("mul") else fcast + season
+        return fcast
+
+    def _update(self, value):
+        # SES step on the deseasonalized observation; b0 and alpha stay fixed
+        if self.deseasonalize and self.seasonal.shape[0]:
+            season = self.seasonal[self.nobs % self.period]
+            value = value / season if self.method.startswith("mul") else value - season
+        self.ses_level = self.alpha * value + (1 - self.alpha) * self.ses_level
+        self.nobs += 1
+
+    def _state(self):
+        return {
+            "b0": self.b0,
+            "alpha": self.alpha,
+            "nobs": self.nobs,
+            "ses_level": self.ses_level,
+            "theta": self.theta,
+            "seasonal": self.seasonal,
+            "period": self.period,
+            "method": self.method,
+            "deseasonalize": self.deseasonalize,
+        }
+
+    @classmethod
+    def from_results(cls, model_fit):
+        model = model_fit.model
+        if model_fit._use_mle:
+            raise TypeError("MLE-estimated ThetaModel is not supported.")
+        return cls(
+            b0=model_fit._b0,
+            alpha=model_fit._alpha,
+            nobs=model_fit._nobs,
+            ses_level=np.asarray(model_fit._one_step).ravel()[0],
+            seasonal=model_fit._seasonal,
+            period=model.period,
+            method=model.method,
+            deseasonalize=model.deseasonalize,
+        )
+
+class StateSpaceForecaster(SlimForecaster):
+    """
+    Linear Gaussian state space forecaster (statsmodels ARIMA/SARIMAX results).
+
+    Keeps the time-invariant system matrices and the one-step-ahead predicted state
+    (with its covariance, so new observations can be filtered in later).
+    """
+    kind = "state_space"
+
+    def __init__(self, *, design, obs_intercept, obs_cov, transition, state_intercept, selection,
+                 state_cov, state, state_cov_pred):
+        self.design = np.asarray(design, dtype=np.float64)
+        self.obs_intercept = np.asarray(obs_intercept, dtype=np.float64)
+        self.obs_cov = np.asarray(obs_cov, dtype=np.float64)
+        self.transition = np.asarray(transition, dtype=np.float64)
+        self.state_intercept = np.asarray(state_intercept, dtype=np.float64)
+        self.selection = np.asarray(selection, dtype=np.float64)
+        self.state_cov = np.asarray(state_cov, dtype=np.float64)
+        self.state = np.asarray(state, dtype=np.float64)
+        self.state_cov_pred = np.asarray(state_cov_pred, dtype=np.float64)
+
+    def _forecast_values(self, steps):
+        fcast = np.empty(steps)
+        state = self.state
+        for h in range(steps):
+            fcast[h] = self.obs_intercept[0] + self.design[0] @ state
+            state = self.state_intercept + self.transition @ state
+        return fcast
+
+    def forecast_batch(self, values, origins, steps):
+        states = [model.state for model in self._walk(values, origins)]
+        if not states:
+            return np.empty((0, int(steps)))
+        states = np.stack(states)
+        fcast = np.empty((len(states), int(steps)))
+        for h in range(int(steps)):
+            # all origins advance together
+            fcast[:, h] = self.obs_intercept[0] + states @ self.design[0]
+            states = self.state_intercept + states @ self.transition.T
+        return fcast
+
+    def _update(self, value):
+        # Kalman filter step: condition the predicted state on the observation, then predict the next one
+        Z, T = self.design, self.transition
+        P = self.state_cov_pred
+        innovation = value - self.obs_intercept - Z @ self.state
+        F = Z @ P @ Z.T + self.obs_cov
+        gain = P @ Z.T @ np.linalg.inv(F)
+
+        filtered_state = self.state + gain @ innovation
+        filtered_cov = P - gain @ Z @ P
+        self.state = self.state_intercept + T @ filtered_state
+        self.state_cov_pred = T @ filtered_cov @ T.T + self.selection @ self.state_cov @ self.selection.T
+
+    def _state(self):
+        return {
+            "design": self.design,
+            "obs_intercept": self.obs_intercept,
+            "obs_cov": self.obs_cov,
+            "transition": self.transition,
+            "state_intercept": self.state_intercept,
+            "selection": self.selection,
+            "state_cov": self.state_cov,
+            "state": self.state,
+            "state_cov_pred": self.state_cov_pred,
+        }
+
+    @classmethod
+    def from_results(cls, model_fit):
+        ssm = model_fit.model.ssm
+        matrices = {}
+        for name in ("design", "obs_intercept", "obs_cov", "transition", "state_intercept", "selection", "state_cov"):
+            # stored with a trailing time axis of length 1 when time-invariant
+            matrix = np.asarray(ssm[name])
+            time_axis_ndim = 2 if name.endswith("intercept") else 3
+            if matrix.ndim == time_axis_ndim:
+                if matrix.shape[-1] != 1:
+                    raise TypeError(f"Time-varying '{name}' matrix is not supported.")
+                matrix = matrix[..., 0]
+            matrices[name] = matrix
+
+        filter_results = model_fit.filter_results
+        return cls(
+            **matrices,
+            state=np.asarray(filter_results.predicted_state)[:, -1],
+            state_cov_pred=np.asarray(filter_results.predicted_state_cov)[:, :, -1],
+        )
+
+class SeasonalNaiveForecaster(SlimForecaster):
+    """
+    Seasonal naive forecaster: repeats the last full season (seasonal_periods=1 is the plain naive forecast).
+    """
+    kind = "seasonal_naive"
+
+    def __init__(self, *, last_season):
+        self.last_season = np.asarray(last_season, dtype=np.float64)
+
+    def _forecast_values(self, steps):
+        return self.last_season[np.arange(steps) % len(self.last_season)]
+
+    def _update(self, value):
+        self.last_season = np.append(self.last_season[1:], value)
+
+    def _state(self):
+        return {"last_season": self.last_season}
+
+class DriftForecaster(SlimForecaster):
+    """
+    Random walk with drift: the last observation plus the average change per hour of the training window.
+    """
+    kind = "drift"
+
+    def __init__(self, *, last_value, slope):
+        self.last_value = float(last_value)
+        self.slope = float(slope)
+
+    def _forecast_values(self, steps):
+        return self.last_value + self.slope * np.arange(1, steps + 1, dtype=np.float64)
+
+    def _update(self, value):
+        self.last_value = float(value)
+
+    def _state(self):
+        return {"last_value": self.last_value, "slope": self.slope}
+
+FORECASTER_KINDS = {
+    cls.kind: cls for cls in (
+        HoltWintersForecaster, ThetaForecaster, StateSpaceForecaster, SeasonalNaiveForecaster, DriftForecaster
+    )
+}
+# ---------------------------------------------------------
+# [Conversion, save and load]
+# ---------------------------------------------------------
+def to_slim(model_fit) -> SlimForecaster:
+    """
+    Convert a fitted model into a slim forecaster.
+
+    :param model_fit: statsmodels results (HoltWinters, Theta, ARIMA/SARIMAX) or an existing slim forecaster.
+    :return: SlimForecaster
+    :raises TypeError: if the model type (or its configuration) has no slim representation.
+    """
+    if isinstance(model_fit, SlimForecaster):
+        return model_fit
+
+    # statsmodels returns results wrapped for pandas input
+    model_fit = getattr(model_fit, "_results", model_fit)
+
+    class_name = type(model_fit).__name__
+    if class_name == "HoltWintersResults":
+        return HoltWintersForecaster.from_results(model_fit)
+    if class_name == "ThetaModelResults":
+        return ThetaForecaster.from_results(model_fit)
+    if hasattr(model_fit, "filter_results") and hasattr(model_fit.model, "ssm"):
+        return StateSpaceForecaster.from_results(model_fit)
+
+    raise TypeError(f"No slim artifact format for {class_name}.")
+
+def from_artifact(artifact: dict) -> SlimForecaster:
+    """
+    Rebuild a forecast-capable object from an artifact dict.
+    """
+    if artifact.get("format") != ARTIFACT_FORMAT:
+        raise ValueError("Not a slim model artifact.")
+    state = {k: v for k, v in artifact.items() if k not in ("format", "version", "kind")}
+    return FORECASTER_KINDS[artifact["kind"]](**state)
+
+def save_slim_model(model_fit, filepath: str, compress=0):
+    """
+    Save a fitted model as a slim artifact.
+
+    :param compress: joblib compression level. Compressed artifacts cannot be memory-mapped on load.
+    """
+    artifact = to_slim(model_fit).to_artifact()
+    # write a new file and swap it in: models memory-mapped from the old file stay valid
+    tmp_path = f"{filepath}.{os.getpid()}.tmp"
+    joblib.dump(artifact, tmp_path, compress=compress)
+    os.replace(tmp_path, filepath)
+
+def load_slim_model(filepath: str, mmap_mode="r") -> SlimForecaster:
+    """
+    Load a slim artifact; arrays of uncompressed artifacts are memory-mapped.
+    """
+    if not os.path.exists(filepath):
+        raise FileNotFoundError(f"Model file '{filepath}' does not exist.")
+    artifact = joblib.load(filepath, mmap_mode=mmap_mode)
+    return from_artifact(artifact)
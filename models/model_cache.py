@@ -0,0 +1,99 @@
+import json
+import hashlib
+import logging
+from collections import OrderedDict
+#
+from . import models_processing
+from .drift import uses_drift_policy
+from config.config_system import MODEL_CACHE_SIZE
+
+# initialize logger
+logger = logging.getLogger(__name__)
+
+def model_config_signature(params: dict) -> str:
+    """
+    Short stable hash of a model configuration, so models of differently configured runs never mix.
+    """
+    payload = json.dumps(params, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+
+# configuration keys that determine the fitted model; configs equal in all of them can share fits
+# (fit_time_budget counts: a fit abandoned under a tight budget leaves a different model in use than a completed one)
+FIT_SIGNATURE_KEYS = (
+    "fit_func_name", "specific_parameters", "training_dataset_size", "model_update_interval", "warm_start",
+    "fit_time_budget",
+)
+
+def model_fit_signature(params: dict) -> str:
+    """
+    Short stable hash of the fit-relevant part of a model configuration (see FIT_SIGNATURE_KEYS).
+    Under the drift policy retrains depend on the model's own forecasts, so the whole configuration counts.
+    """
+    if uses_drift_policy(params):
+        return model_config_signature(params)
+    return model_config_signature({key: params.get(key) for key in FIT_SIGNATURE_KEYS})
+
+class ModelCache:
+    """
+    Size-bounded LRU cache of fitted models.
+
+    Entries are keyed by (crypto_id, model_name, config signature, retrain datetime). Models are
+    persisted with models_processing.save_model only at checkpoints, or when the newest model of a
+    (crypto_id, model_name) pair is evicted before its checkpoint.
+    """
+    def __init__(self, max_entries: int = MODEL_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._dirty = {}  # (crypto_id, model_name) -> key of the newest not yet persisted model
+
+    @staticmethod
+    def make_key(crypto_id, model_name, params, retrain_dt):
+        return crypto_id, model_name, model_config_signature(params), retrain_dt
+
+    def put(self, crypto_id, model_name, params, retrain_dt, model_fit):
+        key = self.make_key(crypto_id, model_name, params, retrain_dt)
+        self._entries[key] = model_fit
+        self._entries.move_to_end(key)
+        self._dirty[(crypto_id, model_name)] = key
+        self._evict()
+
+    def get(self, crypto_id, model_name, params, retrain_dt):
+        """
+        :return: cached model or None on a miss.
+        """
+        key = self.make_key(crypto_id, model_name, params, retrain_dt)
+        model_fit = self._entries.get(key)
+        if model_fit is not None:
+            self._entries.move_to_end(key)
+        return model_fit
+
+    def checkpoint(self, crypto_id=None, model_name=None):
+        """
+        Persist the newest model of every pair (optionally filtered) that is not on disk yet.
+        """
+        for pair, key in list(self._dirty.items()):
+            if crypto_id is not None and pair[0] != crypto_id:
+                continue
+            if model_name is not None and pair[1] != model_name:
+                continue
+            self._persist(key, self._entries[key])
+
+    def clear(self):
+        self._entries.clear()
+        self._dirty.clear()
+
+    def _persist(self, key, model_fit):
+        crypto_id, model_name = key[0], key[1]
+        models_processing.save_model(crypto_id, model_name, model_fit)
+        if self._dirty.get((crypto_id, model_name)) == key:
+            del self._dirty[(crypto_id, model_name)]
+
+    def _evict(self):
+        while len(self._entries) > self.max_entries:
+            key, model_fit = self._entries.popitem(last=False)
+            if self._dirty.get((key[0], key[1])) == key:
+                logger.debug(f"Evicting unsaved model {key[:2]}, persisting it first.")
+                self._persist(key, model_fit)
+
+# process-wide cache (every pool worker gets its own)
+model_cache = ModelCache()
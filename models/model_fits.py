@@ -1,19 +1,23 @@
+import numpy as np
 import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
 from statsmodels.tsa.arima.model import ARIMA
 from statsmodels.tsa.holtwinters import ExponentialSmoothing
 from statsmodels.tsa.forecasting.theta import ThetaModel
+from .model_artifacts import StateSpaceForecaster
 
 
 def fit_arima_model(df, **kwargs):
     """
     arima model training function.
     all parameters must come from kwargs['specific_parameters'] (e.g. order, seasonal_order).
+    optional kwargs['start_params'] (parameters of a previous fit) warm-starts the optimizer.
     """
     order = kwargs['specific_parameters']['order']
     seasonal_order = kwargs['specific_parameters']['seasonal_order']
 
     model = ARIMA(df['price'], order=order, seasonal_order=seasonal_order)
-    model_fit = model.fit()
+    model_fit = model.fit(start_params=kwargs.get('start_params'))
     return model_fit
 
 
@@ -22,6 +26,8 @@ def fit_ets_model(df, **kwargs):
     ets model training function.
     all parameters must come from kwargs['specific_parameters'] 
     (e.g., trend, seasonal, seasonal_periods).
+    optional kwargs['start_params'] (optimized parameters of a previous fit) replaces the brute-force
+    search for starting values.
     """
     trend = kwargs['specific_parameters']['trend']
     seasonal = kwargs['specific_parameters']['seasonal']
@@ -33,7 +39,11 @@ def fit_ets_model(df, **kwargs):
         seasonal=seasonal,
         seasonal_periods=seasonal_periods
     )
-    model_fit = model.fit()
+    start_params = kwargs.get('start_params')
+    if start_params is not None:
+        model_fit = model.fit(start_params=start_params, use_brute=False)
+    else:
+        model_fit = model.fit()
     return model_fit
 
 
@@ -41,6 +51,7 @@ def fit_theta_model(df, **kwargs):
     """
     theta model training function.
     parameters come from kwargs['specific_parameters'] if needed (like m, method, etc.).
+    kwargs['start_params'] is ignored: the theta fit is closed-form (OLS + SES) and has nothing to warm-start.
     """
     if 'date' in df.columns:
         df = df.set_index('date')
@@ -55,4 +66,104 @@ def fit_theta_model(df, **kwargs):
     # below is a minimal version:
     model = ThetaModel(df['price'])
     model_fit = model.fit()
-    return model_fit
\ No newline at end of file
+    return model_fit
+
+def _ar_lag_rows(prices, lags):
+    """
+    rows [y_{t-1}, ..., y_{t-lags}, y_t, 1] for every t with a full set of lags (a strided view, then one copy).
+    row j holds the target prices[j + lags].
+    """
+    windows = sliding_window_view(prices, lags + 1)
+    return np.hstack([windows[:, -2::-1], windows[:, -1:], np.ones((len(windows), 1))])
+
+
+def _ar_forecaster(coefs, intercept, sigma2, last_values):
+    """
+    companion-form state space of the fitted ar model, so the slim forecaster machinery
+    (forecast, append, forecast_batch, save/load) applies unchanged.
+    last_values: the last `lags` observations, newest first.
+    """
+    lags = len(coefs)
+    transition = np.zeros((lags, lags))
+    transition[0] = coefs
+    transition[1:, :-1] = np.eye(lags - 1)
+    state_intercept = np.zeros(lags)
+    state_intercept[0] = intercept
+    design = np.zeros((1, lags))
+    design[0, 0] = 1.0
+    selection = np.zeros((lags, 1))
+    selection[0, 0] = 1.0
+    state_cov = np.array([[max(sigma2, 1e-12)]])
+
+    # one-step-ahead predicted state and its covariance (only the new observation is uncertain)
+    state = state_intercept + transition @ last_values
+    state_cov_pred = selection @ state_cov @ selection.T
+    return StateSpaceForecaster(
+        design=design, obs_intercept=np.zeros(1), obs_cov=np.zeros((1, 1)), transition=transition,
+        state_intercept=state_intercept, selection=selection, state_cov=state_cov,
+        state=state, state_cov_pred=state_cov_pred,
+    )
+
+
+def fit_ridge_ar_model_batch(prices, windows, **kwargs):
+    """
+    closed-form ar / ridge-on-lags fit of many training windows of one price series at once.
+
+    the lag matrix of the whole series is built once with sliding_window_view. gram matrices
+    z'z of the rows [lags, target, 1] are accumulated once between sorted window boundaries, so the
+    normal equations of every window are a difference of two prefix sums, and all windows are solved
+    with one batched np.linalg.solve.
+
+    parameters come from kwargs['specific_parameters']: lags (default 24) and ridge_alpha
+    (default 0.0, penalty on the lag coefficients relative to their average variance).
+    returns a list of forecasters aligned with `windows` ((lo, hi) slices of prices).
+    """
+    specific_parameters = kwargs.get('specific_parameters') or {}
+    lags = int(specific_parameters.get('lags', 24))
+    ridge_alpha = float(specific_parameters.get('ridge_alpha', 0.0))
+
+    prices = np.asarray(prices, dtype=np.float64)
+    if not windows:
+        return []
+    windows = np.asarray(windows, dtype=np.int64)
+    if np.any(windows[:, 1] - windows[:, 0] < 2 * lags + 2):
+        raise ValueError(f"every training window needs at least {2 * lags + 2} observations for lags={lags}.")
+
+    # shifting by a constant leaves the ar coefficients unchanged and keeps the sums well conditioned
+    shift = prices[windows[:, 0].min():windows[:, 1].max()].mean()
+    rows = _ar_lag_rows(prices - shift, lags)
+
+    # rows of window (lo, hi) are lo .. hi - lags - 1
+    starts, ends = windows[:, 0], windows[:, 1] - lags
+    boundaries = np.unique(np.concatenate([starts, ends]))
+    chunk_grams = np.stack([rows[a:b].T @ rows[a:b] for a, b in zip(boundaries[:-1], boundaries[1:])])
+    prefix = np.concatenate([np.zeros((1,) + chunk_grams.shape[1:]), np.cumsum(chunk_grams, axis=0)])
+    gram = prefix[np.searchsorted(boundaries, ends)] - prefix[np.searchsorted(boundaries, starts)]
+
+    # center within every window: intercept handled through the means
+    n_rows = gram[:, -1, -1]
+    means = gram[:, -1, :-1] / n_rows[:, None]
+    centered = gram[:, :-1, :-1] - n_rows[:, None, None] * means[:, :, None] * means[:, None, :]
+    xx, xy, yy = centered[:, :lags, :lags], centered[:, :lags, lags], centered[:, lags, lags]
+
+    penalty = ridge_alpha * np.trace(xx, axis1=1, axis2=2) / lags
+    coefs = np.linalg.solve(xx + penalty[:, None, None] * np.eye(lags), xy[:, :, None])[:, :, 0]
+    intercepts = means[:, lags] - np.einsum('wk,wk->w', coefs, means[:, :lags])
+    rss = yy - 2 * np.einsum('wk,wk->w', coefs, xy) + np.einsum('wk,wkl,wl->w', coefs, xx, coefs)
+    sigma2 = np.maximum(rss, 0) / np.maximum(n_rows - lags - 1, 1)
+
+    forecasters = []
+    for (lo, hi), coef, intercept, s2 in zip(windows, coefs, intercepts, sigma2):
+        # back to price units: y - shift = c + phi (lags - shift)
+        intercept = intercept + shift * (1 - coef.sum())
+        forecasters.append(_ar_forecaster(coef, intercept, s2, prices[hi - lags:hi][::-1]))
+    return forecasters
+
+
+def fit_ridge_ar_model(df, **kwargs):
+    """
+    ar / ridge-on-lags training function (one window of fit_ridge_ar_model_batch).
+    parameters come from kwargs['specific_parameters'] (lags, ridge_alpha).
+    """
+    prices = df['price'].to_numpy(dtype=np.float64)
+    return fit_ridge_ar_model_batch(prices, [(0, len(prices))], **kwargs)[0]
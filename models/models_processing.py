@@ -2,16 +2,37 @@ import os
 import joblib
 import logging
 import importlib
+import multiprocessing
+import numpy as np
 from datetime import datetime, timezone
 #
 from db.db_utils_postgres import load_to_db_forecast
 from .forecasting import create_forecast_dataframe
-from config.config_system import MODELS_DIRECTORY
+from . import model_artifacts
+from . import result_cache
+from config.config_system import MODELS_DIRECTORY, MODEL_ARTIFACT_FORMAT, MODEL_ARTIFACT_COMPRESS, FIT_TIME_BUDGET_SECONDS
 from config.config_models import MODEL_PARAMETERS
 
 # initialize logger
 logger = logging.getLogger(__name__)
 
+def get_model_paths(crypto_id: str, model_name: str) -> tuple[str, str]:
+    """
+    File paths of the full (joblib pickle) and slim artifact of a model.
+    """
+    base = os.path.join(MODELS_DIRECTORY, f"{crypto_id}__{model_name}")
+    return f"{base}.pkl", f"{base}.slim.joblib"
+
+def get_existing_model_path(crypto_id: str, model_name: str):
+    """
+    Path of the saved model (slim artifact preferred), or None if there is none.
+    """
+    full_path, slim_path = get_model_paths(crypto_id, model_name)
+    for filepath in (slim_path, full_path):
+        if os.path.exists(filepath):
+            return filepath
+    return None
+
 def check_model(crypto_id: str, model_name: str) -> bool:
     """
     Checks if a model exists and determines if it needs to be updated.
@@ -23,11 +44,10 @@ def check_model(crypto_id: str, model_name: str) -> bool:
     update_interval_hours = MODEL_PARAMETERS[model_name].get("model_update_interval", 24)
 
     # construct the file path
-    filename = f"{crypto_id}__{model_name}.pkl"
-    filepath = os.path.join(MODELS_DIRECTORY, filename)
+    filepath = get_existing_model_path(crypto_id, model_name)
 
-    if not os.path.exists(filepath):
-        logger.debug(f"Model '{filepath}' does not exist. Needs to be created.")
+    if filepath is None:
+        logger.debug(f"Model '{crypto_id}__{model_name}' does not exist. Needs to be created.")
         return True
 
     # check the last modified time
@@ -52,6 +72,9 @@ def check_model(crypto_id: str, model_name: str) -> bool:
 def save_model(crypto_id: str, model_name: str, model_fit):
     """
     Saves the given model to a file.
+
+    With MODEL_ARTIFACT_FORMAT 'slim' the model is stored as a slim artifact (see model_artifacts),
+    falling back to the full pickle for models that have no slim representation.
     
     :param crypto_id: e.g. 'BTC'
     :param model_name: e.g. 'arima'
@@ -59,14 +82,41 @@ def save_model(crypto_id: str, model_name: str, model_fit):
     """
     os.makedirs(MODELS_DIRECTORY, exist_ok=True)
 
-    # construct the file path
-    filename = f"{crypto_id}__{model_name}.pkl"
-    filepath = os.path.join(MODELS_DIRECTORY, filename)
+    # construct the file paths
+    full_path, slim_path = get_model_paths(crypto_id, model_name)
+
+    filepath = full_path
+    if MODEL_ARTIFACT_FORMAT == "slim":
+        try:
+            model_artifacts.save_slim_model(model_fit, slim_path, compress=MODEL_ARTIFACT_COMPRESS)
+            filepath = slim_path
+        except TypeError as e:
+            logger.debug(f"Slim artifact not available for {crypto_id} - {model_name} ({e}), saving full model.")
 
     # save the model
-    joblib.dump(model_fit, filepath)
+    if filepath == full_path:
+        tmp_path = f"{full_path}.{os.getpid()}.tmp"
+        joblib.dump(model_fit, tmp_path)
+        os.replace(tmp_path, full_path)
+
+    # remove the artifact of the other format, so it is never loaded instead
+    stale_path = slim_path if filepath == full_path else full_path
+    if os.path.exists(stale_path):
+        os.remove(stale_path)
+
     logger.debug(f"Model saved at '{filepath}'")
 
+def save_checkpoint_model(crypto_id: str, model_name: str, model_fit) -> str:
+    """
+    Saves the model of a backtest checkpoint next to the regular model file. Unlike that one it is only
+    replaced by the next checkpoint, so it always matches the checkpoint row that references it.
+
+    :return: path of the saved file.
+    """
+    checkpoint_name = f"{model_name}__checkpoint"
+    save_model(crypto_id, checkpoint_name, model_fit)
+    return get_existing_model_path(crypto_id, checkpoint_name)
+
 def load_model(crypto_id: str, model_name: str):
     """
     Loads the saved model for the given cryptocurrency and model name.
@@ -78,27 +128,76 @@ def load_model(crypto_id: str, model_name: str):
     :raises FileNotFoundError: if the model file does not exist
     """
     # construct the file path
-    filename = f"{crypto_id}__{model_name}.pkl"
-    filepath = os.path.join(MODELS_DIRECTORY, filename)
+    filepath = get_existing_model_path(crypto_id, model_name)
 
     # check if the file exists
+    if filepath is None:
+        raise FileNotFoundError(f"Model file for '{crypto_id}__{model_name}' does not exist.")
+
+    return load_model_file(filepath)
+
+def load_model_file(filepath: str):
+    """
+    Loads a model saved by save_model from its file path.
+
+    :raises FileNotFoundError: if the model file does not exist
+    """
     if not os.path.exists(filepath):
         raise FileNotFoundError(f"Model file '{filepath}' does not exist.")
 
-    # load and return the model
-    model_fit = joblib.load(filepath)
+    # load and return the model (slim artifacts are rebuilt into a forecaster, memory-mapped if uncompressed)
+    if filepath.endswith(".slim.joblib"):
+        model_fit = model_artifacts.load_slim_model(filepath, mmap_mode=None if MODEL_ARTIFACT_COMPRESS else "r")
+    else:
+        model_fit = joblib.load(filepath)
     logger.debug(f"Model loaded from '{filepath}'")
     return model_fit
 
-def fit_model_any(df, model_name):
+def get_start_params(model_fit):
+    """
+    Estimated parameters of a fitted model in the layout its fit function accepts as start_params.
+
+    :param model_fit: fitted model (e.g. the previous retrain of the same currency and config).
+    :return: numpy array, or None if the model has no warm-startable parameters (Theta, slim artifacts).
+    """
+    if model_fit is None:
+        return None
+    # ExponentialSmoothing: only the optimized parameters, in optimizer order
+    formatted = getattr(model_fit, "params_formatted", None)
+    if formatted is not None:
+        return formatted.loc[formatted["optimized"], "param"].to_numpy(dtype=np.float64)
+    # statsmodels MLE models (ARIMA, SARIMAX)
+    if hasattr(getattr(model_fit, "model", None), "start_params"):
+        return np.asarray(model_fit.params, dtype=np.float64)
+    return None
+
+def get_batch_fit_function(params):
+    """
+    Batch companion of the model's fit function, if its module defines one as `<fit function>_batch`.
+
+    A batch fit function takes (prices, windows, **params), where windows are (lo, hi) slices of the
+    price array, and fits all windows at once, returning a list of fitted models aligned with windows.
+
+    :return: callable or None.
+    """
+    module_name, func_name = params["fit_func_name"].rsplit(".", 1)
+    module = importlib.import_module(module_name)
+    return getattr(module, f"{func_name}_batch", None)
+
+def fit_model_any(df, model_name, params=None, start_params=None):
     """
     Dynamically fit any model based on model_name.
+
+    :param params: model configuration; defaults to MODEL_PARAMETERS[model_name].
+    :param start_params: optional optimizer start values (see get_start_params), passed to the fit function.
     """
-    if model_name not in MODEL_PARAMETERS:
-        raise ValueError(f"model_name '{model_name}' not found in MODEL_PARAMETERS")
+    if params is None:
+        if model_name not in MODEL_PARAMETERS:
+            raise ValueError(f"model_name '{model_name}' not found in MODEL_PARAMETERS")
+        params = MODEL_PARAMETERS[model_name]
 
     # get path to the fitting function
-    fit_func_path = MODEL_PARAMETERS[model_name]["fit_func_name"]
+    fit_func_path = params["fit_func_name"]
     module_name, func_name = fit_func_path.rsplit(".", 1)
 
     # dynamically import
@@ -108,12 +207,101 @@ def fit_model_any(df, model_name):
     logger.debug(f"Dynamically importing function {func_name} from module {module_name}")
     
     # call the fitting function
-    logger.debug(f"Calling {fit_func} for {model_name} with parameters: {MODEL_PARAMETERS[model_name]}")
-    model_fit = fit_func(df, **MODEL_PARAMETERS[model_name])
+    logger.debug(f"Calling {fit_func} for {model_name} with parameters: {params}")
+    if start_params is not None:
+        model_fit = fit_func(df, start_params=start_params, **params)
+    else:
+        model_fit = fit_func(df, **params)
     
     logger.debug(f"Model {model_name} fitted successfully: {model_fit}")
     return model_fit
 
+def process_context():
+    """
+    Multiprocessing context for fit and backtest processes that never forks the calling process.
+
+    Callers may have threads running (pipeline stages, the forecast writer, job heartbeats), and a fork
+    can copy a lock one of them holds (logging, requests, psycopg2) into the child, which then deadlocks.
+    Uses forkserver, with the modeling modules preloaded so starting a process stays cheap, where
+    available, and spawn otherwise (Windows).
+    """
+    if "forkserver" not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("spawn")
+    context = multiprocessing.get_context("forkserver")
+    context.set_forkserver_preload(["models.models_processing", "models.df_and_models_engine"])
+    return context
+
+def _fit_and_send(sender, df, model_name, params, start_params):
+    """
+    Subprocess target of fit_model_with_budget: fit and send (True, model) or (False, exception) back.
+    """
+    try:
+        sender.send((True, fit_model_any(df, model_name, params, start_params=start_params)))
+    except Exception as e:
+        sender.send((False, e))
+    finally:
+        sender.close()
+
+def fit_model_with_budget(df, model_name, params=None, start_params=None, budget=None):
+    """
+    fit_model_any bounded by a wall-clock budget.
+
+    With a budget the fit runs in its own process, which is terminated once the budget is spent,
+    so a stalled optimizer cannot hold up the caller. Without one the fit runs inline.
+
+    :param budget: seconds; defaults to params['fit_time_budget'] or FIT_TIME_BUDGET_SECONDS (None or 0: no budget).
+    :return: the fitted model.
+    :raises TimeoutError: if the fit did not finish within the budget.
+    """
+    params = params if params is not None else MODEL_PARAMETERS[model_name]
+    budget = budget if budget is not None else params.get("fit_time_budget", FIT_TIME_BUDGET_SECONDS)
+    if not budget:
+        return fit_model_any(df, model_name, params, start_params=start_params)
+
+    context = process_context()
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(
+        target=_fit_and_send, args=(sender, df, model_name, params, start_params), daemon=True
+    )
+    process.start()
+    sender.close()
+    try:
+        if not receiver.poll(budget):
+            raise TimeoutError(f"fit of {model_name} exceeded its budget of {budget}s")
+        ok, result = receiver.recv()
+    except EOFError:
+        raise RuntimeError(f"fit process of {model_name} died (exit code {process.exitcode})")
+    finally:
+        if process.is_alive():
+            process.terminate()
+        process.join()
+        receiver.close()
+
+    if not ok:
+        raise result
+    return result
+
+def fit_cache_key(df, params, start_params=None) -> str:
+    """
+    Result cache key of fitting df with params (see result_cache.fit_window_key).
+    """
+    return result_cache.fit_window_key(df["date"].iat[0], df["price"].to_numpy(), params, start_params)
+
+def fit_model_cached(df, model_name, params=None, start_params=None, budget=None):
+    """
+    fit_model_with_budget behind the fit result cache: a window fitted before with the same
+    history, parameters and fit code is loaded instead of refitted. Failed fits are not cached.
+    """
+    params = params if params is not None else MODEL_PARAMETERS[model_name]
+    key = fit_cache_key(df, params, start_params)
+    model_fit = result_cache.get_fit(key)
+    if model_fit is not None:
+        logger.debug(f"Fit of {model_name} loaded from the result cache ({key[:12]}).")
+        return model_fit
+    model_fit = fit_model_with_budget(df, model_name, params, start_params=start_params, budget=budget)
+    result_cache.put_fit(key, model_fit, keep_full=params.get("warm_start", False))
+    return model_fit
+
 #def retrain_in_hour_cycle(*, model_name, params, sub_df, current_dt, crypto_id, model_last_retrain):
 #    """
 #    Handle model retraining for a specific hour.
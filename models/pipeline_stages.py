@@ -0,0 +1,71 @@
+import queue
+import logging
+import threading
+#
+from config.config_system import PIPELINE_QUEUE_SIZE
+
+# initialize logger
+logger = logging.getLogger(__name__)
+
+# end-of-stage marker put after the last result
+_DONE = object()
+
+class _StageFailure:
+    def __init__(self, stage, error):
+        self.stage = stage
+        self.error = error
+
+def _put(out_queue, item, stop) -> bool:
+    # blocks while the next stage is behind, but gives up once the pipeline is stopped
+    while not stop.is_set():
+        try:
+            out_queue.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def start_stage(name, func, items, stop, maxsize=PIPELINE_QUEUE_SIZE) -> queue.Queue:
+    """
+    Run func over items in a background thread, one result per item, in order.
+
+    Results go to a bounded queue: once `maxsize` results wait for the next stage, this stage
+    blocks until one is taken (backpressure). An exception, also one raised while iterating
+    items (e.g. stage_results of a failed upstream stage), ends the stage and is passed on.
+
+    :param name: stage name (thread name and logs).
+    :param items: iterable consumed in the stage thread.
+    :param stop: threading.Event; once set, the stage ends without finishing its items.
+    :return: queue to read the results from with stage_results.
+    """
+    out_queue = queue.Queue(maxsize=maxsize)
+
+    def run():
+        try:
+            for item in items:
+                if not _put(out_queue, func(item), stop):
+                    return
+        except Exception as e:
+            logger.debug(f"Pipeline stage '{name}' failed: {e}")
+            _put(out_queue, _StageFailure(name, e), stop)
+            return
+        _put(out_queue, _DONE, stop)
+
+    threading.Thread(target=run, name=f"stage-{name}", daemon=True).start()
+    return out_queue
+
+def stage_results(out_queue, stop):
+    """
+    Yield the results of a stage until it is done; re-raise the exception it failed with.
+    Ends early once stop is set.
+    """
+    while not stop.is_set():
+        try:
+            item = out_queue.get(timeout=0.1)
+        except queue.Empty:
+            continue
+        if item is _DONE:
+            return
+        if isinstance(item, _StageFailure):
+            raise item.error
+        yield item
@@ -0,0 +1,127 @@
+import os
+import json
+import inspect
+import hashlib
+import logging
+import importlib
+import joblib
+import numpy as np
+from functools import lru_cache
+#
+from . import model_artifacts
+from config.config_system import RESULT_CACHE_ENABLED, RESULT_CACHE_DIRECTORY
+
+logger = logging.getLogger(__name__)
+# ---------------------------------------------------------
+# [Fit result cache]
+#   One file per fitted retrain window, named by the hash of everything the fit depends on:
+#    the training slice (first hour and prices), the fit-relevant model parameters, the optimizer
+#    start values of warm-started fits and the source code of the fit function's module.
+#   Rerunning a config over unchanged history loads its fits instead of refitting; windows whose
+#   history, parameters or fit code changed get a new key and are fitted again.
+#   A whole retrain window (its fit and the forecasts up to the next retrain) has a key as well
+#   (window_key); the engine skips windows whose key is recorded with their stored forecasts.
+# ---------------------------------------------------------
+# modules whose code shapes the forecasts of a fitted model
+FORECAST_MODULES = ("models.model_artifacts", "models.forecasting", "models.df_and_models_engine")
+
+@lru_cache(maxsize=None)
+def module_version(module_name: str) -> str:
+    """
+    Hash of the source of a module, so editing the code invalidates the results it produced.
+    """
+    source = inspect.getsource(importlib.import_module(module_name))
+    return hashlib.sha1(source.encode("utf-8")).hexdigest()
+
+def fit_function_version(fit_func_name: str) -> str:
+    """
+    Hash of the source of the module defining a fit function.
+    """
+    return module_version(fit_func_name.rsplit(".", 1)[0])
+
+def fit_window_key(first_dt, prices, params: dict, start_params=None) -> str:
+    """
+    Cache key of one fit.
+
+    :param first_dt: first hour of the training slice.
+    :param prices: prices of the training slice (rounded to the stored precision, see engine.normalize_hourly_grid).
+    :param params: model configuration (only 'fit_func_name' and 'specific_parameters' enter the key).
+    :param start_params: optimizer start values of a warm-started fit.
+    """
+    digest = hashlib.sha1()
+    digest.update(fit_function_version(params["fit_func_name"]).encode("utf-8"))
+    digest.update(json.dumps(
+        {"fit_func_name": params["fit_func_name"], "specific_parameters": params.get("specific_parameters", {})},
+        sort_keys=True, default=str,
+    ).encode("utf-8"))
+    digest.update(str(first_dt).encode("utf-8"))
+    digest.update(np.ascontiguousarray(prices, dtype=np.float64).tobytes())
+    if start_params is not None:
+        digest.update(np.ascontiguousarray(start_params, dtype=np.float64).tobytes())
+    return digest.hexdigest()
+
+def _entry_path(key: str) -> str:
+    return os.path.join(RESULT_CACHE_DIRECTORY, key[:2], f"{key}.joblib")
+
+def get_fit(key: str):
+    """
+    :return: the cached model of a fit key, or None on a miss (or if the cache is disabled).
+    """
+    if not RESULT_CACHE_ENABLED:
+        return None
+    path = _entry_path(key)
+    if not os.path.exists(path):
+        return None
+    try:
+        entry = joblib.load(path)
+    except Exception as e:
+        logger.warning(f"Unreadable result cache entry {key}, refitting: {e}")
+        return None
+    return model_artifacts.from_artifact(entry["artifact"]) if entry["slim"] else entry["model"]
+
+def put_fit(key: str, model_fit, keep_full: bool = False):
+    """
+    Store a fitted model under its fit key, as a slim artifact when it has one.
+
+    :param keep_full: store the full model even if it has a slim form (warm-started configs need its parameters).
+    """
+    if not RESULT_CACHE_ENABLED:
+        return
+    entry = {"slim": False, "model": model_fit}
+    if not keep_full:
+        try:
+            entry = {"slim": True, "artifact": model_artifacts.to_slim(model_fit).to_artifact()}
+        except TypeError:
+            pass
+
+    path = _entry_path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        joblib.dump(entry, tmp_path)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        logger.warning(f"Result cache entry {key} not stored: {e}")
+
+def window_key(first_dt, prices, members: dict, events, propagate_state: bool) -> str:
+    """
+    Key of one retrain window: the history it reads, the configs of the models sharing its fit,
+    its retrain and forecast times, and the fit and forecast code.
+
+    :param first_dt: first hour of the history read by the window.
+    :param prices: prices from first_dt up to the last event of the window.
+    :param members: model name -> params of the models sharing the fit.
+    :param events: events of the window (see backtest_schedule.build_shared_event_schedule).
+    :param propagate_state: forecasts start at their own hour (PROPAGATE_MODEL_STATE).
+    """
+    lead_params = next(iter(members.values()))
+    digest = hashlib.sha1()
+    for version in (fit_function_version(lead_params["fit_func_name"]), *map(module_version, FORECAST_MODULES)):
+        digest.update(version.encode("utf-8"))
+    digest.update(json.dumps(
+        {"members": members, "propagate_state": propagate_state, "events": [(str(event.dt), event.retrain, list(event.forecast_models)) for event in events]},
+        sort_keys=True, default=str,
+    ).encode("utf-8"))
+    digest.update(str(first_dt).encode("utf-8"))
+    digest.update(np.ascontiguousarray(prices, dtype=np.float64).tobytes())
+    return digest.hexdigest()
@@ -0,0 +1,308 @@
+import copy
+import itertools
+import logging
+import math
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+#
+import db.db_utils_postgres as db_utils_postgres
+from . import df_and_models_engine as engine
+from . import models_processing
+from .model_cache import model_config_signature
+from config.config_system import (
+    PG_DB_CONFIG, BACKTEST_WORKERS, FORECAST_BUFFER_ROWS,
+    SWEEP_HALVING_INITIAL_HOURS, SWEEP_HALVING_KEEP_FRACTION, SWEEP_HALVING_METRIC,
+)
+from config.config_metrics import EPSILON
+
+# initialize logger
+logger = logging.getLogger(__name__)
+# ---------------------------------------------------------
+# [Parameter grid]
+# ---------------------------------------------------------
+def sweep_model_name(model_name, params):
+    """
+    Distinct, short model name of one expanded config: '<model>_<first 8 chars of the config hash>'.
+    Keeps 'model' and 'model_name_ext' well within their column sizes for any number of grid axes.
+    """
+    return f"{model_name}_{model_config_signature(params)[:8]}"
+
+def expand_param_grid(model_params_dict, param_grid):
+    """
+    Expand the models of model_params_dict by the cartesian product of their grid values.
+
+    :param model_params_dict: Base model configurations keyed by model name (see config_models.MODEL_PARAMETERS).
+    :param param_grid: Model name -> {parameter: list of values} (see config_models.SWEEP_PARAMETER_GRID).
+                       Top-level parameter names replace the base value, other names are set in 'specific_parameters'.
+    :return: Dict of expanded configs keyed by their sweep model name. Models without a grid are kept as they are.
+    """
+    configs = {}
+    for model_name, base_params in model_params_dict.items():
+        grid = param_grid.get(model_name)
+        if not grid:
+            configs[model_name] = base_params
+            continue
+
+        keys = list(grid)
+        combinations = list(itertools.product(*(grid[key] for key in keys)))
+        for values in combinations:
+            params = copy.deepcopy(base_params)
+            for key, value in zip(keys, values):
+                if key in base_params and key != "specific_parameters":
+                    params[key] = value
+                else:
+                    params.setdefault("specific_parameters", {})[key] = value
+            configs[sweep_model_name(model_name, params)] = params
+
+        logger.info(f"Model {model_name} expanded into {len(combinations)} sweep configs.")
+
+    logger.info(f"Sweep of {len(configs)} configs in total.")
+    return configs
+# ---------------------------------------------------------
+# [Shared history]
+# ---------------------------------------------------------
+def share_history(grid_df):
+    """
+    Copy the prices of an hourly grid (see engine.normalize_hourly_grid) into a shared memory block.
+
+    :return: Tuple (shm, descriptor). The caller owns shm and unlinks it when the sweep is done;
+             the descriptor dict is what workers get to attach to it (see attach_history).
+    """
+    prices = grid_df["price"].to_numpy(dtype=np.float64)
+    shm = shared_memory.SharedMemory(create=True, size=max(prices.nbytes, 1))
+    np.ndarray(prices.shape, dtype=np.float64, buffer=shm.buf)[:] = prices
+    descriptor = {"name": shm.name, "start": grid_df["date"].iat[0], "length": len(prices)}
+    return shm, descriptor
+
+# per worker process: shared memory name -> (shm, grid_df), so each history is attached once per worker
+_attached_histories = {}
+
+def attach_history(descriptor):
+    """
+    Rebuild the hourly grid of a shared history inside a worker process (without copying the prices).
+    """
+    name = descriptor["name"]
+    if name not in _attached_histories:
+        shm = shared_memory.SharedMemory(name=name)
+        prices = np.ndarray((descriptor["length"],), dtype=np.float64, buffer=shm.buf)
+        prices.flags.writeable = False
+        dates = pd.date_range(descriptor["start"], periods=descriptor["length"], freq="h", name="date")
+        grid_df = pd.DataFrame({"date": dates, "price": pd.Series(prices, copy=False)}, copy=False)
+        _attached_histories[name] = (shm, grid_df)
+    return _attached_histories[name][1]
+# ---------------------------------------------------------
+# [Scoring and successive halving]
+# ---------------------------------------------------------
+class ScoringWriteBuffer(db_utils_postgres.ForecastWriteBuffer):
+    """
+    Forecast write buffer that also scores every buffered forecast against the realized prices of the
+    hourly grid. Per model it keeps the error sums [abs error, squared error, ape, count] of all realized
+    forecast steps (step 0, the last observed price, is not scored).
+    """
+    def __init__(self, conn, grid_df, max_rows=FORECAST_BUFFER_ROWS):
+        super().__init__(conn, max_rows)
+        self._prices = grid_df["price"].to_numpy()
+        self._start = grid_df["date"].iat[0].to_datetime64()
+        self.errors = {}
+
+    def add(self, frame):
+        positions = (frame["timestamp"].to_numpy() - self._start) // np.timedelta64(1, "h")
+        realized = (frame["forecast_step"].to_numpy() > 0) & (positions >= 0) & (positions < len(self._prices))
+        if realized.any():
+            actual = self._prices[positions[realized]]
+            error = frame["forecast_value"].to_numpy()[realized] - actual
+            sums = self.errors.setdefault(frame["model"].iat[0], np.zeros(4))
+            sums += (
+                np.abs(error).sum(),
+                np.square(error).sum(),
+                (np.abs(error) / (np.abs(actual) + EPSILON)).sum(),
+                realized.sum(),
+            )
+        super().add(frame)
+
+def score_errors(sums, metric=SWEEP_HALVING_METRIC):
+    """
+    Error metric ('mape', 'mae' or 'rmse', as in the ClickHouse metrics) from ScoringWriteBuffer error sums.
+    Configs without realized forecasts score inf.
+    """
+    abs_sum, squared_sum, ape_sum, count = sums
+    if not count:
+        return math.inf
+    return {
+        "mae": abs_sum / count,
+        "rmse": math.sqrt(squared_sum / count),
+        "mape": ape_sum / count,
+    }[metric]
+
+def halving_rungs(start_naive, finish_naive, initial_hours=SWEEP_HALVING_INITIAL_HOURS,
+                  keep_fraction=SWEEP_HALVING_KEEP_FRACTION):
+    """
+    Last hours of the successive halving rungs: start + initial_hours, growing by 1 / keep_fraction, up to finish.
+    """
+    rung_ends = []
+    hours = initial_hours
+    while start_naive + pd.Timedelta(hours=hours) < finish_naive:
+        rung_ends.append(start_naive + pd.Timedelta(hours=hours))
+        hours = max(math.ceil(hours / keep_fraction), hours + 1)
+    rung_ends.append(finish_naive)
+    return rung_ends
+
+def select_survivors(configs, totals, keep_fraction=SWEEP_HALVING_KEEP_FRACTION, metric=SWEEP_HALVING_METRIC):
+    """
+    Keep the best keep_fraction (at least one) of the configs by their error totals so far.
+
+    :return: Dict of the surviving configs in their original order.
+    """
+    scores = {name: score_errors(totals.get(name, (0, 0, 0, 0)), metric) for name in configs}
+    ranked = sorted(configs, key=scores.get)
+    keep = set(ranked[:max(1, math.ceil(len(ranked) * keep_fraction))])
+    logger.info(
+        f"Successive halving keeps {len(keep)} of {len(configs)} configs, best {ranked[0]} "
+        f"({metric}={scores[ranked[0]]:.6g})."
+    )
+    return {name: params for name, params in configs.items() if name in keep}
+# ---------------------------------------------------------
+# [Sweep workers]
+# ---------------------------------------------------------
+# per worker process Postgres connection (see init_sweep_worker)
+_worker_conn = None
+
+def init_sweep_worker(pg_config):
+    """
+    Pool initializer: one Postgres connection per worker process, reused by all its tasks.
+    """
+    global _worker_conn
+    _worker_conn = db_utils_postgres.postgres_connection(**pg_config)
+
+def run_sweep_task(descriptor, crypto_id, model_name, params, dependents, start_naive, finish_naive, resume_after=None,
+                   checkpoint=None):
+    """
+    Backtest one group of configs sharing a fit (see engine.group_models_by_fit) on a shared history.
+
+    :param resume_after: Last hour already processed by an earlier rung (see engine.restore_backtest_state).
+    :param checkpoint: Save and resume from checkpoints (see engine.run_model_backtest).
+    :return: Tuple (crypto_id, model_name, error sums per model name, see ScoringWriteBuffer).
+    """
+    grid_df = attach_history(descriptor)
+    model_last_retrain, model_last_forecast = engine.initialize_model_tracking([model_name, *dependents])
+    with ScoringWriteBuffer(_worker_conn, grid_df) as write_buffer:
+        engine.run_model_backtest(
+            crypto_id=crypto_id,
+            model_name=model_name,
+            params=params,
+            grid_df=grid_df,
+            start_naive=start_naive,
+            finish_naive=finish_naive,
+            conn=_worker_conn,
+            model_last_retrain=model_last_retrain,
+            model_last_forecast=model_last_forecast,
+            write_buffer=write_buffer,
+            dependents=dependents,
+            resume_after=resume_after,
+            checkpoint=checkpoint,
+            skip_unchanged=False,  # every forecast has to pass the scoring buffer
+        )
+    return crypto_id, model_name, write_buffer.errors
+
+def run_sweep(conn, model_params_dict, param_grid, start_date, finish_date, crypto_list,
+              workers=None, pg_config=None, halving=False) -> bool:
+    """
+    Backtest every config of a parameter grid for every currency on a process pool.
+
+    The history of every currency is fetched, loaded to Postgres and put on the hourly grid once, then
+    shared with the workers through shared memory. Expanded configs sharing a fit signature run as one
+    task, so a grid over forecasting settings only costs the fits of its distinct fit settings.
+
+    With halving, the backtests run in successive halving rungs (see halving_rungs): after every rung
+    the configs are ranked by the error of all their forecasts so far (see ScoringWriteBuffer), and only
+    the best continue, resuming where the rung stopped. Pruned configs keep their partial forecasts.
+    A rung only scores the forecasts it writes, so checkpoints left by earlier runs of the configs are
+    deleted first, and every rung ends with a checkpoint that the next rung resumes from.
+
+    :param conn: Active database connection (used for the historical data).
+    :param model_params_dict: Base model configurations keyed by model name.
+    :param param_grid: Model name -> {parameter: list of values} (see expand_param_grid).
+    :param start_date: Backtest start date.
+    :param finish_date: Backtest finish date or 'now'.
+    :param crypto_list: Cryptocurrency IDs.
+    :param workers: Worker processes. Defaults to BACKTEST_WORKERS.
+    :param pg_config: Postgres configuration for worker connections. Defaults to PG_DB_CONFIG updated from environment.
+    :param halving: Prune configs by successive halving (SWEEP_HALVING_* settings).
+    :return: True if all sweep tasks completed, False otherwise.
+    """
+    configs = expand_param_grid(model_params_dict, param_grid)
+    workers = workers or BACKTEST_WORKERS
+    pg_config = pg_config or db_utils_postgres.update_pg_config(PG_DB_CONFIG)
+
+    start_naive, finish_naive, total_hours, extended_start_dt, max_train_dataset_hours = (
+        engine.calculate_total_fetch_interval(start_date, finish_date, **configs)
+    )
+    engine.prefetch_missing_history(crypto_list, extended_start_dt, finish_naive)
+    rung_ends = halving_rungs(start_naive, finish_naive) if halving else [finish_naive]
+
+    shared = []
+    descriptors = {}
+    totals = {}  # config name -> error sums over all currencies and rungs
+    failed_configs = set()
+    failed = submitted = 0
+    logger.info(f"Sweeping {len(configs)} configs over {len(crypto_list)} currencies in {workers} worker processes"
+                f" ({len(rung_ends)} rungs).")
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_sweep_worker, initargs=(pg_config,),
+                                 mp_context=models_processing.process_context()) as executor:
+            for crypto_id in crypto_list:
+                extended_df = engine.fetch_extended_df(crypto_id, extended_start_dt, finish_naive, fetch_missing=False)
+                if extended_df is None or extended_df.empty:
+                    logger.error(f"No history for {crypto_id}, skipping it in the sweep.")
+                    continue
+                db_utils_postgres.load_to_db_train_and_historical(extended_df, crypto_id, conn, max_train_dataset_hours)
+                if halving and db_utils_postgres.delete_backtest_checkpoints(conn, crypto_id, configs):
+                    logger.info(f"Checkpoints of earlier {crypto_id} sweeps deleted, the halving rungs start from scratch.")
+
+                shm, descriptors[crypto_id] = share_history(engine.normalize_hourly_grid(extended_df))
+                shared.append(shm)
+
+            # halving rungs always save a checkpoint at their end, the next rung resumes from it
+            checkpoint = True if halving else None
+            resume_after = None
+            for rung, rung_end in enumerate(rung_ends):
+                if rung:
+                    configs = select_survivors(
+                        {name: params for name, params in configs.items() if name not in failed_configs}, totals
+                    )
+                futures = {}
+                for crypto_id, descriptor in descriptors.items():
+                    for model_name, params, dependents in engine.group_models_by_fit(configs):
+                        future = executor.submit(run_sweep_task, descriptor, crypto_id, model_name, params, dependents,
+                                                 start_naive, rung_end, resume_after, checkpoint)
+                        futures[future] = [model_name, *dependents]
+                submitted += len(futures)
+
+                for future in as_completed(futures):
+                    try:
+                        crypto_id, model_name, errors = future.result()
+                        for name, sums in errors.items():
+                            totals[name] = totals.get(name, 0) + sums
+                        logger.debug(f"Sweep task done: {crypto_id} - {model_name} until {rung_end}.")
+                    except Exception as e:
+                        failed += 1
+                        failed_configs.update(futures[future])
+                        logger.error(f"Sweep task failed: {e}", exc_info=True)
+                logger.info(f"Sweep rung until {rung_end} completed for {len(configs)} configs.")
+                resume_after = rung_end
+
+            ranked = sorted(configs, key=lambda name: score_errors(totals.get(name, (0, 0, 0, 0))))
+            logger.info(f"Best sweep configs by {SWEEP_HALVING_METRIC}: " + ", ".join(
+                f"{name}={score_errors(totals.get(name, (0, 0, 0, 0))):.6g}" for name in ranked[:5]
+            ))
+    finally:
+        for shm in shared:
+            shm.close()
+            shm.unlink()
+
+    if failed:
+        logger.error(f"{failed} of {submitted} sweep tasks failed.")
+        return False
+    return True
@@ -1,17 +1,26 @@
 import logging
+import time
+from uuid import uuid4
+from datetime import datetime, timezone, timedelta
 from dotenv import load_dotenv
 
 from db.db_utils_postgres import (
     prepare_postgres, update_pg_config, postgres_connection,
-    delete_mv_and_tables, refresh_materialized_view,
+    delete_mv_and_tables, refresh_materialized_view, refresh_backtest_delta,
 )
 from db.db_utils_clickhouse import (
     prepare_clickhouse, update_ch_config, clickhouse_connection,
     drop_clickhouse_database,
 )
-from db.pg_to_ch_pipeline import create_external_pg_table, create_ch_forecast_data_table, insert_from_external
+from db.pg_to_ch_pipeline import (
+    create_external_pg_table, create_external_pg_delta_table, create_ch_forecast_data_table,
+    insert_from_external, get_transfer_watermark, DELTA_EXTERNAL_TABLE,
+)
 from db.clickhouse_metrics import create_ch_metrics_tables, insert_ch_metrics
 from models.df_and_models_engine import fetch_predict_upload_ts
+from models.sweep import run_sweep
+from models.backtest_queue import run_worker, wait_for_backtest_jobs
+from config.config_system import LIVE_DELAY_SECONDS, BACKTEST_QUEUE
 
 logger = logging.getLogger(__name__)
 
@@ -26,10 +35,11 @@ def initialize_environment(pg_config: dict, ch_config: dict) -> bool:
         ch_cli = clickhouse_connection(ch_cfg)
 
         ext_ok = create_external_pg_table(ch_cli, ch_cfg, pg_cfg)
+        delta_ok = create_external_pg_delta_table(ch_cli, ch_cfg, pg_cfg)
         local_ok = create_ch_forecast_data_table(ch_cli, ch_cfg)
         metr_ok = create_ch_metrics_tables(ch_cli, ch_cfg)
 
-        return all([pg_ok, ch_ok, ext_ok, local_ok, metr_ok])
+        return all([pg_ok, ch_ok, ext_ok, delta_ok, local_ok, metr_ok])
     except Exception as e:
         logger.exception("initialize_environment failed")
         return False
@@ -70,10 +80,11 @@ def prepare_ch_tables(pg_config: dict, ch_config: dict) -> bool:
         pg_cfg = update_pg_config(pg_config)
 
         ext_ok = create_external_pg_table(ch_cli, ch_cfg, pg_cfg)
+        delta_ok = create_external_pg_delta_table(ch_cli, ch_cfg, pg_cfg)
         local_ok = create_ch_forecast_data_table(ch_cli, ch_cfg)
         metr_ok = create_ch_metrics_tables(ch_cli, ch_cfg)
 
-        return all([ext_ok, local_ok, metr_ok])
+        return all([ext_ok, delta_ok, local_ok, metr_ok])
     except Exception as e:
         logger.exception("prepare_ch_tables failed")
         return False
@@ -101,7 +112,12 @@ def run_full_cycle(pg_config: dict, ch_config: dict, model_params_dict: dict, st
         ch_cfg = update_ch_config(ch_config)
         ch_cli = clickhouse_connection(ch_cfg)
 
-        step1 = fetch_predict_upload_ts(pg_conn, model_params_dict, start_date, finish_date, crypto_list)
+        # with the job queue the backtests run in `main.py worker` processes; wait for them before the transfer
+        queue_batch = uuid4().hex if BACKTEST_QUEUE else None
+        step1 = fetch_predict_upload_ts(pg_conn, model_params_dict, start_date, finish_date, crypto_list, pg_config=pg_cfg,
+                                        queue_batch=queue_batch)
+        if step1 and queue_batch is not None:
+            step1 = wait_for_backtest_jobs(pg_conn, queue_batch)
         step2 = refresh_materialized_view(pg_conn)
         step3 = insert_from_external(ch_cli, ch_cfg)
         step4 = insert_ch_metrics(ch_cli, ch_cfg)
@@ -111,3 +127,86 @@ def run_full_cycle(pg_config: dict, ch_config: dict, model_params_dict: dict, st
     except Exception as e:
         logger.exception("run_full_cycle failed")
         return False
+
+def run_sweep_cycle(pg_config: dict, ch_config: dict, model_params_dict: dict, param_grid: dict, start_date, finish_date,
+                    crypto_list: dict, workers: int = None, halving: bool = False) -> bool:
+    try:
+        pg_cfg = update_pg_config(pg_config)
+        pg_conn = postgres_connection(**pg_cfg)
+
+        ch_cfg = update_ch_config(ch_config)
+        ch_cli = clickhouse_connection(ch_cfg)
+
+        step1 = run_sweep(pg_conn, model_params_dict, param_grid, start_date, finish_date, crypto_list,
+                          workers=workers, pg_config=pg_cfg, halving=halving)
+        step2 = refresh_materialized_view(pg_conn)
+        step3 = insert_from_external(ch_cli, ch_cfg)
+        step4 = insert_ch_metrics(ch_cli, ch_cfg)
+
+        logger.debug([step1, step2, step3, step4])
+        return all([step1, step2, step3, step4])
+    except Exception as e:
+        logger.exception("run_sweep_cycle failed")
+        return False
+
+def run_backtest_worker(pg_config: dict, fit_workers: int = 1, drain: bool = False) -> int:
+    """
+    Claim and run queued backtest jobs (see models.backtest_queue.run_worker).
+    """
+    load_dotenv(override=True)
+    pg_cfg = update_pg_config(pg_config)
+    return run_worker(pg_cfg, fit_workers=fit_workers, drain=drain)
+
+def last_closed_hour() -> datetime:
+    # an hourly bar is complete once the next hour has started
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    return now.replace(minute=0, second=0, microsecond=0) - timedelta(hours=1)
+
+def run_live_cycle(pg_config: dict, ch_config: dict, model_params_dict: dict, start_date, crypto_list: dict) -> bool:
+    """
+    Forecast the newly closed hours (see fetch_predict_upload_ts with incremental) and transfer only the rows
+    uploaded after the transfer watermark, through backtest_data_delta instead of the full materialized view.
+    The first cycle, with nothing transferred yet, refreshes and transfers the full view.
+    """
+    try:
+        pg_cfg = update_pg_config(pg_config)
+        pg_conn = postgres_connection(**pg_cfg)
+
+        ch_cfg = update_ch_config(ch_config)
+        ch_cli = clickhouse_connection(ch_cfg)
+
+        finish_date = last_closed_hour().isoformat()
+        logger.info(f"Live cycle up to {finish_date}.")
+
+        step1 = fetch_predict_upload_ts(pg_conn, model_params_dict, start_date, finish_date, crypto_list,
+                                        pg_config=pg_cfg, incremental=True)
+        since = get_transfer_watermark(ch_cli, ch_cfg)
+        if since is None:
+            step2 = refresh_materialized_view(pg_conn)
+            step3 = insert_from_external(ch_cli, ch_cfg)
+        else:
+            step2 = refresh_backtest_delta(pg_conn, since)
+            step3 = insert_from_external(ch_cli, ch_cfg, source_table=DELTA_EXTERNAL_TABLE) if step2 else False
+        step4 = insert_ch_metrics(ch_cli, ch_cfg)
+
+        logger.debug([step1, step2, step3, step4])
+        return all([step1, step2, step3, step4])
+    except Exception as e:
+        logger.exception("run_live_cycle failed")
+        return False
+
+def run_live(pg_config: dict, ch_config: dict, model_params_dict: dict, start_date, crypto_list: dict,
+             once: bool = False) -> bool:
+    """
+    Run live cycles: once (single-shot, e.g. from cron) or as a daemon, one cycle every hour
+    LIVE_DELAY_SECONDS after the full hour.
+    """
+    while True:
+        ok = run_live_cycle(pg_config, ch_config, model_params_dict, start_date, crypto_list)
+        if once:
+            return ok
+
+        next_run = last_closed_hour() + timedelta(hours=2, seconds=LIVE_DELAY_SECONDS)
+        sleep_seconds = (next_run - datetime.now(timezone.utc).replace(tzinfo=None)).total_seconds()
+        logger.info(f"Live cycle {'completed' if ok else 'failed'}, next one at {next_run} (UTC).")
+        time.sleep(max(sleep_seconds, 0))